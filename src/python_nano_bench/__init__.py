@@ -1,7 +1,45 @@
 #!/usr/bin/env python3
 """ base module """
 
-from .asm import *
-from .cpuid import *
-from .constraints import *
+import importlib
+from typing import TYPE_CHECKING
+
+# `elevate` is imported eagerly, the function shadows the submodule of the
+# same name, which is imported by `nano_bench` anyway.
 from .elevate import *
+
+# public name -> submodule which defines it. The submodules are only
+# imported once one of their names is accessed, e.g. `constraints` pulls in
+# `lark`.
+_LAZY = {
+    "Asm": "asm",
+    "EvalTransformer": "constraints",
+    "generate_assembly": "constraints",
+    "generate_assign": "constraints",
+    "generate_comparison": "constraints",
+    "get_type_size": "constraints",
+    "mov_size": "constraints",
+    "parse_constrains": "constraints",
+}
+
+if TYPE_CHECKING:
+    # the lazy names for type checkers and linters, `_LAZY` must match
+    from .asm import Asm
+    from .constraints import EvalTransformer, generate_assembly, \
+        generate_assign, generate_comparison, get_type_size, mov_size, \
+        parse_constrains
+
+__all__ = list(_LAZY) + ["Elevate", "elevate", "is_root", "run_as_root"]
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
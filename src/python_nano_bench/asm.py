@@ -4,7 +4,7 @@ assembly helper file, to check if a line of code has some properties, like:
     - memory access
 """
 
-from typing import List
+from typing import Dict, List, Tuple, Union
 import re
 
 
@@ -16,6 +16,31 @@ class Asm:
     __list_registers = ["rax", "rcx", "rdx"]
     __p = re.compile(r"\[.+\]")
 
+    # general purpose registers, each as (64, 32, 16, 8) bit name
+    __gpr = [("rax", "eax", "ax", "al"), ("rcx", "ecx", "cx", "cl"),
+             ("rdx", "edx", "dx", "dl"), ("rbx", "ebx", "bx", "bl"),
+             ("rsp", "esp", "sp", "spl"), ("rbp", "ebp", "bp", "bpl"),
+             ("rsi", "esi", "si", "sil"), ("rdi", "edi", "di", "dil")] + \
+        [(f"r{i}", f"r{i}d", f"r{i}w", f"r{i}b") for i in range(8, 16)]
+    # name -> (index, width index)
+    __gpr_names = {n: (i, w) for i, names in enumerate(__gpr)
+                   for w, n in enumerate(names)}
+    __vec = re.compile(r"([xyz]mm)(\d+)")
+    __reg = re.compile(r"([a-z0-9]+)(\s*\{.*\})?")
+
+    # registers used for the dependency chains. rax, rcx and rdx are used by
+    # `parse()`, rsp, rbp, r14 and r15 by nanoBench and xmm0 is an implicit
+    # operand (e.g. of `blendvps`). The last register of each pool is only
+    # read and never part of a chain.
+    __chain_registers = {"gpr": [3, 6, 7, 8, 9, 10, 11, 12, 13],
+                         "vec": list(range(1, 16))}
+    # implicit operands, which cannot be renamed if they are a source
+    __fixed_sources = {"cl", "xmm0"}
+
+    # instructions which are dependency breaking if all sources are equal
+    __zero_idioms = re.compile(r"v?(xor|sub|sbb|pxor|xorp[sd]|psub[bwdq]|"
+                               r"pcmpeq[bwdq]|pcmpgt[bwdq])")
+
     @staticmethod
     def generate_init_asm_string(used_registers: List[str]) -> str:
         """
@@ -37,15 +62,132 @@ class Asm:
         """
         free_registers = Asm.__list_registers
         used_registers = []
+        # equal memory operands share the same register
+        addresses = {}
         for i, line in enumerate(s):
             t = Asm.__p.search(line)
             if t:
-                if len(free_registers) == 0:
-                    raise ValueError("no free registers anymore")
-                r = free_registers[0]
-                used_registers.append(r)
-                free_registers = free_registers[1:]
+                r = addresses.get(t.group(0))
+                if r is None:
+                    if len(free_registers) == 0:
+                        raise ValueError("no free registers anymore")
+                    r = free_registers[0]
+                    used_registers.append(r)
+                    free_registers = free_registers[1:]
+                    addresses[t.group(0)] = r
                 new_line = re.sub(Asm.__p, "[" + r + "]", line)
                 s[i] = new_line
 
         return s, Asm.generate_init_asm_string(used_registers)
+
+    @staticmethod
+    def split_instruction(instr: str) -> Tuple[str, List[str]]:
+        """
+        :param instr: a single instruction, e.g. `add rax, rbx`
+        :return (mnemonic, operands)
+        """
+        instr = instr.strip().rstrip(";").strip()
+        parts = instr.split(None, 1)
+        if len(parts) < 2:
+            return instr, []
+        return parts[0], [o.strip() for o in parts[1].split(",")]
+
+    @staticmethod
+    def register(operand: str) -> Union[Tuple[str, int, str], None]:
+        """
+        :param operand: a single operand
+        :return (class, index, width) if `operand` is a renameable register,
+            e.g. ("gpr", 3, 0) for `rbx` or ("vec", 1, "ymm") for `ymm1`,
+            None for memory operands, immediates and other registers.
+        """
+        m = Asm.__reg.fullmatch(operand.strip().lower())
+        if not m:
+            return None
+        name = m.group(1)
+        if name in Asm.__gpr_names:
+            i, w = Asm.__gpr_names[name]
+            return "gpr", i, w
+        v = Asm.__vec.fullmatch(name)
+        if v:
+            return "vec", int(v.group(2)), v.group(1)
+        return None
+
+    @staticmethod
+    def rename(operand: str, index: int) -> str:
+        """
+        :param operand: a renameable register, see `register()`
+        :param index: the number of the new register
+        :return `operand` with the register replaced by register `index` of
+            the same class and width.
+        """
+        cls, _, width = Asm.register(operand)
+        m = Asm.__reg.fullmatch(operand.strip().lower())
+        if cls == "gpr":
+            name = Asm.__gpr[index][width]
+        else:
+            name = f"{width}{index}"
+        return name + (m.group(2) or "")
+
+    @staticmethod
+    def _chain(instr: str, chain: Dict[str, int]) -> str:
+        """
+        rewrites `instr` such that its destination and its first source of
+        the same class as the destination are the chain register.
+        :param instr: a single instruction
+        :param chain: register class -> index of the chain register
+        :return the rewritten instruction
+        """
+        mnemonic, ops = Asm.split_instruction(instr)
+        regs = [Asm.register(o) for o in ops]
+        if not ops or regs[0] is None:
+            return instr
+
+        dst = regs[0][0]
+        zero_idiom = Asm.__zero_idioms.fullmatch(mnemonic.lower())
+        new = []
+        for i, (op, reg) in enumerate(zip(ops, regs)):
+            # e.g. the shift count of `shl rax, cl` cannot be renamed
+            if reg is None or (i > 0 and
+                               op.strip().lower() in Asm.__fixed_sources):
+                new.append(op)
+                continue
+            pool = Asm.__chain_registers[reg[0]]
+            # with equal sources a zero idiom does not depend on its input,
+            # so all further sources read a register no chain writes
+            if reg[0] == dst and (not zero_idiom or i == 0 or
+                                  (i == 1 and len(ops) > 2)):
+                new.append(Asm.rename(op, chain.get(reg[0], pool[0])))
+            else:
+                new.append(Asm.rename(op, pool[-1]))
+        return f"{mnemonic} {', '.join(new)}"
+
+    @staticmethod
+    def latency(instr: str) -> str:
+        """
+        :param instr: a single instruction, e.g. `add rax, rbx`
+        :return the instruction rewritten such that each instance depends
+            on the previous one, e.g. `add rbx, rbx`. Unrolled it forms a
+            single dependency chain.
+        """
+        return Asm._chain(instr, {})
+
+    @staticmethod
+    def throughput(instr: str, chains: int = 8) -> Tuple[str, int]:
+        """
+        :param instr: a single instruction, e.g. `add rax, rbx`
+        :param chains: number of independent dependency chains
+        :return (`chains` copies of `instr` with distinct registers, the
+            number of copies). The number of copies is limited by the
+            available registers.
+        """
+        _, ops = Asm.split_instruction(instr)
+        classes = {r[0] for r in map(Asm.register, ops) if r is not None}
+        for cls in classes:
+            chains = min(chains, len(Asm.__chain_registers[cls]) - 1)
+        chains = max(chains, 1)
+
+        ret = []
+        for i in range(chains):
+            chain = {c: Asm.__chain_registers[c][i] for c in classes}
+            ret.append(Asm._chain(instr, chain))
+        return "; ".join(ret), chains
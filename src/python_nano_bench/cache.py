@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+persistent cache of benchmark results
+"""
+
+import hashlib
+import json
+import os
+import platform
+import re
+import sqlite3
+import tempfile
+import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Tuple, Union
+
+from .cpuid.cpuid import cpu_vendor, cpuid_table, version_info
+from .result import BenchResult
+
+
+def cache_dir() -> str:
+    """
+    :return the directory for all caches of this package, it is created if
+        it does not exist.
+    """
+    base = os.environ.get("XDG_CACHE_HOME",
+                          os.path.join(os.path.expanduser("~"), ".cache"))
+    path = os.path.join(base, "python_nano_bench")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _microcode() -> str:
+    """
+    :return the microcode revision of the first cpu, or an empty string
+    """
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("microcode"):
+                    return line.split(":")[1].strip()
+    except OSError:
+        pass
+    return ""
+
+
+@lru_cache(maxsize=None)
+def machine_fingerprint() -> str:
+    """
+    :return a string identifying the cpu (vendor, family, model, stepping,
+        microcode revision) and the kernel release of this machine.
+    """
+    cpu = cpuid_table()
+    vi = version_info(cpu)
+    return "|".join([cpu_vendor(cpu), f"{vi.displ_family:x}",
+                     f"{vi.displ_model:x}", f"{vi.stepping:x}",
+                     _microcode(), platform.release()])
+
+
+def normalize_asm(asm: str) -> str:
+    """
+    :param asm: assembly string
+    :return `asm` with all insignificant whitespace and empty statements
+        removed.
+    """
+    lines = (re.sub(r"\s+", " ", a).strip() for a in asm.split(";"))
+    return ";".join(a for a in lines if a)
+
+
+class ResultCache:
+    """
+    sqlite backed cache mapping a benchmark (code, init code, options,
+    config and machine) to its result.
+    """
+
+    # `put()` calls between two evictions
+    EVICT_INTERVAL = 1000
+
+    def __init__(self, path: Union[str, None] = None,
+                 max_entries: Union[int, None] = 1000000,
+                 max_age: Union[float, None] = None,
+                 fingerprint: Union[str, None] = None):
+        """
+        :param path: the database file. Defaults to `results.sqlite` in the
+            user cache dir.
+        :param max_entries: if not None, the least recently used entries are
+            evicted above this number of entries.
+        :param max_age: if not None, entries older than this many seconds
+            are evicted.
+        :param fingerprint: identifies the machine, see
+            `machine_fingerprint()`.
+        """
+        if path is None:
+            path = os.path.join(cache_dir(), "results.sqlite")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._fingerprint = fingerprint
+
+        self._db: Union[sqlite3.Connection, None] = None
+        self._pid = -1
+        self._puts = 0
+        # (config path, mtime) -> content
+        self._configs: Dict[Tuple[str, float], bytes] = {}
+        self.evict()
+
+    def __getstate__(self):
+        # the connection cannot be shared with other processes
+        state = self.__dict__.copy()
+        state["_db"] = None
+        return state
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """ :return the database connection of the current process """
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=60)
+            self._pid = os.getpid()
+            self._db.execute("CREATE TABLE IF NOT EXISTS results ("
+                             "key TEXT PRIMARY KEY, names TEXT, "
+                             "vals BLOB, created REAL, accessed REAL, "
+                             "rounds INTEGER DEFAULT 1)")
+            # tables of older versions lack the number of rounds
+            columns = [row[1] for row in
+                       self._db.execute("PRAGMA table_info(results)")]
+            if "rounds" not in columns:
+                with self._db:
+                    self._db.execute("ALTER TABLE results ADD COLUMN "
+                                     "rounds INTEGER DEFAULT 1")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed "
+                             "ON results(accessed)")
+        return self._db
+
+    @property
+    def fingerprint(self) -> str:
+        """ :return the machine fingerprint """
+        if self._fingerprint is None:
+            self._fingerprint = machine_fingerprint()
+        return self._fingerprint
+
+    def context(self, options, config: Union[str, None] = None) -> str:
+        """
+        computes the part of the key which is shared by all benchmarks with
+        the same options. Compute it once per batch.
+        :param options: anything json serializable describing the options
+        :param config: path to the nanoBench config file
+        :return the context digest
+        """
+        h = hashlib.sha256()
+        h.update(self.fingerprint.encode())
+        h.update(json.dumps(options, sort_keys=True).encode())
+        if config is not None and os.path.exists(config):
+            k = (config, os.path.getmtime(config))
+            if k not in self._configs:
+                with open(config, 'rb') as f:
+                    self._configs[k] = f.read()
+            h.update(self._configs[k])
+        return h.hexdigest()
+
+    @staticmethod
+    def key(asm: str, init_asm: str, context: str) -> str:
+        """
+        :param asm: the benchmark code
+        :param init_asm: the init code
+        :param context: see `context()`
+        :return the cache key of the benchmark
+        """
+        h = hashlib.sha256()
+        for s in (context, normalize_asm(asm), normalize_asm(init_asm)):
+            h.update(s.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key: str) -> Union[BenchResult, None]:
+        """
+        :param key: see `key()`
+        :return the cached result or None
+        """
+        row = self.db.execute("SELECT names, vals, created, rounds "
+                              "FROM results WHERE key = ?",
+                              (key,)).fetchone()
+        if row is None:
+            return None
+
+        now = time.time()
+        if self.max_age is not None and now - row[2] > self.max_age:
+            return None
+
+        with self.db:
+            self.db.execute("UPDATE results SET accessed = ? WHERE key = ?",
+                            (now, key))
+        values = array('d')
+        values.frombytes(row[1])
+        names = row[0].split("\n") if row[0] else []
+        return BenchResult(names, values, row[3])
+
+    def put(self, key: str, result: BenchResult):
+        """
+        :param key: see `key()`
+        :param result: the result to store
+        """
+        now = time.time()
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO results "
+                            "(key, names, vals, created, accessed, rounds) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, "\n".join(result.names),
+                             result.values.tobytes(), now, now,
+                             result.rounds))
+        self._puts += 1
+        if self._puts % ResultCache.EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        """ removes expired and least recently used entries """
+        with self.db:
+            if self.max_age is not None:
+                self.db.execute("DELETE FROM results WHERE created < ?",
+                                (time.time() - self.max_age,))
+            if self.max_entries is not None:
+                self.db.execute("DELETE FROM results WHERE key IN ("
+                                "SELECT key FROM results "
+                                "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                                (self.max_entries,))
+
+    def clear(self):
+        """ removes all entries """
+        with self.db:
+            self.db.execute("DELETE FROM results")
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+class BinaryCache:
+    """
+    content addressed store mapping assembly code to its machine code. A
+    small in memory LRU is kept in front of a directory on disk.
+    """
+
+    # `put()` calls between two evictions, the first `put()` of a process
+    # evicts as well
+    EVICT_INTERVAL = 1000
+
+    def __init__(self, path: Union[str, None] = None,
+                 max_memory_entries: int = 4096,
+                 max_entries: Union[int, None] = 100000,
+                 max_age: Union[float, None] = None):
+        """
+        :param path: the directory of the store. Defaults to `binaries` in
+            the user cache dir.
+        :param max_memory_entries: size of the in memory LRU
+        :param max_entries: if not None, the least recently used files are
+            evicted above this number of files.
+        :param max_age: if not None, files not used for this many seconds
+            are evicted.
+        """
+        if path is None:
+            path = os.path.join(cache_dir(), "binaries")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lru: "OrderedDict[str, bytes]" = OrderedDict()
+        self._puts = 0
+
+    @staticmethod
+    def key(code: str) -> str:
+        """
+        :param code: the assembly code exactly as it is passed to `as`
+        :return the content address of `code`
+        """
+        return hashlib.sha256(code.encode()).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def _remember(self, key: str, data: bytes):
+        self._lru[key] = data
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.max_memory_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, code: str) -> Union[bytes, None]:
+        """
+        :param code: the assembly code
+        :return the machine code of `code` or None if it is not cached
+        """
+        key = BinaryCache.key(code)
+        data = self._lru.get(key)
+        if data is not None:
+            self._lru.move_to_end(key)
+            return data
+
+        try:
+            with open(self._file(key), 'rb') as f:
+                data = f.read()
+            # the modification time is the last use, see `evict()`
+            os.utime(self._file(key))
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, code: str, data: bytes):
+        """
+        :param code: the assembly code
+        :param data: the machine code of `code`
+        """
+        key = BinaryCache.key(code)
+        self._remember(key, data)
+
+        # write atomically, other processes may read the same entry
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        self._puts += 1
+        if self._puts % BinaryCache.EVICT_INTERVAL == 1:
+            self.evict()
+
+    def evict(self):
+        """ removes expired and least recently used files from the disk """
+        files = []
+        for entry in os.scandir(self.path):
+            if not entry.is_dir():
+                continue
+            for f in os.scandir(entry.path):
+                try:
+                    files.append((f.stat().st_mtime, f.path))
+                except OSError:
+                    # removed by another process
+                    pass
+        files.sort(reverse=True)
+
+        keep = len(files)
+        if self.max_entries is not None:
+            keep = min(keep, self.max_entries)
+        if self.max_age is not None:
+            now = time.time()
+            keep = min(keep, sum(1 for t, _ in files
+                                 if now - t <= self.max_age))
+        for _, path in files[keep:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# process wide store used by `NanoBench`, created on first use
+_binary_cache: Union[BinaryCache, None] = None
+
+
+def binary_cache() -> BinaryCache:
+    """
+    :return the process wide store of assembled code
+    """
+    global _binary_cache
+    if _binary_cache is None:
+        _binary_cache = BinaryCache()
+    return _binary_cache
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+parsing, subsetting and writing of nanoBench config files. A config line has
+the form
+
+    EvtSel.UMASK[.CMSK=x][.AnyT][.EDG][.INV][.CTR=x][.MSR_x=y] Name
+"""
+
+import fnmatch
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Tuple, Union
+
+from .cache import cache_dir
+from .cpuid.cpuid import cpu_vendor, cpuid_table, get_bit, get_bits
+
+# events which are measured by the fixed function counters. They never need
+# a programmable counter.
+FIXED_EVENTS = ["Core cycles", "Instructions retired", "Reference cycles"]
+
+# used if the number of programmable counters is unknown
+DEFAULT_COUNTERS = 4
+
+
+class Event(NamedTuple):
+    """ a single line of a config file """
+    # the first column, e.g. `0E.01.CMSK=1`
+    spec: str
+    name: str
+    # the programmable counters this event can be measured on, None if any
+    counters: Union[FrozenSet[int], None]
+    # MSR name -> value, which must be set while measuring this event
+    msrs: Dict[str, str]
+    # if true, no other event may be measured at the same time
+    alone: bool
+
+    def line(self) -> str:
+        """ :return the event as config line """
+        return f"{self.spec} {self.name}"
+
+    @property
+    def code(self) -> Tuple[int, int]:
+        """ :return (event select, umask) """
+        fields = self.spec.split(".")
+        return int(fields[0], 16), int(fields[1], 16)
+
+
+def parse_event(line: str) -> Union[Event, None]:
+    """
+    :param line: a single line of a config file
+    :return the event or None if the line is empty or a comment
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+
+    spec, _, name = line.partition(" ")
+    counters = None
+    msrs = {}
+    alone = False
+    for field in spec.split(".")[2:]:
+        key, _, value = field.partition("=")
+        if key == "CTR":
+            counters = frozenset(int(c) for c in value.split(","))
+        elif key.startswith("MSR_"):
+            msrs[key] = value
+        elif key == "TakenAlone":
+            alone = True
+    return Event(spec, name.strip(), counters, msrs, alone)
+
+
+def read_config(path: str) -> List[Event]:
+    """
+    :param path: path to a nanoBench config file
+    :return all events of the file in the order of the file
+    """
+    ret = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            event = parse_event(line)
+            if event is not None:
+                ret.append(event)
+    return ret
+
+
+def select_events(events: List[Event], patterns: Iterable[str]) -> List[Event]:
+    """
+    :param events: all events supported by the cpu, see `read_config()`
+    :param patterns: event names or shell style patterns, e.g.
+        `UOPS_DISPATCHED_PORT.PORT_*`
+    :return every event matched by at least one pattern in the order of the
+        patterns. Raises `ValueError` if a pattern matches no event.
+    """
+    ret = []
+    seen = set()
+    for pattern in patterns:
+        found = False
+        for event in events:
+            if fnmatch.fnmatchcase(event.name, pattern):
+                found = True
+                if event.name not in seen:
+                    seen.add(event.name)
+                    ret.append(event)
+
+        # the fixed counters are always measured and are not in the config
+        if not found and not fnmatch.filter(FIXED_EVENTS, pattern):
+            raise ValueError(f"unknown event: {pattern}")
+    return ret
+
+
+# matches the events counting the uops of a single execution port
+PORT_EVENT_RE = re.compile(r"\.PORT_\d")
+# matches the events of the cache hierarchy
+CACHE_EVENT_RE = re.compile(r"L1D|L2|L3|LLC|MEM_LOAD|CACHE|OFFCORE")
+
+
+class ConfigIndex:
+    """
+    all events of a config file, indexed by name, by (event select, umask)
+    and by the counters they are restricted to.
+    """
+
+    def __init__(self, events: List[Event]):
+        """
+        :param events: see `read_config()`
+        """
+        self.events = events
+        self.by_name: Dict[str, Event] = {}
+        self.by_code: Dict[Tuple[int, int], List[Event]] = {}
+        # counter -> events which can only be measured on a subset of
+        # counters including this one
+        self.by_counter: Dict[int, List[Event]] = {}
+        for event in events:
+            self.by_name.setdefault(event.name, event)
+            self.by_code.setdefault(event.code, []).append(event)
+            for counter in event.counters or ():
+                self.by_counter.setdefault(counter, []).append(event)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.by_name
+
+    def __getitem__(self, name: str) -> Event:
+        return self.by_name[name]
+
+    def match(self, regex: Union[str, re.Pattern]) -> List[Event]:
+        """
+        :param regex: regular expression searched in the event names
+        :return all matching events in the order of the config file
+        """
+        if isinstance(regex, str):
+            regex = re.compile(regex)
+        return [e for e in self.events if regex.search(e.name)]
+
+    def port_events(self) -> List[Event]:
+        """ :return all events counting the uops of an execution port """
+        return self.match(PORT_EVENT_RE)
+
+    def cache_events(self) -> List[Event]:
+        """ :return all events of the cache hierarchy """
+        return self.match(CACHE_EVENT_RE)
+
+    def constrained(self) -> List[Event]:
+        """ :return all events which can only use some of the counters """
+        return [e for e in self.events if e.counters is not None]
+
+    def unknown(self, patterns: Iterable[str]) -> List[str]:
+        """
+        :param patterns: see `select_events()`
+        :return all patterns which match no event
+        """
+        names = list(self.by_name) + FIXED_EVENTS
+        return [p for p in patterns if not fnmatch.filter(names, p)]
+
+    def select(self, patterns: Iterable[str]) -> List[Event]:
+        """ see `select_events()` """
+        return select_events(self.events, patterns)
+
+
+# path -> (mtime, size, index)
+_indexes: Dict[str, Tuple[int, int, ConfigIndex]] = {}
+
+
+def load_config(path: str, use_cache: bool = True) -> ConfigIndex:
+    """
+    parses a config file only once. The parsed events are kept in memory
+    and pickled into the user cache dir, both are invalidated if the
+    modification time or size of the file changes.
+    :param path: path to a nanoBench config file
+    :param use_cache: if false, the pickled cache is neither read nor
+        written.
+    :return the index of the config file
+    """
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    entry = _indexes.get(path)
+    if entry is not None and entry[:2] == stamp:
+        return entry[2]
+
+    events = None
+    cache_file = ""
+    if use_cache:
+        key = hashlib.sha256(path.encode()).hexdigest()
+        cache_file = os.path.join(cache_dir(), "configs", key + ".pickle")
+        try:
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+            if cached[:2] == stamp:
+                events = cached[2]
+        except (OSError, pickle.UnpicklingError, EOFError, IndexError,
+                AttributeError):
+            pass
+
+    if events is None:
+        events = read_config(path)
+        if use_cache:
+            # written atomically, other processes may read it
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((stamp[0], stamp[1], events), f)
+            os.replace(tmp, cache_file)
+
+    index = ConfigIndex(events)
+    _indexes[path] = (stamp[0], stamp[1], index)
+    return index
+
+
+def programmable_counters(cpu=None) -> int:
+    """
+    :param cpu: the `CPUID` instance or table to query, defaults to
+        `cpuid_table()`
+    :return the number of general purpose counters per logical cpu
+    """
+    if cpu is None:
+        cpu = cpuid_table()
+
+    vendor = cpu_vendor(cpu)
+    if vendor == "GenuineIntel":
+        if cpu(0)[0] >= 0xA:
+            n = get_bits(cpu(0xA)[0], 8, 15)
+            if n > 0:
+                return n
+    elif vendor == "AuthenticAMD":
+        # PerfCtrExtCore
+        if cpu(0x80000000)[0] >= 0x80000001 and \
+                get_bit(cpu(0x80000001)[2], 23):
+            return 6
+    return DEFAULT_COUNTERS
+
+
+def _assign(group: List[Event], event: Event, n_counters: int) -> bool:
+    """
+    :return true if `event` and all events in `group` can be placed on
+        distinct counters at once.
+    """
+    events = sorted(group + [event], key=lambda e: len(e.counters)
+                    if e.counters is not None else n_counters)
+    used = set()
+
+    def place(i: int) -> bool:
+        if i == len(events):
+            return True
+        counters = events[i].counters
+        for c in (counters if counters is not None else range(n_counters)):
+            if c < n_counters and c not in used:
+                used.add(c)
+                if place(i + 1):
+                    return True
+                used.remove(c)
+        return False
+
+    return place(0)
+
+
+def _fits(group: List[Event], event: Event, n_counters: int) -> bool:
+    """
+    :return true if `event` can be measured together with `group`
+    """
+    if len(group) >= n_counters or event.alone or \
+            any(e.alone for e in group):
+        return False
+    for e in group:
+        for msr, value in event.msrs.items():
+            if e.msrs.get(msr, value) != value:
+                return False
+    return _assign(group, event, n_counters)
+
+
+def schedule(events: List[Event], n_counters: int) -> List[List[Event]]:
+    """
+    packs `events` into as few groups as possible, such that each group can
+    be measured in a single pass.
+    :param events: the events to measure
+    :param n_counters: number of programmable counters, see
+        `programmable_counters()`
+    :return the groups
+    """
+    # the most constrained events are placed first
+    def tightness(e: Event):
+        n = len(e.counters) if e.counters is not None else n_counters
+        return (not e.alone, n, -len(e.msrs))
+
+    groups: List[List[Event]] = []
+    for event in sorted(events, key=tightness):
+        for group in groups:
+            if _fits(group, event, n_counters):
+                group.append(event)
+                break
+        else:
+            groups.append([event])
+    return groups
+
+
+def write_config(path: str, group: List[Event]):
+    """
+    writes the config of a single pass. nanoBench splits a config into
+    chunks of as many events as there are programmable counters, so a
+    group smaller than that would shift the boundaries of all later
+    groups. Each group of `schedule()` gets its own file instead.
+    :param path: the config file to write
+    :param group: one group of `schedule()`
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for event in group:
+            f.write(event.line() + "\n")
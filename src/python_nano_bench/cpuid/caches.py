@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+typed model of the cache hierarchy, decoded from the deterministic cache
+parameters (cpuid leaf 4, on AMD leaf 0x8000001D) or, on older AMD cpus,
+from the legacy leaves via `get_cache_info()`.
+"""
+
+from typing import Iterator, List, NamedTuple, Tuple, Union
+
+from .cpuid import cpu_vendor, cpuid_table, get_bit, get_bits, \
+    get_cache_info
+
+_KINDS = {1: "data", 2: "instruction", 3: "unified"}
+
+
+class CacheLevel(NamedTuple):
+    """ a single cache """
+    # e.g. `L1D` or `L2`, see `get_cache_info()`
+    name: str
+    level: int
+    # `data`, `instruction` or `unified`
+    kind: str
+    # in bytes
+    size: int
+    line_size: int
+    sets: int
+    ways: int
+    # maximum number of logical cpus sharing this cache, 0 if unknown
+    sharing: int
+    # true if the cache is inclusive of the lower levels
+    inclusive: bool
+    # true if a complex function of the address selects the set
+    complex: bool
+
+
+def _decode(cpu, leaf: int) -> List[CacheLevel]:
+    """
+    :param cpu: `CPUID` instance or table
+    :param leaf: 0x4 or 0x8000001D, both use the same format
+    :return all caches enumerated by `leaf`
+    """
+    ret = []
+    for subleaf in range(64):
+        a, b, c, d = cpu(leaf, subleaf)
+        kind = _KINDS.get(get_bits(a, 0, 4))
+        if kind is None:
+            break
+        level = get_bits(a, 5, 7)
+        line_size = get_bits(b, 0, 11) + 1
+        partitions = get_bits(b, 12, 21) + 1
+        ways = get_bits(b, 22, 31) + 1
+        sets = c + 1
+        name = f"L{level}" + {"data": "D", "instruction": "I"}.get(kind, "")
+        ret.append(CacheLevel(name, level, kind,
+                              ways * partitions * line_size * sets,
+                              line_size, sets, ways,
+                              get_bits(a, 14, 25) + 1,
+                              bool(get_bit(d, 1)), bool(get_bit(d, 2))))
+    return ret
+
+
+def _legacy(cpu) -> List[CacheLevel]:
+    """
+    :param cpu: `CPUID` instance or table
+    :return the caches reported by `get_cache_info()`
+    """
+    ret = []
+    for name, info in get_cache_info(cpu).items():
+        if not info.get("assoc") or not info.get("nSets"):
+            continue
+        kind = {"D": "data", "I": "instruction"}.get(name[-1], "unified")
+        size = info["lineSize"] * info["nSets"] * info["assoc"]
+        ret.append(CacheLevel(name, int(name[1]), kind, size,
+                              info["lineSize"], info["nSets"], info["assoc"],
+                              0, False, info.get("complex", False)))
+    return ret
+
+
+class CacheHierarchy:
+    """
+    all caches of a logical cpu, ordered by level (data before instruction).
+    """
+
+    def __init__(self, levels):
+        """
+        :param levels: iterable of `CacheLevel`
+        """
+        order = {"data": 0, "unified": 0, "instruction": 1}
+        self.levels: Tuple[CacheLevel, ...] = tuple(sorted(
+            levels, key=lambda c: (c.level, order[c.kind])))
+
+    def __getitem__(self, name: str) -> CacheLevel:
+        """
+        :param name: e.g. `L1D`
+        """
+        for c in self.levels:
+            if c.name == name:
+                return c
+        raise KeyError(name)
+
+    def __contains__(self, name: str) -> bool:
+        return any(c.name == name for c in self.levels)
+
+    def __iter__(self) -> Iterator[CacheLevel]:
+        return iter(self.levels)
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CacheHierarchy) and \
+            self.levels == other.levels
+
+    def __hash__(self) -> int:
+        return hash(self.levels)
+
+    def __reduce__(self):
+        return CacheHierarchy, (self.levels,)
+
+    def __repr__(self) -> str:
+        return "CacheHierarchy(" + ", ".join(
+            f"{c.name}={c.size // 1024}K" for c in self.levels) + ")"
+
+    def data(self) -> List[CacheLevel]:
+        """ :return all caches holding data, from the lowest level """
+        return [c for c in self.levels if c.kind != "instruction"]
+
+    def line_size(self) -> int:
+        """ :return the line size of the first level data cache """
+        data = self.data()
+        return data[0].line_size if data else 64
+
+
+def decode_caches(cpu) -> CacheHierarchy:
+    """
+    :param cpu: `CPUID` instance or table
+    :return the cache hierarchy reported by `cpu`
+    """
+    max_leaf = cpu(0)[0]
+    levels: List[CacheLevel] = []
+    if cpu_vendor(cpu) == "AuthenticAMD":
+        # TopologyExtensions
+        if cpu(0x80000000)[0] >= 0x8000001D and \
+                get_bit(cpu(0x80000001)[2], 22):
+            levels = _decode(cpu, 0x8000001D)
+    elif max_leaf >= 0x4:
+        levels = _decode(cpu, 0x4)
+    if not levels:
+        levels = _legacy(cpu)
+    return CacheHierarchy(levels)
+
+
+# the hierarchy of the current cpu, decoded on first use
+_cache_hierarchy: Union[CacheHierarchy, None] = None
+
+
+def cache_hierarchy() -> CacheHierarchy:
+    """
+    :return the process wide cache hierarchy, decoded from `cpuid_table()`
+    """
+    global _cache_hierarchy
+    if _cache_hierarchy is None:
+        _cache_hierarchy = decode_caches(cpuid_table())
+    return _cache_hierarchy
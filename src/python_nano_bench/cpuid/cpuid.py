@@ -18,6 +18,7 @@
 
 import collections
 import ctypes
+import json
 import logging
 import os
 import platform
@@ -30,6 +31,7 @@ from ctypes import (
     c_long,
     c_size_t,
     c_uint32,
+    c_uint64,
     c_ulong,
     c_void_p,
 )
@@ -134,6 +136,36 @@ _CDECL_32_OPC = [
     0xC3,  # ret
 ]
 
+# xgetbv reads the extended control register selected by ecx into edx:eax
+_XGETBV_POSIX_64_OPC = [
+    0x89,
+    0xF9,  # mov    %edi,%ecx
+    0x0F,
+    0x01,
+    0xD0,  # xgetbv
+    0x48,
+    0xC1,
+    0xE2,
+    0x20,  # shl    $0x20,%rdx
+    0x48,
+    0x09,
+    0xD0,  # or     %rdx,%rax
+    0xC3,  # retq
+]
+
+_XGETBV_WINDOWS_64_OPC = _XGETBV_POSIX_64_OPC[2:]
+
+_XGETBV_CDECL_32_OPC = [
+    0x8B,
+    0x4C,
+    0x24,
+    0x04,  # mov    0x4(%esp),%ecx
+    0x0F,
+    0x01,
+    0xD0,  # xgetbv
+    0xC3,  # ret
+]
+
 is_windows = os.name == "nt"
 is_64bit = ctypes.sizeof(ctypes.c_voidp) == 8
 
@@ -145,6 +177,14 @@ class CPUID_struct(ctypes.Structure):
 
 
 class CPUID():
+    # machine code for windows 64 bit, posix 64 bit and cdecl 32 bit
+    _OPC = (_WINDOWS_64_OPC, _POSIX_64_OPC, _CDECL_32_OPC)
+
+    @staticmethod
+    def _func_type():
+        """ :return the ctypes signature of the machine code """
+        return CFUNCTYPE(None, POINTER(CPUID_struct), c_uint32, c_uint32)
+
     def __init__(self):
         """ """
         if platform.machine() not in ("AMD64", "x86_64", "x86", "i686"):
@@ -156,15 +196,15 @@ class CPUID():
                 # circumstances when ctypes.windll.kernel32 is
                 # used under 64 bit Python. CDLL fixes this.
                 self.win = ctypes.CDLL("kernel32.dll")
-                opc = _WINDOWS_64_OPC
+                opc = self._OPC[0]
             else:
                 # Here ctypes.windll.kernel32 is needed to get the
                 # right DLL. Otherwise it will fail when running
                 # 32 bit Python on 64 bit Windows.
                 self.win = ctypes.windll.kernel32
-                opc = _CDECL_32_OPC
+                opc = self._OPC[2]
         else:
-            opc = _POSIX_64_OPC if is_64bit else _CDECL_32_OPC
+            opc = self._OPC[1] if is_64bit else self._OPC[2]
 
         size = len(opc)
         code = (ctypes.c_ubyte * size)(*opc)
@@ -196,8 +236,7 @@ class CPUID():
 
         ctypes.memmove(self.addr, code, size)
 
-        func_type = CFUNCTYPE(None, POINTER(CPUID_struct), c_uint32, c_uint32)
-        self.func_ptr = func_type(self.addr)
+        self.func_ptr = self._func_type()(self.addr)
 
     def __call__(self, eax, ecx=0):
         """
@@ -222,6 +261,210 @@ class CPUID():
             self.libc.free(self.addr)
 
 
+
+class XGETBV(CPUID):
+    """
+    executes `xgetbv`, which reads an extended control register.
+    NOTE: raises SIGILL if the os did not set OSXSAVE (cpuid leaf 1, ecx
+    bit 27).
+    """
+    _OPC = (_XGETBV_WINDOWS_64_OPC, _XGETBV_POSIX_64_OPC,
+            _XGETBV_CDECL_32_OPC)
+
+    @staticmethod
+    def _func_type():
+        return CFUNCTYPE(c_uint64, c_uint32)
+
+    def __call__(self, index=0):
+        """
+        :param index: the register, 0 is XCR0
+        :return the value of the register
+        """
+        return self.func_ptr(index)
+
+
+# the executor of the current process, created on first use
+_executor = None
+# the `XGETBV` instance of the current process, created on first use
+_xgetbv = None
+
+
+def xgetbv(index: int = 0) -> int:
+    """
+    :param index: see `XGETBV`
+    :return the extended control register `index` of the current cpu
+    """
+    global _xgetbv
+    if _xgetbv is None:
+        _xgetbv = XGETBV()
+    return _xgetbv(index)
+
+
+def executor() -> CPUID:
+    """
+    :return the process wide `CPUID` instance. The executable page is only
+        allocated once.
+    """
+    global _executor
+    if _executor is None:
+        _executor = CPUID()
+    return _executor
+
+
+# leaves whose subleaves are enumerated by `dump_all()`. Leaves which are
+# not listed here do not depend on ecx.
+_SUBLEAF_LEAVES = {0x4, 0x7, 0xB, 0xD, 0xF, 0x10, 0x12, 0x14, 0x17, 0x18,
+                   0x1D, 0x1F, 0x20, 0x8000001D, 0x80000020}
+
+
+def _subleaves(cpu, leaf: int):
+    """
+    :param cpu: `CPUID` instance
+    :param leaf: a leaf of `_SUBLEAF_LEAVES`
+    :return generator over (subleaf, registers) of all valid subleaves
+    """
+    regs = cpu(leaf, 0)
+    yield 0, regs
+    if leaf in (0x4, 0x8000001D):
+        # cache parameters, terminated by the null cache type
+        subleaf = 1
+        while get_bits(regs[0], 0, 4) != 0 and subleaf < 64:
+            regs = cpu(leaf, subleaf)
+            yield subleaf, regs
+            subleaf += 1
+    elif leaf in (0xB, 0x1F):
+        # topology levels, terminated by the invalid level type
+        subleaf = 1
+        while get_bits(regs[2], 8, 15) != 0 and subleaf < 64:
+            regs = cpu(leaf, subleaf)
+            yield subleaf, regs
+            subleaf += 1
+    elif leaf in (0x7, 0x14, 0x17, 0x18, 0x1D, 0x20):
+        # eax of subleaf 0 is the highest subleaf
+        for subleaf in range(1, min(regs[0], 63) + 1):
+            yield subleaf, cpu(leaf, subleaf)
+    else:
+        # sparse subleaves, e.g. the xsave state components
+        for subleaf in range(1, 64):
+            regs = cpu(leaf, subleaf)
+            if any(regs):
+                yield subleaf, regs
+
+
+class CpuidDump:
+    """
+    immutable table of the cpuid registers of all valid leaves and
+    subleaves, see `dump_all()`. It is called like `CPUID`, so all decoders
+    in this module accept it instead of a live cpu. It can be pickled or
+    stored as json to decode a recorded cpu offline.
+    NOTE: some registers (e.g. the APIC id or the core type of hybrid cpus)
+    depend on the logical cpu the dump was taken on.
+    """
+    __slots__ = ("_regs",)
+
+    def __init__(self, regs):
+        """
+        :param regs: mapping or iterable of ((leaf, subleaf), (eax, ebx,
+            ecx, edx))
+        """
+        items = regs.items() if isinstance(regs, dict) else regs
+        object.__setattr__(self, "_regs", {
+            (int(leaf), int(subleaf)): tuple(int(r) for r in values)
+            for (leaf, subleaf), values in items})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CpuidDump is immutable")
+
+    def __call__(self, eax, ecx=0):
+        """
+        :param eax: leaf
+        :param ecx: subleaf, ignored by leaves without subleaves
+        :return (eax, ebx, ecx, edx), zeros for leaves which are not valid
+        """
+        if eax not in _SUBLEAF_LEAVES:
+            ecx = 0
+        return self._regs.get((eax, ecx), (0, 0, 0, 0))
+
+    def __contains__(self, key) -> bool:
+        return key in self._regs
+
+    def __iter__(self):
+        return iter(sorted(self._regs.items()))
+
+    def __len__(self) -> int:
+        return len(self._regs)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CpuidDump) and self._regs == other._regs
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __reduce__(self):
+        return CpuidDump, (tuple(self),)
+
+    def __repr__(self) -> str:
+        return f"CpuidDump({len(self)} leaves)"
+
+    def to_json(self) -> str:
+        """
+        :return the table as json, one [leaf, subleaf, eax, ebx, ecx, edx]
+            row per entry
+        """
+        return json.dumps([[leaf, subleaf, *regs]
+                           for (leaf, subleaf), regs in self])
+
+    @staticmethod
+    def from_json(data: str) -> 'CpuidDump':
+        """
+        :param data: see `to_json()`
+        """
+        return CpuidDump(((row[0], row[1]), row[2:6])
+                         for row in json.loads(data))
+
+
+def dump_all(cpu=None) -> CpuidDump:
+    """
+    reads every valid standard and extended leaf and all their subleaves
+    exactly once.
+    :param cpu: `CPUID` instance, defaults to `executor()`
+    :return the table of all registers
+    """
+    if cpu is None:
+        cpu = executor()
+
+    regs = {}
+    for base in (0x0, 0x80000000):
+        regs[(base, 0)] = cpu(base)
+        highest = regs[(base, 0)][0]
+        if base and not highest & 0x80000000:
+            del regs[(base, 0)]
+            continue
+        # guards against garbage in the highest leaf
+        for leaf in range(base + 1, min(highest, base + 0xFF) + 1):
+            if leaf in _SUBLEAF_LEAVES:
+                for subleaf, values in _subleaves(cpu, leaf):
+                    regs[(leaf, subleaf)] = values
+            else:
+                regs[(leaf, 0)] = cpu(leaf)
+    return CpuidDump(regs)
+
+
+# the table of the current process, read on first use
+_cpuid_table = None
+
+
+def cpuid_table() -> CpuidDump:
+    """
+    :return the process wide `dump_all()` of the cpu. All decoders should use
+        it, instead of issuing separate `cpuid` calls.
+    """
+    global _cpuid_table
+    if _cpuid_table is None:
+        _cpuid_table = dump_all()
+    return _cpuid_table
+
+
 def cpu_vendor(cpu):
     """
     :param cpu
@@ -980,19 +1223,12 @@ def get_basic_info(cpu):
 
 if __name__ == "__main__":
     logging.basicConfig(stream=sys.stdout, format="%(message)s", level=logging.INFO)
-    cpuid = CPUID()
-
-    def valid_inputs():
-        for eax in (0x0, 0x80000000):
-            highest, _, _, _ = cpuid(eax)
-            while eax <= highest:
-                regs = cpuid(eax)
-                yield (eax, regs)
-                eax += 1
+    cpuid = cpuid_table()
 
     print(" ".join(x.ljust(8) for x in ("CPUID", "A", "B", "C", "D")).strip())
-    for eax, regs in valid_inputs():
-        print("%08x" % eax, " ".join("%08x" % reg for reg in regs))
+    for (eax, ecx), regs in cpuid:
+        if ecx == 0:
+            print("%08x" % eax, " ".join("%08x" % reg for reg in regs))
 
     print("")
     print(get_basic_info(cpuid))
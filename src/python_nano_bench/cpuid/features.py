@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+decodes the isa extensions reported by the cpuid feature leaves into a
+bitset. The names are the ones of the `opcodes` package, e.g. `SSE4.1`.
+"""
+
+from typing import Dict, Iterator, List, Tuple, Union
+
+from .cpuid import cpuid_table, get_bit, xgetbv
+
+# (isa extension, leaf, subleaf, register (0=eax, 1=ebx, 2=ecx, 3=edx), bit)
+FEATURES: List[Tuple[str, int, int, int, int]] = [
+    ("CPUID", 0x0, 0, 0, -1),
+    ("RDTSC", 0x1, 0, 3, 4),
+    ("CLFLUSH", 0x1, 0, 3, 19),
+    ("CMOV", 0x1, 0, 3, 15),
+    ("MMX", 0x1, 0, 3, 23),
+    ("SSE", 0x1, 0, 3, 25),
+    ("SSE2", 0x1, 0, 3, 26),
+    ("SSE3", 0x1, 0, 2, 0),
+    ("PCLMULQDQ", 0x1, 0, 2, 1),
+    ("MONITOR", 0x1, 0, 2, 3),
+    ("SSSE3", 0x1, 0, 2, 9),
+    ("FMA3", 0x1, 0, 2, 12),
+    ("SSE4.1", 0x1, 0, 2, 19),
+    ("SSE4.2", 0x1, 0, 2, 20),
+    ("MOVBE", 0x1, 0, 2, 22),
+    ("POPCNT", 0x1, 0, 2, 23),
+    ("AES", 0x1, 0, 2, 25),
+    ("AVX", 0x1, 0, 2, 28),
+    ("F16C", 0x1, 0, 2, 29),
+    ("RDRAND", 0x1, 0, 2, 30),
+    ("BMI", 0x7, 0, 1, 3),
+    ("AVX2", 0x7, 0, 1, 5),
+    ("BMI2", 0x7, 0, 1, 8),
+    ("AVX512F", 0x7, 0, 1, 16),
+    ("AVX512DQ", 0x7, 0, 1, 17),
+    ("RDSEED", 0x7, 0, 1, 18),
+    ("ADX", 0x7, 0, 1, 19),
+    ("AVX512IFMA", 0x7, 0, 1, 21),
+    ("CLFLUSHOPT", 0x7, 0, 1, 23),
+    ("CLWB", 0x7, 0, 1, 24),
+    ("AVX512PF", 0x7, 0, 1, 26),
+    ("AVX512ER", 0x7, 0, 1, 27),
+    ("AVX512CD", 0x7, 0, 1, 28),
+    ("SHA", 0x7, 0, 1, 29),
+    ("AVX512BW", 0x7, 0, 1, 30),
+    ("AVX512VL", 0x7, 0, 1, 31),
+    ("PREFETCHWT1", 0x7, 0, 2, 0),
+    ("AVX512VBMI", 0x7, 0, 2, 1),
+    ("AVX512VBMI2", 0x7, 0, 2, 6),
+    ("GFNI", 0x7, 0, 2, 8),
+    ("VAES", 0x7, 0, 2, 9),
+    ("VPCLMULQDQ", 0x7, 0, 2, 10),
+    ("AVX512VNNI", 0x7, 0, 2, 11),
+    ("AVX512BITALG", 0x7, 0, 2, 12),
+    ("AVX512VPOPCNTDQ", 0x7, 0, 2, 14),
+    ("AVXVNNI", 0x7, 1, 0, 4),
+    ("AVX512BF16", 0x7, 1, 0, 5),
+    ("LZCNT", 0x80000001, 0, 2, 5),
+    ("SSE4A", 0x80000001, 0, 2, 6),
+    ("PREFETCH", 0x80000001, 0, 2, 8),
+    ("PREFETCHW", 0x80000001, 0, 2, 8),
+    ("XOP", 0x80000001, 0, 2, 11),
+    ("FMA4", 0x80000001, 0, 2, 16),
+    ("TBM", 0x80000001, 0, 2, 21),
+    ("MONITORX", 0x80000001, 0, 2, 29),
+    ("MMX+", 0x80000001, 0, 3, 22),
+    ("RDTSCP", 0x80000001, 0, 3, 27),
+    ("3dnow!+", 0x80000001, 0, 3, 30),
+    ("3dnow!", 0x80000001, 0, 3, 31),
+    ("FEMMS", 0x80000001, 0, 3, 31),
+    ("CLZERO", 0x80000008, 0, 1, 0),
+    ("AMX-BF16", 0x7, 0, 3, 22),
+    ("AMX-TILE", 0x7, 0, 3, 24),
+    ("AMX-INT8", 0x7, 0, 3, 25),
+]
+
+# the os saves the extended register state on context switches only if it
+# set OSXSAVE (leaf 1, ecx bit 27) and the state components in XCR0
+OSXSAVE = (0x1, 0, 2, 27)
+XCR0_AVX = 0x6  # sse and avx state
+XCR0_AVX512 = XCR0_AVX | 0xE0  # opmask, upper zmm0-15 and zmm16-31
+XCR0_AMX = 0x60000  # tile config and tile data
+
+# isa extension -> XCR0 bits required to execute it
+XCR0: Dict[str, int] = {
+    **{name: XCR0_AVX for name in ("AVX", "AVX2", "FMA3", "F16C", "AVXVNNI",
+                                    "VAES", "VPCLMULQDQ", "XOP", "FMA4")},
+    **{name: XCR0_AVX512 for name, _, _, _, _ in FEATURES
+       if name.startswith("AVX512")},
+    **{name: XCR0_AMX for name, _, _, _, _ in FEATURES
+       if name.startswith("AMX")},
+}
+
+# isa extension -> bit in `Features.mask`
+BITS = {name: i for i, (name, _, _, _, _) in enumerate(FEATURES)}
+
+
+class Features:
+    """
+    immutable bitset of isa extensions, see `FEATURES`.
+    """
+    __slots__ = ("mask",)
+
+    def __init__(self, mask: int = 0):
+        """
+        :param mask: bit `i` is set if `FEATURES[i]` is supported
+        """
+        self.mask = mask
+
+    @staticmethod
+    def from_names(names) -> 'Features':
+        """
+        :param names: isa extensions, unknown names are ignored
+        """
+        mask = 0
+        for name in names:
+            if name in BITS:
+                mask |= 1 << BITS[name]
+        return Features(mask)
+
+    def __contains__(self, name: str) -> bool:
+        bit = BITS.get(name)
+        return bit is not None and bool(self.mask >> bit & 1)
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name, i in BITS.items() if self.mask >> i & 1)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Features) and self.mask == other.mask
+
+    def __hash__(self) -> int:
+        return hash(self.mask)
+
+    def __repr__(self) -> str:
+        return f"Features({sorted(self)})"
+
+    def supports(self, extensions) -> bool:
+        """
+        :param extensions: isa extensions
+        :return true if all `extensions` are supported
+        """
+        return all(e in self for e in extensions)
+
+
+def features(cpu=None, xcr0: Union[int, None] = None) -> Features:
+    """
+    :param cpu: the `CPUID` instance or table to query, defaults to
+        `cpuid_table()`
+    :param xcr0: the register state enabled by the os, see `XCR0`. Defaults
+        to `xgetbv()` for the local cpu and to the state supported by the
+        cpu (leaf 0xd) for any other `cpu`. Ignored without OSXSAVE.
+    :return the isa extensions supported by the cpu and the os
+    """
+    local = cpu is None
+    if local:
+        cpu = cpuid_table()
+
+    max_leaf = cpu(0)[0]
+    max_ext = cpu(0x80000000)[0]
+    max_sub7 = cpu(0x7)[0] if max_leaf >= 0x7 else 0
+    leaves = {}
+    mask = 0
+    for i, (_, leaf, subleaf, reg, bit) in enumerate(FEATURES):
+        if bit < 0:
+            mask |= 1 << i
+            continue
+        if leaf >= 0x80000000:
+            if leaf > max_ext:
+                continue
+        elif leaf > max_leaf or (leaf == 0x7 and subleaf > max_sub7):
+            continue
+        if (leaf, subleaf) not in leaves:
+            leaves[(leaf, subleaf)] = cpu(leaf, subleaf)
+        if get_bit(leaves[(leaf, subleaf)][reg], bit):
+            mask |= 1 << i
+
+    leaf, subleaf, reg, bit = OSXSAVE
+    if not get_bit(cpu(leaf, subleaf)[reg], bit):
+        # xgetbv is not available, neither is any extended state
+        xcr0 = 0
+    elif xcr0 is None:
+        if local:
+            xcr0 = xgetbv(0)
+        else:
+            eax, _, _, edx = cpu(0xD, 0) if max_leaf >= 0xD else (0, 0, 0, 0)
+            xcr0 = eax | edx << 32
+    for name, required in XCR0.items():
+        if xcr0 & required != required:
+            mask &= ~(1 << BITS[name])
+    return Features(mask)
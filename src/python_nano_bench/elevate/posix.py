@@ -9,7 +9,6 @@ import errno
 import json
 import os
 import sys
-from multiprocessing.connection import Client
 from typing import List
 from shlex import quote
 
@@ -79,6 +78,8 @@ class Elevate():
     pass
 
 def worker_send_command_blocking(cmd: List[str]):
+    # imported here, `multiprocessing.connection` is slow to import
+    from multiprocessing.connection import Client
     conn = Client(ADDRESS, authkey=AUTHKEY)
     print("[Client] Connected to server.")
     msg = json.dumps(cmd)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+builds eviction sets, i.e. lines of the buffer r14 points to which map to
+the same set of a cache, and benchmarks which access congruent lines to
+measure associativity conflicts and the replacement policy.
+
+Only the bits of the set index within a page can be chosen, the others
+depend on the physical address (and on the slice hash of caches with
+complex addressing). Candidates are therefore only congruent within the
+page and are reduced with group testing: the candidates are split into
+`ways + 1` groups and a group is dropped if the rest still evicts the
+target, which needs O(ways^2 log n) tests instead of O(n^2).
+"""
+
+import random
+import threading
+from typing import Callable, Iterable, List, Sequence, Tuple, Union
+
+from .cpuid.caches import CacheHierarchy, CacheLevel, cache_hierarchy
+from .nano_bench import NanoBench
+
+PAGE_SIZE = 4096
+
+# (target, list of candidate sets) -> for each set if it evicts the target
+Oracle = Callable[[int, List[List[int]]], List[bool]]
+
+
+def candidates(cache: CacheLevel, set_index: int,
+               n: Union[int, None] = None,
+               page_size: int = PAGE_SIZE) -> List[int]:
+    """
+    :param cache: the cache to build the eviction set for
+    :param set_index: the set within the cache
+    :param n: number of candidates. Defaults to twice the number of lines
+        needed to fill every set the candidates can map to, so the pool
+        evicts any of its lines.
+    :param page_size: size of the pages backing the buffer
+    :return offsets into the buffer r14 points to, which agree with
+        `set_index` in all index bits within a page
+    """
+    if not 0 <= set_index < cache.sets:
+        raise ValueError(f"{cache.name} has no set {set_index}")
+    span = cache.sets * cache.line_size
+    stride = min(span, page_size)
+    first = (set_index * cache.line_size) % stride
+    if n is None:
+        # sets (and slices) the candidates cannot be told apart in
+        colors = max(cache.size // (cache.ways * stride), 1)
+        n = 2 * cache.ways * colors
+    return [first + i * stride for i in range(n)]
+
+
+def traverse(offsets: Sequence[int]) -> Tuple[str, str]:
+    """
+    :param offsets: offsets into the buffer r14 points to, at least one
+    :return (assembly string, init code). The init code links the lines at
+        `offsets` into a cyclic pointer chain, each repetition loads every
+        line once in the given order with dependent loads.
+    """
+    if not offsets:
+        raise ValueError("no offsets")
+    init = []
+    for off, nxt in zip(offsets, list(offsets[1:]) + [offsets[0]]):
+        init.append(f"lea rax, [r14 + {nxt}]; mov [r14 + {off}], rax")
+    init.append(f"lea rax, [r14 + {offsets[0]}]")
+    asm = (f"mov rcx, {len(offsets)}; 2: mov rax, qword ptr [rax]; "
+           f"dec rcx; jnz 2b")
+    return asm, "; ".join(init)
+
+
+def access_pattern(offsets: Sequence[int],
+                   sequence: Iterable[int]) -> Tuple[str, str]:
+    """
+    :param offsets: offsets of congruent lines, e.g. an eviction set
+    :param sequence: indices into `offsets` in access order, e.g.
+        `[0, 1, 2, 3, 0, 4]` to test which line the policy replaces
+    :return (assembly string, init code) with one load per access
+    """
+    asm = "; ".join(f"mov rax, qword ptr [r14 + {offsets[i]}]"
+                    for i in sequence)
+    return asm, "mov rax, r14"
+
+
+def reduce(target: int, pool: Sequence[int], ways: int,
+           evicts: Oracle, max_backtracks: int = 20,
+           seed: int = 0) -> Union[List[int], None]:
+    """
+    group testing reduction of `pool` to an eviction set of `target`.
+    All `ways + 1` tests of a round are passed to `evicts` at once, so they
+    can be measured as one batch. If no group can be dropped or the
+    final set does not evict `target` (e.g. a noisy test dropped a
+    congruent line before), the group dropped last is added back and the
+    lines are shuffled into new groups.
+    :param target: offset of the line to evict
+    :param pool: offsets of the candidates, without `target`
+    :param ways: associativity of the cache
+    :param evicts: see `Oracle`
+    :param max_backtracks: number of times a dropped group is added back
+    :param seed: of the shuffle after a backtrack
+    :return `ways` lines which evict `target`, None if `pool` does not
+        evict `target` or the reduction gets stuck more than
+        `max_backtracks` times
+    """
+    rng = random.Random(seed)
+    s = list(pool)
+    if not evicts(target, [s])[0]:
+        return None
+    # the dropped groups, the last one is added back first
+    dropped: List[List[int]] = []
+    backtracks = 0
+    while True:
+        if len(s) <= ways:
+            # a noisy test may have accepted the last round
+            if evicts(target, [s])[0]:
+                return s
+        else:
+            n = min(ways + 1, len(s))
+            groups = [s[i * len(s) // n:(i + 1) * len(s) // n]
+                      for i in range(n)]
+            rests = [[x for j, g in enumerate(groups) if j != i for x in g]
+                     for i in range(n)]
+            i = next((i for i, ok in enumerate(evicts(target, rests)) if ok),
+                     None)
+            if i is not None:
+                s = rests[i]
+                dropped.append(groups[i])
+                continue
+        if not dropped or backtracks >= max_backtracks:
+            return None
+        backtracks += 1
+        s += dropped.pop()
+        rng.shuffle(s)
+
+
+class NanoBenchOracle:
+    """
+    decides with two measurements per test if a set of lines evicts a
+    target: the chain over the set with and without the target. The
+    difference is the cost of the target load, which jumps once it misses.
+    """
+
+    def __init__(self, nb: NanoBench, threshold: Union[float, None] = None,
+                 event: str = "Core cycles", kernel: bool = False,
+                 cancel: Union[threading.Event, None] = None):
+        """
+        :param nb: the benchmark options
+        :param threshold: cost of the target load above which it counts as
+            evicted. Set by `calibrate()` if None.
+        :param event: the measured event
+        :param kernel: see `NanoBench.run()`
+        :param cancel: see `NanoBench.run()`
+        """
+        self.nb = nb
+        self.threshold = threshold
+        self.event = event
+        self.kernel = kernel
+        self.cancel = cancel
+        # number of benchmarks run so far
+        self.runs = 0
+
+    def costs(self, target: int,
+              sets: List[List[int]]) -> List[Union[float, None]]:
+        """
+        :return for each set the cost of loading `target` after it, None
+            on error
+        """
+        snippets = []
+        for s in sets:
+            snippets += [traverse(s + [target]), traverse(s)] if s else \
+                [traverse([target]), None]
+        todo = [x for x in snippets if x is not None]
+        self.runs += len(todo)
+        results = iter(self.nb.run_many(todo, self.kernel, self.cancel))
+
+        ret = []
+        for i in range(0, len(snippets), 2):
+            with_target = next(results)
+            without = next(results) if snippets[i + 1] is not None else None
+            if with_target is None or \
+                    (snippets[i + 1] is not None and without is None):
+                ret.append(None)
+                continue
+            cost = with_target.get(self.event, 0.0)
+            if without is not None:
+                cost -= without.get(self.event, 0.0)
+            ret.append(cost)
+        return ret
+
+    def calibrate(self, target: int, pool: List[int]) -> float:
+        """
+        sets the threshold halfway between the cost of the target alone
+        (a hit) and after the whole pool (a miss).
+        :return the threshold
+        """
+        costs = self.costs(target, [[], pool])
+        hit, miss = costs[0], costs[1]
+        if hit is None or miss is None or miss - hit < 1.0:
+            raise ValueError("the pool does not evict the target")
+        self.threshold = (hit + miss) / 2
+        return self.threshold
+
+    def __call__(self, target: int, sets: List[List[int]]) -> List[bool]:
+        assert self.threshold is not None, "call `calibrate()` first"
+        return [c is not None and c > self.threshold
+                for c in self.costs(target, sets)]
+
+
+def eviction_set(nb: Union[NanoBench, None], cache: str = "L2",
+                 set_index: int = 0,
+                 hierarchy: Union[CacheHierarchy, None] = None,
+                 n: Union[int, None] = None,
+                 oracle: Union[Oracle, None] = None,
+                 kernel: bool = False
+                 ) -> Union[List[int], None]:
+    """
+    :param nb: the benchmark options. Only None with a custom `oracle`,
+        then the footprint of the candidates is not checked.
+    :param cache: name of the cache, e.g. `L1D` or `L3`
+    :param set_index: the set within the cache
+    :param hierarchy: defaults to `cache_hierarchy()`
+    :param n: number of candidates, see `candidates()`. Raises
+        `ValueError` if they do not fit into the buffer r14 points to (see
+        `NanoBench.r14_size()`), e.g. the default pool of a large cache in
+        user mode.
+    :param oracle: defaults to a calibrated `NanoBenchOracle`
+    :param kernel: see `NanoBench.run()`
+    :return the offsets of `ways + 1` congruent lines, the first one is the
+        target. None if no eviction set was found.
+    """
+    if nb is None and oracle is None:
+        raise ValueError("either `nb` or `oracle` is needed")
+    if hierarchy is None:
+        hierarchy = cache_hierarchy()
+    level = hierarchy[cache]
+    pool = candidates(level, set_index, n)
+    if nb is not None:
+        footprint = max(pool) + level.line_size
+        if footprint > nb.r14_size(kernel):
+            raise ValueError(f"the {len(pool)} candidates of {cache} span "
+                             f"{footprint} bytes, more than the "
+                             f"{nb.r14_size(kernel)} bytes r14 points to")
+    target, pool = pool[0], pool[1:]
+    if oracle is None:
+        oracle = NanoBenchOracle(nb, kernel=kernel)
+        oracle.calibrate(target, pool)
+    ret = reduce(target, pool, level.ways, oracle)
+    return [target] + ret if ret is not None else None
+
+
+def conflict_sweep(nb: NanoBench, offsets: Sequence[int],
+                   kernel: bool = False,
+                   cancel: Union[threading.Event, None] = None
+                   ) -> List[Tuple[int, Union[float, None]]]:
+    """
+    measures chains over the first 1, 2, ... lines of `offsets` as one
+    batch. For congruent lines the cycles per load jump once the chain
+    exceeds the associativity.
+    :param nb: the benchmark options
+    :param offsets: congruent lines, e.g. from `eviction_set()`
+    :param kernel: see `NanoBench.run()`
+    :param cancel: see `NanoBench.run()`
+    :return (number of lines, core cycles per load), None on error
+    """
+    counts = range(1, len(offsets) + 1)
+    results = nb.run_many([traverse(offsets[:k]) for k in counts],
+                          kernel, cancel)
+    ret = []
+    for k, r in zip(counts, results):
+        cycles = r.get("Core cycles") if r is not None else None
+        ret.append((k, cycles / k if cycles is not None else None))
+    return ret
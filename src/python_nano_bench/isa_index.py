@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+compact, memory mappable index of all instruction forms of the `opcodes`
+x86-64 instruction set. It is built once into the user cache dir and then
+shared read-only (via the page cache) by all processes, so the xml database
+does not need to be parsed again.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from typing import Dict, Iterable, List, NamedTuple, Tuple, Union
+
+from .cache import cache_dir
+
+MAGIC = b"NBFI"
+VERSION = 1
+
+# magic, version, strings, isa extensions, mnemonics, records
+_HEADER = struct.Struct("<4sIIIII")
+# string id of the mnemonic, string id of the operand signature, bitmask of
+# the isa extensions, length of the shortest encoding
+_RECORD = struct.Struct("<IIQB3x")
+# string id, first record, number of records
+_MNEMONIC = struct.Struct("<III")
+_U32 = struct.Struct("<I")
+
+
+class Form(NamedTuple):
+    """ a single instruction form """
+    mnemonic: str
+    # the operand types of the `opcodes` package, e.g. ("r64", "m64")
+    operands: Tuple[str, ...]
+    isa_extensions: Tuple[str, ...]
+    # length of the shortest encoding in bytes, without displacement
+    length: int
+
+    def key(self) -> str:
+        """ :return the form as string, e.g. `ADD r64, m64` """
+        return f"{self.mnemonic} {', '.join(self.operands)}".strip()
+
+
+def encoding_length(encoding) -> int:
+    """
+    :param encoding: `opcodes.x86_64.Encoding`
+    :return the length of `encoding` with the low registers as operands or
+        a memory operand without displacement
+    """
+    n = 0
+    for c in encoding.components:
+        name = type(c).__name__
+        if name in ("Prefix", "Opcode", "ModRM", "RegisterByte"):
+            n += 1
+        elif name == "REX":
+            n += 1 if c.is_mandatory or c.W == 1 else 0
+        elif name == "VEX":
+            # the 2 byte form cannot encode W, X, B and other opcode maps,
+            # X and B are not needed for the low registers
+            short = c.type == "VEX" and c.mmmmm == 1 and c.W in (0, None)
+            n += 2 if short else 3
+        elif name == "EVEX":
+            n += 4
+        elif name in ("Immediate", "CodeOffset", "DataOffset"):
+            n += c.size
+    return n
+
+
+def _forms(instruction_set: Iterable) -> List[Form]:
+    """
+    :param instruction_set: list of `opcodes.x86_64.Instruction`
+    :return all forms sorted by mnemonic
+    """
+    ret = []
+    for instruction in instruction_set:
+        for form in instruction.forms:
+            length = min((encoding_length(e) for e in form.encodings),
+                         default=0)
+            ret.append(Form(form.name, tuple(o.type for o in form.operands),
+                            tuple(e.name for e in form.isa_extensions),
+                            min(length, 255)))
+    ret.sort(key=lambda f: f.mnemonic)
+    return ret
+
+
+def build(instruction_set: Iterable, path: str):
+    """
+    writes the index of `instruction_set` atomically to `path`.
+    :param instruction_set: list of `opcodes.x86_64.Instruction`
+    :param path: the index file
+    """
+    forms = _forms(instruction_set)
+
+    strings: Dict[str, int] = {}
+
+    def string(s: str) -> int:
+        return strings.setdefault(s, len(strings))
+
+    isa: List[str] = sorted({e for f in forms for e in f.isa_extensions})
+    if len(isa) > 64:
+        raise ValueError("too many isa extensions")
+    isa_ids = [string(e) for e in isa]
+
+    records = bytearray()
+    mnemonics: List[Tuple[int, int, int]] = []
+    for i, f in enumerate(forms):
+        m = string(f.mnemonic)
+        if not mnemonics or mnemonics[-1][0] != m:
+            mnemonics.append((m, i, 0))
+        mnemonics[-1] = (m, mnemonics[-1][1], mnemonics[-1][2] + 1)
+        mask = 0
+        for e in f.isa_extensions:
+            mask |= 1 << isa.index(e)
+        records += _RECORD.pack(m, string(",".join(f.operands)), mask,
+                                f.length)
+
+    blob = bytearray()
+    offsets = bytearray()
+    for s in strings:
+        offsets += _U32.pack(len(blob))
+        blob += s.encode()
+    offsets += _U32.pack(len(blob))
+    blob += b"\0" * (-len(blob) % 4)
+
+    data = bytearray(_HEADER.pack(MAGIC, VERSION, len(strings), len(isa),
+                                  len(mnemonics), len(forms)))
+    data += offsets + blob
+    data += b"".join(_U32.pack(i) for i in isa_ids)
+    data += b"".join(_MNEMONIC.pack(*m) for m in mnemonics)
+    data += records
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class FormIndex:
+    """
+    read-only view of an index file. Only the small mnemonic table is
+    decoded on open, all forms are read from the mapping on demand.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: the index file, see `build()`
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_strings, n_isa, n_mnemonics, self._n = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a form index of version "
+                             f"{VERSION}")
+
+        pos = _HEADER.size
+        self._offsets = pos
+        pos += (n_strings + 1) * _U32.size
+        self._blob = pos
+        blob_size = _U32.unpack_from(self._mm, pos - _U32.size)[0]
+        pos += blob_size + (-blob_size % 4)
+        self.isa_extensions = [self._string(_U32.unpack_from(self._mm, pos +
+                                                             i * 4)[0])
+                               for i in range(n_isa)]
+        pos += n_isa * _U32.size
+
+        # mnemonic -> (first record, number of records)
+        self._mnemonics: Dict[str, Tuple[int, int]] = {}
+        for i in range(n_mnemonics):
+            s, first, count = _MNEMONIC.unpack_from(self._mm, pos)
+            self._mnemonics[self._string(s)] = (first, count)
+            pos += _MNEMONIC.size
+        self._records = pos
+
+    def __getstate__(self):
+        # the mapping is opened again by the receiving process
+        return self.path
+
+    def __setstate__(self, path: str):
+        self.__init__(path)
+
+    def _string(self, i: int) -> str:
+        begin, end = struct.unpack_from("<II", self._mm,
+                                        self._offsets + i * _U32.size)
+        return self._mm[self._blob + begin:self._blob + end].decode()
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, i: int) -> Form:
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        m, sig, mask, length = _RECORD.unpack_from(
+            self._mm, self._records + i * _RECORD.size)
+        operands = self._string(sig)
+        isa = tuple(e for b, e in enumerate(self.isa_extensions)
+                    if mask >> b & 1)
+        return Form(self._string(m),
+                    tuple(operands.split(",")) if operands else (),
+                    isa, length)
+
+    def mnemonics(self) -> List[str]:
+        """ :return all mnemonics in sorted order """
+        return list(self._mnemonics)
+
+    def forms(self, mnemonic: str) -> List[Form]:
+        """
+        :param mnemonic: e.g. `VPADDB`, case insensitive
+        :return all forms of `mnemonic`
+        """
+        first, count = self._mnemonics.get(mnemonic.upper(), (0, 0))
+        return [self[i] for i in range(first, first + count)]
+
+    def with_isa(self, prefix: str) -> List[Form]:
+        """
+        :param prefix: prefix of the isa extension, e.g. `AVX512` for all
+            AVX-512 extensions
+        :return all forms which need at least one matching extension
+        """
+        mask = 0
+        for b, e in enumerate(self.isa_extensions):
+            if e.startswith(prefix):
+                mask |= 1 << b
+        ret = []
+        for i in range(self._n):
+            off = self._records + i * _RECORD.size
+            if struct.unpack_from("<Q", self._mm, off + 8)[0] & mask:
+                ret.append(self[i])
+        return ret
+
+
+def _source() -> str:
+    """ :return the xml database of the `opcodes` package """
+    import opcodes
+    return os.path.join(os.path.dirname(opcodes.__file__), "x86_64.xml")
+
+
+def index_path() -> str:
+    """
+    :return the path of the index in the user cache dir. The name depends
+        on the version of the database and of the file format.
+    """
+    st = os.stat(_source())
+    h = hashlib.sha256(f"{VERSION}|{st.st_size}|{st.st_mtime_ns}".encode())
+    return os.path.join(cache_dir(), f"forms-{h.hexdigest()[:16]}.idx")
+
+
+# the index of the current process, opened on first use
+_form_index: Union[FormIndex, None] = None
+
+
+def form_index(path: Union[str, None] = None) -> FormIndex:
+    """
+    :param path: the index file. Defaults to `index_path()`.
+    :return the process wide index. It is built on first use, which is the
+        only time the instruction set is parsed.
+    """
+    global _form_index
+    if path is None:
+        if _form_index is not None:
+            return _form_index
+        path = index_path()
+
+    if not os.path.exists(path):
+        from .nano_bench import get_instruction_set
+        build(get_instruction_set(), path)
+
+    index = FormIndex(path)
+    if path == index_path():
+        _form_index = index
+    return index
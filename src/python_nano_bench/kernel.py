@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+direct interface to the nanoBench kernel module. Instead of calling
+`kernel-nanoBench.sh`, the paths of the code and config files and the
+parameters are written straight into the sysfs files of the module and the
+results are read from its proc file.
+"""
+
+import os
+from typing import Dict, List, Union
+
+from .elevate import elevate
+from .workspace import Workspace, default_workspace
+
+# sysfs files which expect the path of a file with raw machine code
+CODE_FILES = ("code", "init", "late_init", "one_time_init")
+
+SYS_DIR = "/sys/nb"
+PROC_FILE = "/proc/nanoBench"
+
+
+class KernelBackend:
+    """
+    wrapper around `/sys/nb` and `/proc/nanoBench`.
+
+    The module reads the code and config from the files whose paths are
+    written into its sysfs files, like `kernel-nanoBench.sh` does. Every
+    sysfs file remembers the last content written to it (for code files the
+    machine code), so repeated runs only write what actually changed.
+    """
+
+    def __init__(self, sys_dir: str = SYS_DIR,
+                 proc_file: str = PROC_FILE,
+                 root: bool = True,
+                 workspace: Union[Workspace, None] = None):
+        """
+        :param sys_dir: the sysfs directory of the kernel module
+        :param proc_file: the proc file which returns the results
+        :param root: if true, root rights are requested before the module
+            is accessed.
+        :param workspace: for the code files, defaults to
+            `default_workspace()`
+        """
+        self._sys_dir = sys_dir
+        self._proc_file = proc_file
+        self._root = root
+        self._workspace = workspace if workspace is not None else \
+            default_workspace()
+
+        # sysfs file name -> last written content
+        self._written: Dict[str, bytes] = {}
+        # currently set options, see `configure()`
+        self._options: Dict[str, str] = {}
+
+    def available(self) -> bool:
+        """
+        :return true if the kernel module is loaded
+        """
+        return os.path.isdir(self._sys_dir) and \
+            os.path.exists(self._proc_file)
+
+    def _check(self):
+        """ raises `OSError` if the kernel module is not loaded """
+        if not self.available():
+            raise OSError(f"the nanoBench kernel module is not loaded "
+                          f"({self._sys_dir} or {self._proc_file} missing)")
+
+    def write(self, name: str, content: Union[str, bytes],
+              force: bool = False) -> bool:
+        """
+        writes `content` into the sysfs file `name` of the module, if it
+        differs from the last written content.
+        :param name: name of the file within the sysfs directory
+        :param content: the content to write
+        :param force: if true, the content is written in any case
+        :return true if something was written
+        """
+        if isinstance(content, str):
+            content = content.encode()
+
+        if not force and self._written.get(name) == content:
+            return False
+
+        if self._root:
+            elevate()
+        with open(os.path.join(self._sys_dir, name), 'wb') as f:
+            f.write(content)
+        self._written[name] = content
+        return True
+
+    def write_code(self, name: str, code: bytes,
+                   force: bool = False) -> bool:
+        """
+        writes `code` into a file of the workspace and its path into the
+        sysfs file `name`, if `code` differs from the last written code.
+        The module reads the file while its path is written.
+        :param name: one of `CODE_FILES`
+        :param code: the raw machine code
+        :param force: if true, the code is written in any case
+        :return true if something was written
+        """
+        if not force and self._written.get(name) == code:
+            return False
+
+        with self._workspace.files(".bin") as (path,):
+            with open(path, 'wb') as f:
+                f.write(code)
+            self.write(name, path, force=True)
+        self._written[name] = code
+        return True
+
+    def reset(self):
+        """ resets all parameters of the kernel module to their defaults """
+        self.write("reset", "1", force=True)
+        self._written = {}
+        self._options = {}
+
+    def set_code(self, code: bytes):
+        """ :param code: the raw machine code of the benchmark """
+        self.write_code("code", code)
+
+    def set_init(self, code: bytes):
+        """ :param code: the raw machine code executed before each run """
+        self.write_code("init", code)
+
+    def set_late_init(self, code: bytes):
+        """ :param code: the raw machine code executed right before `code` """
+        self.write_code("late_init", code)
+
+    def set_one_time_init(self, code: bytes):
+        """ :param code: the raw machine code executed once """
+        self.write_code("one_time_init", code)
+
+    def set_config(self, path: str):
+        """
+        :param path: path to the nanoBench config file, which is read by
+            the module.
+        """
+        self.write("config", os.path.abspath(path))
+
+    def configure(self, options: Dict[str, str]):
+        """
+        sets the parameters of the module. Options which were set by a
+        previous call but are missing now are restored to their defaults.
+        :param options: sysfs file name -> value
+        """
+        self._check()
+        if options == self._options:
+            return
+
+        if any(k not in options for k in self._options):
+            # the module only knows how to reset everything at once
+            code = {k: v for k, v in self._written.items()
+                    if k in CODE_FILES + ("config",)}
+            self.reset()
+            for k, v in code.items():
+                if k in CODE_FILES:
+                    self.write_code(k, v)
+                else:
+                    self.write(k, v)
+
+        for k, v in options.items():
+            self.write(k, v)
+        self._options = dict(options)
+
+    def measure(self, cpu: int = -1) -> List[str]:
+        """
+        performs a measurement with the currently set code and parameters.
+        :param cpu: if != -1, the measurement is executed on this cpu.
+        :return the output lines of the module
+        """
+        self._check()
+        if self._root:
+            elevate()
+
+        prev_affinity = None
+        if cpu != -1:
+            prev_affinity = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, {cpu})
+        try:
+            with open(self._proc_file, encoding="utf-8") as f:
+                return [line.rstrip("\n") for line in f if line.strip()]
+        finally:
+            if prev_affinity is not None:
+                os.sched_setaffinity(0, prev_affinity)
+
+    def run(self, code: bytes, init: bytes, config: str,
+            options: Dict[str, str], cpu: int = -1) -> List[str]:
+        """
+        :param code: the raw machine code of the benchmark
+        :param init: the raw machine code of the init code
+        :param config: path to the nanoBench config file
+        :param options: see `configure()`
+        :param cpu: see `measure()`
+        :return the output lines of the module. Raises `OSError` before
+            anything is written if the module is not loaded.
+        """
+        self._check()
+        self.configure(options)
+        self.set_config(config)
+        self.set_init(init)
+        self.set_code(code)
+        return self.measure(cpu)
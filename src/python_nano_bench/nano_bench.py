@@ -1,25 +1,75 @@
 #!/usr/bin/env python3
 """ wrapper around the `./nanoBench` command """
+import atexit
+import fnmatch
+import itertools
 import os
-import pprint
 import re
+import selectors
+import struct
 import subprocess
 import sys
+import threading
+import time
+from array import array
+from concurrent.futures import CancelledError
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 from shutil import copyfile
-from subprocess import PIPE, STDOUT, Popen
-from typing import List, Tuple, Union
+from subprocess import DEVNULL, PIPE, STDOUT, Popen
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, \
+    Union
 
 from .asm import Asm
-from .cpuid.cpuid import CPUID, micro_arch
+from .cache import ResultCache, binary_cache
+from .config import ConfigIndex, load_config, programmable_counters, \
+    schedule, write_config
+from .cpuid.cpuid import cpuid_table, micro_arch
+from .cpuid.features import Features
 from .elevate import Elevate, elevate
+from .kernel import KernelBackend
+from .result import BenchResult
+from .stats import Samples, converged, mean_ci
+from .topology import is_hybrid, read_cpuid, system_topology
+from .validate import Validator
+from .workspace import Workspace, default_workspace
 
 PFC_START_ASM = '.quad 0xE0B513B1C2813F04'
 PFC_STOP_ASM = '.quad 0xF0B513B1C2813F04'
 
+RDPMC_FILE = "/sys/bus/event_source/devices/cpu/rdpmc"
+NMI_WATCHDOG_FILE = "/proc/sys/kernel/nmi_watchdog"
 
-from opcodes.x86 import read_instruction_set
-instruction_set = read_instruction_set()
+# directory of the `nanoBench` submodule, all scripts and config paths are
+# relative to this one.
+NANOBENCH_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             "deps", "nanoBench")
+
+# the x86-64 instruction set of the `opcodes` package. Parsing it takes much
+# longer than importing this module, so it is loaded on first use, see
+# `get_instruction_set()`.
+_instruction_set = None
+
+
+def get_instruction_set():
+    """
+    :return the list of `opcodes.x86_64.Instruction`, it is parsed on first
+        use.
+    """
+    global _instruction_set
+    if _instruction_set is None:
+        from opcodes.x86_64 import read_instruction_set
+        _instruction_set = read_instruction_set()
+    return _instruction_set
+
+
+def __getattr__(name: str):
+    # `instruction_set` is kept as a module attribute, but only loaded once
+    # it is accessed
+    if name == "instruction_set":
+        return get_instruction_set()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class NanoBench:
@@ -40,12 +90,25 @@ class NanoBench:
         'SKX' : 'SkylakeX',
     }
 
+    # number of snippets `run_many()` assembles at once
+    BATCH_SIZE = 256
+    # used by nanoBench if no `unroll_count()` is set
+    DEFAULT_UNROLL_COUNT = 1000
+    # usable size of the buffer r14 points to in the user version of
+    # nanoBench. The buffer is 1 MB, but r14 points to its middle (the
+    # init code of `Asm` writes below r14), so 512 KB are left above r14.
+    USER_R14_SIZE = 512 * 1024
+
     def __init__(self):
         self._elevate = Elevate()
 
         # if set to true, all benchmarks will be performed using the kernel
         # mode.
         self.kernel_mode = False
+        # created on first use of the kernel mode
+        self._kernel_backend = None
+        # private directory for all temporary files of this instance
+        self._workspace = Workspace()
 
         # nanoBennch kernel and user params
         self._verbose = False
@@ -71,6 +134,22 @@ class NanoBench:
         self._fixed_counters = False
         self._basic_mode = False
 
+        # in seconds, a benchmark taking longer is killed. None disables it.
+        self._timeout = None
+
+        # if set, results are looked up in and stored into this cache. If
+        # `_force` is set, the cache is not read, but still written.
+        self._result_cache = None
+        self._force = False
+
+        # (rel_ci, max_time, events, min_rounds, max_rounds) if measurements
+        # are repeated until they are stable, see `adaptive()`.
+        self._adaptive = None
+
+        # if set, snippets with instructions the cpu does not support are
+        # rejected before they are assembled, see `validate()`.
+        self._validator = None
+
         # files
         self._code_one_time_init = False
         self._code_late_init = False
@@ -79,17 +158,52 @@ class NanoBench:
         self._asm_late_init = False
         self._asm_init = False
 
+        # system state which is changed by `prefix()` and restored by
+        # `postfix()`. If `_session` is true, the system is already prepared
+        # and `run()` calls the `nanoBench` binary directly.
+        self._session = False
+        self.prev_rdpmc = None
+        self.prev_nmi_watchdog = None
+        self.msr_loaded = False
+        self.removed_modules = []
+
         # this refers to the `config file` which is used to determine which
         # performance metrics is supported by the cpu
         self._config = None
+        # the config of each pass, see `events()`. Without a selection this
+        # is only `_config`, otherwise `_config` is the first pass.
+        self._configs = []
+        # the full config of the cpu, the passes are subsets of it. See
+        # `events()`.
+        self._full_config = None
+        # the counter groups of the selected events, None if all events
+        # are measured
+        self._event_groups = None
+        # the arguments (patterns, n_counters) of the last `events()` call,
+        # None if all events are measured
+        self._event_selection = None
         self.config(NanoBench._get_current_cpu_generation())
 
     @staticmethod
+    @lru_cache(maxsize=None)
     def _get_current_cpu_generation() -> str:
         """
         :return the cpu architecture of the cpu the script is currently run on.
         """
-        return micro_arch(CPUID())
+        return micro_arch(cpuid_table())
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _get_cpu_generation(cpu: int) -> str:
+        """
+        :param cpu: logical cpu
+        :return the cpu architecture of `cpu`, which differs between the core
+            types of hybrid cpus.
+        """
+        table = read_cpuid(cpu)
+        if table is None:
+            return NanoBench._get_current_cpu_generation()
+        return micro_arch(table)
 
     def _get_cpu_configuration_path(self, march: str):
         """
@@ -102,20 +216,9 @@ class NanoBench:
         #return f"deps/nanoBench/configs/cfg_{march}_all_core.txt"
 
     @staticmethod
-    def _parse_user_nanobench_output(s: List[str],
-                                     remove_zeros: bool=False):
-        ret = {}
-        for line in s:
-            splits = line.split(":")
-            assert len(splits) == 2
-            d = float(splits[1])
-            if remove_zeros:
-                if d > 0.0:
-                    ret[splits[0]] = d
-            else:
-                ret[splits[0]] = d
-
-        return ret
+    def _parse_user_nanobench_output(s: Iterable[str],
+                                     remove_zeros: bool=False) -> BenchResult:
+        return BenchResult.parse(s, remove_zeros)
 
     @staticmethod
     def available():
@@ -175,13 +278,26 @@ class NanoBench:
             return f.read()
 
     @staticmethod
-    def run_command(cmds: List[str],
-                    root: bool,
-                    cwd: str="") -> Tuple[bool, List[str]]:
+    def stream_command(cmds: List[str],
+                       root: bool,
+                       cwd: str="",
+                       timeout: Union[float, None]=None,
+                       cancel: Union[threading.Event, None]=None
+                       ) -> Iterator[str]:
         """
+        runs the command and yields its output line by line while it is
+        still running. Hence, the pipe never fills up and the output can be
+        processed while the command is executing. Lines containing `Note:`
+        are filtered.
+
         :param cmds: list of strings which is a single command
-        :param root: if true the command will be executed as root 
-        :param cwd: current working dir 
+        :param root: if true the command will be executed as root
+        :param cwd: current working dir
+        :param timeout: if not None, the command is killed after this many
+            seconds and `subprocess.TimeoutExpired` is raised.
+        :param cancel: if not None, the command is killed as soon as this
+            event is set and `CancelledError` is raised.
+        :raise subprocess.CalledProcessError: if the command fails
         """
         if root:
             elevate()
@@ -189,66 +305,130 @@ class NanoBench:
         if cwd == "":
             cwd = os.path.dirname(os.path.realpath(__file__))
 
-        pprint.pprint(cmds)
-        with Popen(cmds, stdin=PIPE, stdout=PIPE, stderr=STDOUT, cwd=cwd) as p:
-            p.wait()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with Popen(cmds, stdin=DEVNULL, stdout=PIPE, stderr=STDOUT,
+                   cwd=cwd) as p:
             assert p.stdout
-            if p.returncode != 0:
-                print("command failed")
-                print(str(p.stdout.read()))
-                return False, []
+            fd = p.stdout.fileno()
+            buf = b""
+            with selectors.DefaultSelector() as sel:
+                sel.register(fd, selectors.EVENT_READ)
+                try:
+                    while True:
+                        if cancel is not None and cancel.is_set():
+                            raise CancelledError()
+
+                        # poll regularly if the command can be cancelled
+                        wait = None if cancel is None else 0.1
+                        if deadline is not None:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise subprocess.TimeoutExpired(cmds, timeout)
+                            wait = remaining if wait is None else \
+                                min(wait, remaining)
+
+                        if not sel.select(wait):
+                            continue
+
+                        chunk = os.read(fd, 1 << 16)
+                        if not chunk:
+                            break
+
+                        *lines, buf = (buf + chunk).split(b"\n")
+                        for line in lines:
+                            line = line.decode()
+                            if "Note:" not in line:
+                                yield line
+                finally:
+                    # also reached if the consumer stops early
+                    if p.poll() is None:
+                        p.kill()
+
+            if buf and b"Note:" not in buf:
+                yield buf.decode()
+
+            if p.wait() != 0:
+                raise subprocess.CalledProcessError(p.returncode, cmds)
 
-            s = p.stdout.readlines()
-            s = [str(a.decode().removesuffix("\n")) for a in s]
+    @staticmethod
+    def run_command(cmds: List[str],
+                    root: bool,
+                    cwd: str="") -> Tuple[bool, List[str]]:
+        """
+        :param cmds: list of strings which is a single command
+        :param root: if true the command will be executed as root 
+        :param cwd: current working dir 
+        """
+        s = []
+        try:
+            for line in NanoBench.stream_command(cmds, root, cwd):
+                s.append(line)
+        except subprocess.CalledProcessError:
+            print("command failed")
+            print("\n".join(s))
+            return False, []
+        return True, s
 
-            # filter a few things
-            s = [a for a in s if not "Note:" in a]
-            return True, s
+    @staticmethod
+    def expand_asm(code: str) -> str:
+        """
+        expands the `|N` nop shortcuts of nanoBench and wraps `code` into
+        the syntax directives.
+        :param code: valid assembly string
+        :return the assembly exactly as it is passed to `as`
+        """
+        if '|' in code:
+            code = code.replace('|15', '.byte 0x66,0x66,0x66,0x66,0x66,'
+                '0x66,0x2e,0x0f,0x1f,0x84,0x00,0x00,0x00,0x00,0x00;')
+            code = code.replace('|14', '.byte 0x66,0x66,0x66,0x66,0x66,'
+                '0x2e,0x0f,0x1f,0x84,0x00,0x00,0x00,0x00,0x00;')
+            code = code.replace('|13', '.byte 0x66,0x66,0x66,0x66,0x2e,'
+                '0x0f,0x1f,0x84,0x00,0x00,0x00,0x00,0x00;')
+            code = code.replace('|12', '.byte 0x66,0x66,0x66,0x2e,0x0f,'
+                '0x1f,0x84,0x00,0x00,0x00,0x00,0x00;')
+            code = code.replace('|11', '.byte 0x66,0x66,0x2e,0x0f,0x1f,'
+                '0x84,0x00,0x00,0x00,0x00,0x00;')
+            code = code.replace('|10', '.byte 0x66,0x2e,0x0f,0x1f,0x84,'
+                '0x00,0x00,0x00,0x00,0x00;')
+            code = code.replace('|9', '.byte 0x66,0x0f,0x1f,0x84,0x00,'
+                '0x00,0x00,0x00,0x00;')
+            code = code.replace('|8', '.byte 0x0f,0x1f,0x84,0x00,0x00,'
+                '0x00,0x00,0x00;')
+            code = code.replace('|7', '.byte 0x0f,0x1f,0x80,0x00,0x00,'
+                '0x00,0x00;')
+            code = code.replace('|6', '.byte 0x66,0x0f,0x1f,0x44,0x00,'
+                '0x00;')
+            code = code.replace('|5', '.byte 0x0f,0x1f,0x44,0x00,0x00;')
+            code = code.replace('|4', '.byte 0x0f,0x1f,0x40,0x00;')
+            code = code.replace('|3', '.byte 0x0f,0x1f,0x00;')
+            code = code.replace('|2', '.byte 0x66,0x90;')
+            code = code.replace('|1', 'nop;')
+            code = re.sub(r'(\d*)\*\|(.*?)\|',
+                lambda m: int(m.group(1)) * (m.group(2) + ';'), code)
+
+        return '.intel_syntax noprefix;' + code + ';1:;.att_syntax prefix\n'
 
     @staticmethod
     def assemble(code: str,
                  obj_file: str,
-                 asm_file: str = '/tmp/ramdisk/asm.s'):
+                 asm_file: Union[str, None] = None):
         """
         needs `as`
 
         write `code` into `asm_file` and the  assembles the given `asm_file`
         to `obj_file`.
 
+        :param asm_file: defaults to a unique temporary file, which is
+            removed afterwards.
         :return True: if everything is ok
                 False: on error
         """
+        if asm_file is None:
+            with default_workspace().files(".s") as (tmp_file,):
+                return NanoBench.assemble(code, obj_file, tmp_file)
+
         try:
-            if '|' in code:
-                code = code.replace('|15', '.byte 0x66,0x66,0x66,0x66,0x66,'
-                    '0x66,0x2e,0x0f,0x1f,0x84,0x00,0x00,0x00,0x00,0x00;')
-                code = code.replace('|14', '.byte 0x66,0x66,0x66,0x66,0x66,'
-                    '0x2e,0x0f,0x1f,0x84,0x00,0x00,0x00,0x00,0x00;')
-                code = code.replace('|13', '.byte 0x66,0x66,0x66,0x66,0x2e,'
-                    '0x0f,0x1f,0x84,0x00,0x00,0x00,0x00,0x00;')
-                code = code.replace('|12', '.byte 0x66,0x66,0x66,0x2e,0x0f,'
-                    '0x1f,0x84,0x00,0x00,0x00,0x00,0x00;')
-                code = code.replace('|11', '.byte 0x66,0x66,0x2e,0x0f,0x1f,'
-                    '0x84,0x00,0x00,0x00,0x00,0x00;')
-                code = code.replace('|10', '.byte 0x66,0x2e,0x0f,0x1f,0x84,'
-                    '0x00,0x00,0x00,0x00,0x00;')
-                code = code.replace('|9', '.byte 0x66,0x0f,0x1f,0x84,0x00,'
-                    '0x00,0x00,0x00,0x00;')
-                code = code.replace('|8', '.byte 0x0f,0x1f,0x84,0x00,0x00,'
-                    '0x00,0x00,0x00;')
-                code = code.replace('|7', '.byte 0x0f,0x1f,0x80,0x00,0x00,'
-                    '0x00,0x00;')
-                code = code.replace('|6', '.byte 0x66,0x0f,0x1f,0x44,0x00,'
-                    '0x00;')
-                code = code.replace('|5', '.byte 0x0f,0x1f,0x44,0x00,0x00;')
-                code = code.replace('|4', '.byte 0x0f,0x1f,0x40,0x00;')
-                code = code.replace('|3', '.byte 0x0f,0x1f,0x00;')
-                code = code.replace('|2', '.byte 0x66,0x90;')
-                code = code.replace('|1', 'nop;')
-                code = re.sub(r'(\d*)\*\|(.*?)\|',
-                    lambda m: int(m.group(1)) * (m.group(2) + ';'), code)
-
-            code = '.intel_syntax noprefix;' + code + ';1:;.att_syntax prefix\n'
+            code = NanoBench.expand_asm(code)
             with open(asm_file, 'w', encoding="utf-8") as f:
                 f.write(code)
             subprocess.check_call(['as', asm_file, '-o', obj_file])
@@ -283,23 +463,146 @@ class NanoBench:
                          bin_file: Union[str, None] = None) -> bool:
         """
         :param target_file:
-        :param asm:
+        :param asm: is served from the store of already assembled code, see
+            `assemble_bytes()`
         :param obj_file:
         :param bin_file
         :return: True/False on success/failure
         """
         if asm:
-            obj_file = '/tmp/ramdisk/tmp.o'
-            NanoBench.assemble(asm, obj_file)
-        if obj_file is not None:
-            NanoBench.objcopy(obj_file, target_file)
+            data = NanoBench.assemble_bytes(asm)
+            if data is None:
+                return False
+            with open(target_file, 'wb') as f:
+                f.write(data)
             return True
+        if obj_file is not None:
+            return NanoBench.objcopy(obj_file, target_file)
         if bin_file is not None:
             copyfile(bin_file, target_file)
             return True
 
         return False
 
+    @staticmethod
+    def assemble_bytes(asm: str) -> Union[bytes, None]:
+        """
+        `as` and `objcopy` are only called if the expanded code (see
+        `expand_asm()`) is not already in the binary cache.
+        :param asm: valid assembly string
+        :return the raw machine code of `asm` or None on error
+        """
+        cache = binary_cache()
+        code = NanoBench.expand_asm(asm)
+        data = cache.get(code)
+        if data is not None:
+            return data
+
+        with default_workspace().files(".o", ".bin") as (obj_file, bin_file):
+            if not NanoBench.assemble(asm, obj_file) or \
+                    not NanoBench.objcopy(obj_file, bin_file):
+                return None
+            with open(bin_file, 'rb') as f:
+                data = f.read()
+        cache.put(code, data)
+        return data
+
+    @staticmethod
+    def read_sections(obj_file: str) -> Dict[str, bytes]:
+        """
+        minimal ELF64 reader
+        :param obj_file: object file created by `as`
+        :return mapping of section names to their content
+        """
+        with open(obj_file, 'rb') as f:
+            data = f.read()
+        if data[:4] != b'\x7fELF' or data[4] != 2:
+            raise ValueError("only ELF64 object files are supported")
+
+        shoff, = struct.unpack_from('<Q', data, 0x28)
+        shentsize, shnum, shstrndx = struct.unpack_from('<HHH', data, 0x3A)
+        headers = []
+        for i in range(shnum):
+            # sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size
+            name, typ, _, _, offset, size = struct.unpack_from(
+                '<IIQQQQ', data, shoff + i * shentsize)
+            headers.append((name, typ, offset, size))
+
+        _, _, stroff, strsize = headers[shstrndx]
+        strtab = data[stroff:stroff + strsize]
+        ret = {}
+        for name, typ, offset, size in headers:
+            name = strtab[name:strtab.index(b'\0', name)].decode()
+            # SHT_NOBITS has no content in the file
+            ret[name] = b'\0' * size if typ == 8 else data[offset:offset + size]
+        return ret
+
+    @staticmethod
+    def _assemble_batch(codes: List[str],
+                        workspace: Workspace) -> List[Union[bytes, None]]:
+        """
+        assembles all `codes` with a single `as` invocation, each one in its
+        own section. If this fails, the batch is split in halves until the
+        failing code is isolated.
+        :param codes: expanded assembly strings, see `expand_asm()`
+        :param workspace: for the temporary files
+        :return the machine code for each code or None on error
+        """
+        with workspace.files(".s", ".o") as (asm_file, obj_file):
+            with open(asm_file, 'w', encoding="utf-8") as f:
+                for i, code in enumerate(codes):
+                    f.write(f'.section .text.nb{i},"ax",@progbits\n')
+                    f.write(code)
+            with Popen(['as', asm_file, '-o', obj_file], stdout=DEVNULL,
+                       stderr=PIPE if len(codes) > 1 else None) as p:
+                p.communicate()
+
+            if p.returncode == 0:
+                sections = NanoBench.read_sections(obj_file)
+                return [sections[f'.text.nb{i}'] for i in range(len(codes))]
+
+        if len(codes) == 1:
+            sys.stderr.write("Error (assemble): " + codes[0])
+            return [None]
+
+        mid = len(codes) // 2
+        return NanoBench._assemble_batch(codes[:mid], workspace) + \
+            NanoBench._assemble_batch(codes[mid:], workspace)
+
+    @staticmethod
+    def assemble_many(snippets: List[str],
+                      workspace: Union[Workspace, None] = None,
+                      batch_size: int = 4096) -> List[Union[bytes, None]]:
+        """
+        batch version of `assemble_bytes()`. All snippets which are not
+        already in the binary cache are assembled with a single `as`
+        invocation per `batch_size` snippets and the machine code is sliced
+        out of the object file, so no `objcopy` is needed.
+
+        :param snippets: list of valid assembly strings
+        :param workspace: for the temporary files, defaults to the process
+            wide workspace.
+        :param batch_size: maximal number of snippets per `as` invocation
+        :return the machine code for each snippet or None on error
+        """
+        if workspace is None:
+            workspace = default_workspace()
+        cache = binary_cache()
+        codes = [NanoBench.expand_asm(asm) for asm in snippets]
+        ret = [cache.get(code) for code in codes]
+
+        missing = sorted({code for code, data in zip(codes, ret)
+                          if data is None})
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i:i + batch_size]
+            for code, data in zip(batch, NanoBench._assemble_batch(batch,
+                                                                   workspace)):
+                if data is not None:
+                    cache.put(code, data)
+
+        return [data if data is not None else cache.get(code)
+                for code, data in zip(codes, ret)]
+
     @staticmethod
     def getR14Size() -> int:
         """
@@ -313,6 +616,16 @@ class NanoBench:
                 NanoBench.getR14Size.r14Size = mb * 1024 * 1024
         return NanoBench.getR14Size.r14Size
 
+    def r14_size(self, kernel: bool=False) -> int:
+        """
+        :param kernel: see `run()`
+        :return the number of bytes which can be used from r14 upwards. In
+            kernel mode it is read from the module, see `getR14Size()`.
+        """
+        if kernel or self.kernel_mode:
+            return NanoBench.getR14Size()
+        return NanoBench.USER_R14_SIZE
+
     @staticmethod
     def getAddress(reg) -> str:
         """ Returns the address that is stored in R14, RDI, RSI, RBP, or RSP 
@@ -364,127 +677,665 @@ class NanoBench:
 
     def prefix(self) -> bool:
         """
-        TODO describe
-        :return 
+        prepares the system for measurements, this is the python equivalent of
+        the setup `nanoBench.sh` does before each benchmark:
+            - allow `rdpmc` from user space
+            - load the `msr` kernel module
+            - (temporarily) unload the watchdog modules
+            - disable the NMI watchdog
+        The previous state is saved, such that `postfix()` can restore it.
+        :return true on success
         """
         # TODO check if atom/core
         self.prev_rdpmc = NanoBench.read_file(
-            filename="/sys/bus/event_source/devices/cpu", root=True)
-        NanoBench.write_file(filename="/sys/bus/event_source/devices/cpu",
-                             content="2", root=True)
+            filename=RDPMC_FILE, root=True).strip()
+        NanoBench.write_file(filename=RDPMC_FILE, content="2", root=True)
 
-        NanoBench.run_command(["modprobe", "--first-time" 'msr'], root=True)
+        # `--first-time` fails if the module is already loaded, hence
+        # success means we loaded it and must unload it in `postfix()`
+        self.msr_loaded, _ = NanoBench.run_command(
+            ["modprobe", "--first-time", "msr"], root=True)
 
         # (Temporarily) disable watchdogs, see https://github.com/obilaniu/libpfc
-        NanoBench.run_command(["modprobe", "--first-time", "-r", "iTCO_wdt"],
-                              root=True)
-        NanoBench.run_command(["modprobe", "--first-time", "-r",
-                               "iTCO_vendor_support"],  root=True)
+        self.removed_modules = []
+        for module in ["iTCO_wdt", "iTCO_vendor_support"]:
+            b, _ = NanoBench.run_command(
+                ["modprobe", "--first-time", "-r", module], root=True)
+            if b:
+                self.removed_modules.append(module)
 
         self.prev_nmi_watchdog = NanoBench.read_file(
-            filename="/proc/sys/kernel/nmi_watchdog", root=True)
-        NanoBench.write_file(filename="/proc/sys/kernel/nmi_watchdog",
-                             content="0", root=True)
+            filename=NMI_WATCHDOG_FILE, root=True).strip()
+        if self.prev_nmi_watchdog != "0":
+            NanoBench.write_file(filename=NMI_WATCHDOG_FILE, content="0",
+                                 root=True)
         return True
 
-    def postfix(self):
+    def postfix(self) -> bool:
         """
-        TODO describe
-        :return 
+        restores the system state saved by `prefix()`.
+        :return true on success
         """
-        if self.prev_nmi_watchdog != 0:
-            NanoBench.write_file(filename="/proc/sys/kernel/nmi_watchdog",
+        if self.prev_nmi_watchdog is not None and self.prev_nmi_watchdog != "0":
+            NanoBench.write_file(filename=NMI_WATCHDOG_FILE,
                                  content=self.prev_nmi_watchdog, root=True)
+        self.prev_nmi_watchdog = None
+
+        for module in self.removed_modules:
+            NanoBench.run_command(["modprobe", module], root=True)
+        self.removed_modules = []
 
-        NanoBench.write_file(filename="/sys/bus/event_source/devices/cpu",
-                             content=self.prev_rdpmc, root=True)
+        if self.msr_loaded:
+            NanoBench.run_command(["modprobe", "-r", "msr"], root=True)
+        self.msr_loaded = False
+
+        if self.prev_rdpmc is not None:
+            NanoBench.write_file(filename=RDPMC_FILE,
+                                 content=self.prev_rdpmc, root=True)
+        self.prev_rdpmc = None
         return True
 
-    def run(self, asm: str, kernel: bool=False) -> bool:
+    @contextmanager
+    def session(self):
         """
-        :param asm: valid assembly string
-        :return 
+        prepares the system once via `prefix()` and keeps it prepared until
+        the context is left. All `run()` calls within the session skip the
+        per benchmark setup of `nanoBench.sh`. The system state is restored
+        on exit, on exceptions and at interpreter shutdown.
+
+        Usage:
+            with n.session():
+                for s in snippets:
+                    n.run(s)
         """
-        sasm = asm.split(";")
-        sasm, init_asm = Asm.parse(sasm)
-        sasm = "; ".join(sasm)
-
-        cwd = "./deps/nanoBench/"
-        cmd = ["bash"]
-        cmd.append("nanoBench.sh")
-        cmd.append("-asm")
-        cmd.append(sasm)
-
-        if len(init_asm) > 0:
-            cmd.append("-asm_init")
-            cmd.append(init_asm)
-
-        # add config file
-        assert self._config
-        cmd.append("-config")
-        cmd.append(self._config)
+        if self._session:
+            # nested sessions reuse the outer one
+            yield self
+            return
 
+        self._session = True
+        atexit.register(self._end_session)
+        try:
+            self.prefix()
+            yield self
+        finally:
+            atexit.unregister(self._end_session)
+            self._end_session()
+
+    def _end_session(self):
+        """ leaves the current session and restores the system state """
+        if self._session:
+            self._session = False
+            self.postfix()
+
+    def _flags(self, kernel: bool=False) -> List[str]:
+        """
+        :param kernel: if true, also add the flags only supported by the
+            kernel version of nanoBench.
+        :return the nanoBench command line flags for the currently set
+            options.
+        """
+        cmd = []
         if self._verbose:
-            cmd += ["-verbose"]
+            cmd.append("-verbose")
         # note supported by user
-        if kernel:
-            if self._remove_empty_events: cmd += "-remove_empty_events"
+        if kernel and self._remove_empty_events:
+            cmd.append("-remove_empty_events")
 
         if self._no_mem:
-            cmd += "-no_mem"
+            cmd.append("-no_mem")
         if self._range:
-            cmd += "-range"
+            cmd.append("-range")
         if self._max:
-            cmd += "-max"
+            cmd.append("-max")
         if self._min:
-            cmd += "-min"
+            cmd.append("-min")
         if self._median:
-            cmd += "-median"
+            cmd.append("-median")
         if self._avg:
-            cmd += "-avg"
+            cmd.append("-avg")
         if self._alignment_offset:
-            cmd += "-alignment_offset="+str(self._alignment_offset)
+            cmd.append("-alignment_offset="+str(self._alignment_offset))
         if self._initial_warm_up_count:
-            cmd += "-initial_warm_up_count="+str(self._initial_warm_up_count)
+            cmd.append("-initial_warm_up_count="+
+                       str(self._initial_warm_up_count))
         if self._warm_up_count:
-            cmd += "-warm_up_count="+str(self._warm_up_count)
+            cmd.append("-warm_up_count="+str(self._warm_up_count))
         if self._n_measurements:
-            cmd += "-n_measurements="+str(self._n_measurements)
+            cmd.append("-n_measurements="+str(self._n_measurements))
         if self._loop_count:
-            cmd += "-loop_count="+str(self._loop_count)
+            cmd.append("-loop_count="+str(self._loop_count))
         if self._unroll_count:
-            cmd += "-unroll_count="+str(self._unroll_count)
+            cmd.append("-unroll_count="+str(self._unroll_count))
         if self._cpu != -1:
-            cmd += "-cpu="+str(self._cpu)
+            cmd.append("-cpu="+str(self._cpu))
         if self._end_to_end:
-            cmd += "-end_to_end"
+            cmd.append("-end_to_end")
         if self._os:
-            cmd += "-os"
+            cmd.append("-os")
         if self._usr:
-            cmd += "-usr"
+            cmd.append("-usr")
         if self._no_normalization:
-            cmd += "-no_normalization"
+            cmd.append("-no_normalization")
         if self._df:
-            cmd += "-df"
+            cmd.append("-df")
         if self._fixed_counters:
-            cmd += "-fixed_counters"
+            cmd.append("-fixed_counters")
         if self._basic_mode:
-            cmd += "-basic_mode"
+            cmd.append("-basic_mode")
+        return cmd
 
-        b, s = NanoBench.run_command(cmd, root=True, cwd=cwd)
-        if not b:
-            return False
+    def _kernel_options(self) -> Dict[str, str]:
+        """
+        :return the currently set options as a mapping from the sysfs file
+            of the nanoBench kernel module to its value.
+        """
+        options = {}
+        if self._verbose:
+            options["verbose"] = "1"
+        if self._no_mem:
+            options["no_mem"] = "1"
+        if self._range:
+            options["output_range"] = "1"
+        if self._max:
+            options["agg"] = "max"
+        if self._min:
+            options["agg"] = "min"
+        if self._median:
+            options["agg"] = "med"
+        if self._avg:
+            options["agg"] = "avg"
+        if self._alignment_offset:
+            options["alignment_offset"] = str(self._alignment_offset)
+        if self._initial_warm_up_count:
+            options["initial_warm_up"] = str(self._initial_warm_up_count)
+        if self._warm_up_count:
+            options["warm_up"] = str(self._warm_up_count)
+        if self._n_measurements:
+            options["n_measurements"] = str(self._n_measurements)
+        if self._loop_count:
+            options["loop_count"] = str(self._loop_count)
+        if self._unroll_count:
+            options["unroll_count"] = str(self._unroll_count)
+        if self._end_to_end:
+            options["end_to_end"] = "1"
+        if self._no_normalization:
+            options["no_normalization"] = "1"
+        if self._df:
+            options["drain_frontend"] = "1"
+        if self._fixed_counters:
+            options["fixed_counters"] = "1"
+        if self._basic_mode:
+            options["basic_mode"] = "1"
+        return options
+
+    def _kernel(self) -> KernelBackend:
+        """
+        :return the kernel backend, created on first use
+        """
+        if self._kernel_backend is None:
+            self._kernel_backend = KernelBackend(workspace=self._workspace)
+        return self._kernel_backend
+
+    def _run_kernel(self, sasm: str, init_asm: str,
+                    options: Dict[str, str],
+                    config: str) -> Union[List[str], None]:
+        """
+        runs a single benchmark via the kernel module.
+        :param sasm: the (already parsed) benchmark code
+        :param init_asm: the init code for the benchmark
+        :param options: see `_kernel_options()`
+        :param config: the config of the pass, see `events()`
+        :return the output lines of the kernel module or None on error
+        """
+        code = NanoBench.assemble_bytes(sasm)
+        if code is None:
+            return None
+        init = b""
+        if len(init_asm) > 0:
+            init = NanoBench.assemble_bytes(init_asm)
+            if init is None:
+                return None
+
+        config = os.path.join(NANOBENCH_DIR, config)
+        return self._kernel().run(code, init, config, options, self._cpu)
+
+    def _command(self, sasm: str, init_asm: str,
+                 flags: List[str], config: str, code_file: str,
+                 init_file: str) -> Union[List[str], None]:
+        """
+        :param sasm: the (already parsed) benchmark code
+        :param init_asm: the init code for the benchmark
+        :param flags: the nanoBench flags, see `_flags()`
+        :param config: the config of the pass, see `events()`
+        :param code_file: the file the code is written to in a session
+        :param init_file: the file the init code is written to in a session
+        :return the command to execute. Outside of a session this is a call
+            to `nanoBench.sh`. Within a session the system is already
+            prepared, so the code is assembled here and the `nanoBench`
+            binary is called directly. None on error.
+        """
+        if not self._session:
+            cmd = ["bash", "nanoBench.sh", "-asm", sasm]
+            if len(init_asm) > 0:
+                cmd += ["-asm_init", init_asm]
+        else:
+            if not NanoBench.createBinaryFile(code_file, asm=sasm):
+                return None
+            cmd = ["./user/nanoBench", "-code", code_file]
+            if len(init_asm) > 0:
+                if not NanoBench.createBinaryFile(init_file, asm=init_asm):
+                    return None
+                cmd += ["-code_init", init_file]
+
+        # add config file
+        cmd += ["-config", config]
+        return cmd + flags
+
+    @staticmethod
+    def _split(snippet: Union[str, Tuple[str, str]]) -> Tuple[str, str]:
+        """
+        :param snippet: valid assembly string or (assembly string, init
+            code). Without an explicit init code all memory operands are
+            rewritten and the init code is generated, see `Asm.parse()`.
+        :return (benchmark code, init code)
+        """
+        if isinstance(snippet, tuple):
+            return snippet
+        sasm, init_asm = Asm.parse(snippet.split(";"))
+        return "; ".join(sasm), init_asm
+
+    def _run(self, asm: Union[str, Tuple[str, str]],
+             flags: Union[List[str], Dict[str, str]],
+             kernel: bool=False,
+             cancel: Union[threading.Event, None]=None,
+             context: Union[str, None]=None) -> Union[BenchResult, None]:
+        """
+        runs a single benchmark with precomputed flags.
+        :param asm: valid assembly string or (assembly string, init code),
+            see `_split()`
+        :param flags: the nanoBench flags, see `_flags()`, or in kernel mode
+            the module options, see `_kernel_options()`
+        :param kernel: if true, the kernel module is used.
+        :param cancel: see `stream_command()`
+        :param context: see `_cache_context()`
+        :return the measured result or None on error
+        """
+        sasm, init_asm = NanoBench._split(asm)
+
+        key = None
+        if context is not None:
+            key = ResultCache.key(sasm, init_asm, context)
+            if not self._force:
+                ret = self._result_cache.get(key)
+                if ret is not None:
+                    return ret
+
+        if self._adaptive is not None:
+            ret = self._measure_adaptive(sasm, init_asm, flags, kernel, cancel)
+        else:
+            ret = self._measure(sasm, init_asm, flags, kernel, cancel)
+        if key is not None and ret is not None:
+            self._result_cache.put(key, ret)
+        return ret
+
+    def _measure(self, sasm: str, init_asm: str,
+                 flags: Union[List[str], Dict[str, str]],
+                 kernel: bool=False,
+                 cancel: Union[threading.Event, None]=None,
+                 parse: Union[Callable[[Iterable[str]], Any], None]=None):
+        """
+        :param sasm: the (already parsed) benchmark code
+        :param init_asm: the init code for the benchmark
+        :param flags: see `_run()`
+        :param kernel: see `_run()`
+        :param cancel: see `_run()`
+        :param parse: see `_parse()`
+        :return the measured result or None on error. With more than one
+            pass (see `events()`) the results of all passes are merged.
+        """
+        ret = None
+        for config in self._configs:
+            r = self._measure_pass(sasm, init_asm, flags, kernel, cancel,
+                                   parse, config)
+            if r is None:
+                return None
+            ret = r if ret is None else ret.merge(r)
+        return ret
+
+    def _measure_pass(self, sasm: str, init_asm: str,
+                      flags: Union[List[str], Dict[str, str]],
+                      kernel: bool,
+                      cancel: Union[threading.Event, None],
+                      parse: Union[Callable[[Iterable[str]], Any], None],
+                      config: str):
+        """
+        runs nanoBench once with the config `config`, see `_measure()`
+        """
+        if kernel:
+            s = self._run_kernel(sasm, init_asm, flags, config)
+            if s is None:
+                return None
+            return self._parse(s, parse)
+
+        with self._workspace.files(".bin", ".bin") as files:
+            cmd = self._command(sasm, init_asm, flags, config, *files)
+            if cmd is None:
+                return None
+
+            # the output is parsed while nanoBench is still running
+            s = NanoBench.stream_command(cmd, root=True, cwd=NANOBENCH_DIR,
+                                         timeout=self._timeout, cancel=cancel)
+            return self._parse(s, parse)
+
+    def _rounds(self, sasm: str, init_asm: str,
+                flags: Union[List[str], Dict[str, str]],
+                kernel: bool,
+                cancel: Union[threading.Event, None],
+                done: Callable[[Dict[str, array], int], bool]
+                ) -> Union[Tuple[Dict[str, array], int], None]:
+        """
+        repeats `_measure()` until `done` returns true.
+        :param done: called after each round with the samples so far and
+            the number of rounds
+        :return (event -> value of each round, number of rounds) or None on
+            error. Events missing in a round (e.g. due to
+            `remove_empty_events()`) count as zero.
+        """
+        samples: Dict[str, array] = {}
+        rounds = 0
+        while True:
+            ret = self._measure(sasm, init_asm, flags, kernel, cancel)
+            if ret is None:
+                return None
+            for name in ret.names:
+                if name not in samples:
+                    samples[name] = array('d', [0.0] * rounds)
+            for name, values in samples.items():
+                values.append(ret.get(name, 0.0))
+            rounds += 1
+            if done(samples, rounds):
+                return samples, rounds
+
+    def _measure_adaptive(self, sasm: str, init_asm: str,
+                          flags: Union[List[str], Dict[str, str]],
+                          kernel: bool=False,
+                          cancel: Union[threading.Event, None]=None
+                          ) -> Union[BenchResult, None]:
+        """
+        repeats `_measure()` until the confidence interval of the mean of
+        every selected event is within the tolerance, see `adaptive()`.
+        :return the mean over all rounds or None on error
+        """
+        rel_ci, max_time, patterns, min_rounds, max_rounds = self._adaptive
+        start = time.monotonic()
+
+        def done(samples: Dict[str, array], rounds: int) -> bool:
+            if rounds >= max_rounds:
+                return True
+            if max_time is not None and time.monotonic() - start >= max_time:
+                return True
+            if rounds < min_rounds:
+                return False
+            names = samples.keys() if patterns is None else \
+                [n for n in samples
+                 if any(fnmatch.fnmatchcase(n, p) for p in patterns)]
+            return all(converged(samples[n], rel_ci) for n in names)
+
+        ret = self._rounds(sasm, init_asm, flags, kernel, cancel, done)
+        if ret is None:
+            return None
+        samples, rounds = ret
+        means = [mean_ci(values)[0] for values in samples.values()]
+        return BenchResult(samples.keys(), means, rounds)
+
+    def _parse(self, s: Iterable[str],
+               parse: Union[Callable[[Iterable[str]], Any], None]=None):
+        """
+        :param s: the output lines of nanoBench
+        :param parse: parses `s`, defaults to a `BenchResult`
+        :return the parsed result or None if the command failed
+        """
+        try:
+            if parse is not None:
+                return parse(s)
+            return NanoBench._parse_user_nanobench_output(
+                s, self._remove_empty_events)
+        except (subprocess.CalledProcessError,
+                subprocess.TimeoutExpired, ValueError) as e:
+            sys.stderr.write("Error (run): " + str(e) + "\n")
+            return None
+
+    def _prepare(self, kernel: bool) -> Union[List[str], Dict[str, str]]:
+        """
+        :param kernel: if true, the kernel module is used.
+        :return the flags or kernel options for `_run()`
+        """
+        assert self._config
+        if kernel:
+            return self._kernel_options()
+        return self._flags()
 
-        # TODO the verbose and range flag do alter the output format,
-        data = NanoBench._parse_user_nanobench_output(s, self._remove_empty_events)
-        pprint.pprint(data)
+    def _cache_context(self, flags: Union[List[str], Dict[str, str]],
+                       kernel: bool) -> Union[str, None]:
+        """
+        :param flags: see `_prepare()`
+        :param kernel: if true, the kernel module is used.
+        :return the part of the result cache key shared by all benchmarks
+            with the current options, or None if no cache is used.
+        """
+        if self._result_cache is None:
+            return None
+        if isinstance(flags, list):
+            # the result does not depend on the core, workers pinned to
+            # different cores share their results. The machine fingerprint
+            # covers the hardware, the config the core type.
+            flags = [f for f in flags if not f.startswith("-cpu=")]
+        options = {"flags": flags, "kernel": kernel,
+                   "remove_empty_events": self._remove_empty_events,
+                   "adaptive": self._adaptive}
+        if self._event_groups is not None:
+            # the pass configs are private files, their events are the key
+            options["passes"] = [[e.line() for e in g]
+                                 for g in self._event_groups]
+        config = os.path.join(NANOBENCH_DIR, self._full_config)
+        return self._result_cache.context(options, config)
+
+    def run(self, asm: str, kernel: bool=False,
+            cancel: Union[threading.Event, None]=None,
+            init: Union[str, None]=None) -> Union[BenchResult, None]:
+        """
+        :param asm: valid assembly string
+        :param kernel: if true (or `kernel_mode` is set), the benchmark is
+            executed by directly talking to the nanoBench kernel module.
+        :param cancel: if set, the running benchmark is killed and
+            `CancelledError` is raised.
+        :param init: if set, the init code which runs before the benchmark.
+            The memory operands of `asm` are then used as they are, e.g.
+            to address the buffer in r14. Otherwise every memory operand
+            gets its own register, see `Asm.parse()`.
+        :return the measured result or None on error or timeout
+        """
+        kernel = kernel or self.kernel_mode
+        if not self._supported(asm):
+            return None
+        flags = self._prepare(kernel)
+        context = self._cache_context(flags, kernel)
+        snippet = asm if init is None else (asm, init)
+        return self._run(snippet, flags, kernel, cancel, context)
+
+    def _supported(self, asm: str) -> bool:
+        """
+        :param asm: valid assembly string
+        :return false if validation is enabled (see `validate()`) and `asm`
+            uses an instruction the cpu does not support
+        """
+        if self._validator is None:
+            return True
+        unsupported = self._validator.check(asm)
+        if unsupported:
+            sys.stderr.write("Error (validate): unsupported instructions: " +
+                             "; ".join(unsupported) + "\n")
+            return False
         return True
 
+    def sample(self, asm: str, repetitions: int=100, kernel: bool=False,
+               cancel: Union[threading.Event, None]=None,
+               init: Union[str, None]=None) -> Union[Samples, None]:
+        """
+        measures `asm` once with `repetitions` measurements and keeps the
+        value of every measurement (printed with `-verbose`), so all
+        statistics can be computed from one call instead of one run per
+        aggregate flag. The result cache is not used.
+        :param asm: valid assembly string
+        :param repetitions: number of samples per event
+        :param kernel: see `run()`
+        :param cancel: see `run()`
+        :param init: see `run()`
+        :return the samples or None on error
+        """
+        kernel = kernel or self.kernel_mode
+        prev = self._n_measurements, self._verbose
+        self._n_measurements, self._verbose = repetitions, True
+        try:
+            flags = self._prepare(kernel)
+        finally:
+            self._n_measurements, self._verbose = prev
+
+        # nanoBench divides by the number of executions of the code
+        norm = 1.0
+        if not self._no_normalization:
+            norm = (self._unroll_count or NanoBench.DEFAULT_UNROLL_COUNT) * \
+                max(self._loop_count, 1)
+
+        sasm, init_asm = NanoBench._split(asm if init is None
+                                          else (asm, init))
+        return self._measure(sasm, init_asm, flags, kernel, cancel,
+                             lambda s: Samples.parse(
+                                 s, norm, self._remove_empty_events))
+
+    def run_many(self, snippets: Iterable[Union[str, Tuple[str, str]]],
+                 kernel: bool=False,
+                 cancel: Union[threading.Event, None]=None
+                 ) -> Iterator[Union[BenchResult, None]]:
+        """
+        benchmarks all `snippets` with the same options. The system is
+        prepared only once (see `session()`) and the flags and config are
+        computed only once for the whole batch. Results are yielded in the
+        order of `snippets` as soon as they are available, so the batch
+        does not need to be held in memory. If validation is enabled (see
+        `validate()`), unsupported snippets are neither assembled nor run.
+
+        :param snippets: iterable of valid assembly strings or of
+            (assembly string, init code), see the `init` of `run()`
+        :param kernel: see `run()`
+        :param cancel: see `run()`
+        :return generator over the results of `run()` for each snippet
+        """
+        kernel = kernel or self.kernel_mode
+        flags = self._prepare(kernel)
+        context = self._cache_context(flags, kernel)
+        it = iter(snippets)
+        with self.session():
+            while True:
+                batch = list(itertools.islice(it, NanoBench.BATCH_SIZE))
+                if not batch:
+                    return
+
+                ok = self._validator.filter(
+                    s if isinstance(s, str) else s[0] for s in batch) \
+                    if self._validator is not None else [True] * len(batch)
+
+                # fills the binary cache with a single `as` call per batch
+                codes = []
+                for asm in itertools.compress(batch, ok):
+                    sasm, init_asm = NanoBench._split(asm)
+                    codes.append(sasm)
+                    if len(init_asm) > 0:
+                        codes.append(init_asm)
+                NanoBench.assemble_many(codes)
+
+                for asm, supported in zip(batch, ok):
+                    yield self._run(asm, flags, kernel, cancel, context) \
+                        if supported else None
+
+    def latency_throughput(self, instrs: Iterable[str], chains: int=8,
+                           kernel: bool=False,
+                           cancel: Union[threading.Event, None]=None,
+                           scheduler=None
+                           ) -> Iterator[Tuple[str, Union[BenchResult, None],
+                                               Union[BenchResult, None]]]:
+        """
+        measures the latency and the reciprocal throughput of each
+        instruction. The dependency chained and the independent variant of
+        each instruction are generated by `Asm.latency()` and
+        `Asm.throughput()` and all are measured as one batch, see
+        `run_many()`.
+        :param instrs: iterable of single instructions, e.g. `add rax, rbx`
+        :param chains: number of independent chains for the throughput
+        :param kernel: see `run()`
+        :param cancel: see `run()`
+        :param scheduler: if set, the batch is measured in parallel by this
+            `Scheduler` instead of `run_many()`
+        :return generator over (instruction, latency result, throughput
+            result). Both results are per instruction, None on error.
+        """
+        instrs = list(instrs)
+        variants = [Asm.throughput(instr, chains) for instr in instrs]
+        snippets = []
+        for instr, (tp, _) in zip(instrs, variants):
+            snippets += [Asm.latency(instr), tp]
+
+        # the results alternate between latency and throughput
+        results = iter(scheduler.run(snippets) if scheduler is not None
+                       else self.run_many(snippets, kernel, cancel))
+        for (instr, (_, n)), (lat, tp) in zip(zip(instrs, variants),
+                                              zip(results, results)):
+            yield instr, lat, tp / n if tp is not None else None
+
     def config(self, march: str):
         """
         :param march: must be in 
         """
         self._config = self._get_cpu_configuration_path(march)
+        self._full_config = self._config
+        self._configs = [self._config]
+        self._event_groups = None
+        self._event_selection = None
+
+    def config_index(self) -> ConfigIndex:
+        """
+        :return the parsed full config of the cpu, e.g. to validate event
+            names before a measurement.
+        """
+        return load_config(os.path.join(NANOBENCH_DIR, self._full_config))
+
+    def events(self, patterns: List[str],
+               n_counters: Union[int, None]=None) -> 'NanoBench':
+        """Only measures the events matching one of `patterns`, e.g.
+        `["UOPS_ISSUED.ANY", "UOPS_DISPATCHED_PORT.PORT_*"]`. The events
+        are packed into as few passes as the programmable counters allow.
+        Each pass gets its own config and nanoBench is run once per pass,
+        the results of all passes are merged.
+        :param patterns: event names or shell style patterns
+        :param n_counters: number of programmable counters. Defaults to the
+            number reported by the cpu `cpu()` pinned to, which differs
+            between the core types of hybrid cpus.
+        """
+        events = self.config_index().select(patterns)
+        self._event_selection = (list(patterns), n_counters)
+        if n_counters is None:
+            table = read_cpuid(self._cpu) if self._cpu != -1 else None
+            n_counters = programmable_counters(table)
+
+        self._event_groups = schedule(events, n_counters)
+        self._configs = []
+        for group in self._event_groups:
+            self._configs.append(self._workspace.file(".txt"))
+            write_config(self._configs[-1], group)
+        if self._configs:
+            self._config = self._configs[0]
+        return self
 
     def verbose(self) -> 'NanoBench':
         """Outputs the results of all performance counter readings."""
@@ -503,7 +1354,8 @@ class NanoBench:
 
     def range(self) -> 'NanoBench':
         """Outputs the range of the measured values (i.e., the minimum and 
-        the maximum).
+        the maximum). They are returned as the events `<event> [min]` and
+        `<event> [max]`, see `BenchResult.parse()`.
         """
         self._range = True
         return self
@@ -561,10 +1413,35 @@ class NanoBench:
         return self
 
     def cpu(self, cpu_cnt: int) -> 'NanoBench':
-        """ Pins the measurement thread to CPU n."""
+        """ Pins the measurement thread to CPU n. On hybrid cpus the config
+        of the core type of CPU n is selected, the events selected with
+        `events()` are selected again from it. Raises `ValueError` if one
+        of them does not exist on this core type."""
         self._cpu = cpu_cnt
+        if cpu_cnt != -1 and is_hybrid():
+            march = NanoBench._get_cpu_generation(cpu_cnt)
+            if self._full_config != self._get_cpu_configuration_path(march):
+                selection = self._event_selection
+                self.config(march)
+                if selection is not None:
+                    self.events(*selection)
         return self
 
+    def core_type(self, core_type: str) -> 'NanoBench':
+        """Pins the measurement thread to the first allowed core of the
+        given type of a hybrid cpu and selects its config, see `cpu()`.
+        Without it (or `cpu()`) the measurement is not pinned and may run
+        on either core type, while the config is the one of the core the
+        instance was created on.
+        :param core_type: `P` or `E`
+        """
+        allowed = os.sched_getaffinity(0)
+        cpus = [c for c in system_topology().of_type(core_type)
+                if c in allowed]
+        if not cpus:
+            raise ValueError(f"no {core_type}-core available")
+        return self.cpu(cpus[0])
+
     def end_to_end(self) -> 'NanoBench':
         """Do not try to remove overhead."""
         self._end_to_end = True
@@ -574,7 +1451,7 @@ class NanoBench:
         """If 1, counts events at a privilege level greater than 0. 
         NOTE: only for user
         """
-        self._user = True
+        self._usr = True
         return self
 
     def os(self) -> 'NanoBench':
@@ -612,12 +1489,61 @@ class NanoBench:
         self._basic_mode = True
         return self
 
+    def result_cache(self, cache: Union[ResultCache, None]=None,
+                     force: bool=False) -> 'NanoBench':
+        """Looks up results in a persistent cache before measuring and 
+        stores new results in it.
+        :param cache: defaults to a cache in the user cache dir
+        :param force: if true, always measure and overwrite cached results
+        """
+        self._result_cache = cache if cache is not None else ResultCache()
+        self._force = force
+        return self
+
+    def adaptive(self, rel_ci: float=0.005,
+                 max_time: Union[float, None]=None,
+                 events: Union[List[str], None]=None,
+                 min_rounds: int=3, max_rounds: int=1000) -> 'NanoBench':
+        """Repeats each measurement in rounds until the 95% confidence
+        interval of the mean of every event is within `rel_ci` of the mean.
+        The result contains the mean over all rounds and the number of
+        rounds in `BenchResult.rounds`.
+        :param rel_ci: tolerated half width of the confidence interval
+            relative to the mean
+        :param max_time: if not None, no further round is started after 
+            this many seconds
+        :param events: names or shell style patterns of the events which
+            must converge. Defaults to all events.
+        :param min_rounds: number of rounds which are always measured
+        :param max_rounds: upper limit of rounds
+        """
+        self._adaptive = (rel_ci, max_time, events, max(min_rounds, 1),
+                          max_rounds)
+        return self
+
+    def validate(self, cpu_features: Union[Features, None]=None
+                 ) -> 'NanoBench':
+        """Checks every snippet against the isa extensions of the cpu
+        before it is assembled. Unsupported snippets are not run, `run()`
+        returns None and `run_many()` yields None for them.
+        :param cpu_features: defaults to the features of the local cpu
+        """
+        self._validator = Validator(cpu_features)
+        return self
+
+    def timeout(self, seconds: Union[float, None]) -> 'NanoBench':
+        """Kills a benchmark if it runs longer than `seconds`.
+        NOTE: only for user
+        """
+        self._timeout = seconds
+        return self
+
 
 def main():
     """ just for testing """
     n = NanoBench()
     s = "ADD RAX, RBX; ADD RBX, RAX"
-    n.remove_empty_events().run(s)
+    print(n.remove_empty_events().run(s))
 
 
 if __name__ == "__main__":
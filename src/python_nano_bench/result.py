@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+compact representation of the results of a single benchmark
+"""
+
+import operator
+import sys
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+# canonical (interned) tuple of event names -> itself. All results measured
+# with the same config share the same tuple.
+_NAMES: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+# canonical tuple of event names -> {name: index}
+_INDICES: Dict[Tuple[str, ...], Dict[str, int]] = {}
+
+
+def shared_names(names: Iterable[str]) -> Tuple[str, ...]:
+    """
+    :param names: event names
+    :return the canonical tuple of `names`. Each name is interned and equal
+        lists of names return the identical tuple object.
+    """
+    t = tuple(names)
+    ret = _NAMES.get(t)
+    if ret is None:
+        ret = tuple(sys.intern(n) for n in t)
+        _NAMES[ret] = ret
+        _INDICES[ret] = {n: i for i, n in enumerate(ret)}
+    return ret
+
+
+class BenchResult:
+    """
+    the measured value of every event of a benchmark. The event names are
+    shared between all results of the same config, the values are stored in
+    a compact `array('d')`.
+    """
+    __slots__ = ("names", "values", "rounds")
+
+    def __init__(self, names: Iterable[str],
+                 values: Union[Iterable[float], array],
+                 rounds: int = 1):
+        """
+        :param names: the event names
+        :param values: the measured value for each event
+        :param rounds: number of measurement rounds the values are averaged
+            over, see `NanoBench.adaptive()`
+        """
+        self.names = shared_names(names)
+        if not isinstance(values, array):
+            values = array('d', values)
+        self.values = values
+        self.rounds = rounds
+        assert len(self.names) == len(self.values)
+
+    @staticmethod
+    def parse(lines: Iterable[str], remove_zeros: bool = False) -> 'BenchResult':
+        """
+        :param lines: nanoBench output lines of the form `event: value`,
+            or `event: value [min;max]` with `-range`. The range is
+            returned as the events `event [min]` and `event [max]`. The
+            rows of `-verbose` (`run i: ...`), lines without a colon and
+            headers without a value are skipped.
+        :param remove_zeros: if true, events with a value of zero are
+            dropped.
+        :return the parsed result. Raises `ValueError` for any other line,
+            e.g. an error message of nanoBench.
+        """
+        names: List[str] = []
+        values = array('d')
+        for line in lines:
+            name, sep, value = line.rpartition(":")
+            value = value.strip()
+            if not sep or not value or name.strip().startswith("run "):
+                continue
+            value, _, bounds = value.partition("[")
+            try:
+                d = float(value)
+                bounds = [float(b) for b in bounds.rstrip("]").split(";")] \
+                    if bounds else []
+            except ValueError:
+                bounds = None
+            if bounds is None or len(bounds) not in (0, 2):
+                raise ValueError(f"unexpected nanoBench output: {line!r}")
+            if remove_zeros and d <= 0.0:
+                continue
+            names.append(name)
+            values.append(d)
+            if bounds:
+                names += [f"{name} [min]", f"{name} [max]"]
+                values.extend(bounds)
+        return BenchResult(names, values)
+
+    def __reduce__(self):
+        # the names are shared again after unpickling
+        return BenchResult, (self.names, self.values, self.rounds)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in _INDICES[self.names]
+
+    def __getitem__(self, name: str) -> float:
+        return self.values[_INDICES[self.names][name]]
+
+    def get(self, name: str, default: Union[float, None] = None):
+        """
+        :param name: event name
+        :param default: returned if the event was not measured
+        :return the value of the event `name`
+        """
+        i = _INDICES[self.names].get(name)
+        return default if i is None else self.values[i]
+
+    def items(self) -> Iterator[Tuple[str, float]]:
+        """ :return iterator over (name, value) pairs """
+        return zip(self.names, self.values)
+
+    def to_dict(self) -> Dict[str, float]:
+        """ :return the result as a plain dictionary """
+        return dict(zip(self.names, self.values))
+
+    def merge(self, other: 'BenchResult') -> 'BenchResult':
+        """
+        :param other: the result of another pass over the same code
+        :return the events of both results. Events of `other` which are
+            already in this result (e.g. the fixed counters, which are
+            measured in every pass) are dropped.
+        """
+        extra = [(n, v) for n, v in other.items() if n not in self]
+        return BenchResult(self.names + tuple(n for n, _ in extra),
+                           self.values + array('d', (v for _, v in extra)),
+                           min(self.rounds, other.rounds))
+
+    def _apply(self, other: Union['BenchResult', float],
+               op: Callable[[float, float], float]) -> 'BenchResult':
+        """
+        applies `op` element wise.
+        :param other: either a scalar or a result with the same events
+        :param op: binary operator
+        """
+        if isinstance(other, BenchResult):
+            if other.names is not self.names and other.names != self.names:
+                raise ValueError("results contain different events")
+            values = array('d', map(op, self.values, other.values))
+        else:
+            values = array('d', (op(v, other) for v in self.values))
+        rounds = min(self.rounds, other.rounds) \
+            if isinstance(other, BenchResult) else self.rounds
+        return BenchResult(self.names, values, rounds)
+
+    def __add__(self, other):
+        return self._apply(other, operator.add)
+
+    def __sub__(self, other):
+        return self._apply(other, operator.sub)
+
+    def __mul__(self, other):
+        return self._apply(other, operator.mul)
+
+    def __truediv__(self, other):
+        return self._apply(other, operator.truediv)
+
+    __radd__ = __add__
+    __rmul__ = __mul__
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, BenchResult):
+            return NotImplemented
+        return self.names == other.names and self.values == other.values
+
+    def __repr__(self) -> str:
+        return f"BenchResult({self.to_dict()})"
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+runs batches of benchmarks in parallel, each worker process pinned to its own
+physical core. On hybrid cpus snippets can be measured on both core types at
+once, see `run_dual()`.
+"""
+
+import multiprocessing
+import multiprocessing.util
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, NamedTuple, Set, Tuple, Union
+
+from .nano_bench import NanoBench
+from .result import BenchResult
+from .topology import SYS_CPU_DIR, Topology, is_hybrid, system_topology, \
+    topology
+from .workspace import default_workspace
+
+
+def physical_cores(avoid_shared_l2: bool = False,
+                   sys_dir: str = SYS_CPU_DIR,
+                   allowed: Union[Set[int], None] = None,
+                   topo: Union[Topology, None] = None) -> List[int]:
+    """
+    selects one logical cpu per physical core, hence no two selected cpus
+    are SMT siblings.
+    :param avoid_shared_l2: if true, additionally no two selected cpus share
+        an L2 cache.
+    :param sys_dir: the sysfs cpu directory
+    :param allowed: cpus which may be selected. Defaults to the affinity of
+        the current process.
+    :param topo: defaults to the sysfs topology of `sys_dir`, see
+        `topology()`
+    :return sorted list of logical cpus
+    """
+    if allowed is None:
+        allowed = os.sched_getaffinity(0)
+    if topo is None:
+        topo = topology(sys_dir, use_cpuid=False)
+    return topo.one_per_core(allowed, ["L2"] if avoid_shared_l2 else [])
+
+
+# the benchmark instance of the current worker process
+_worker_nb: Union[NanoBench, None] = None
+
+
+def _init_worker(nb: NanoBench, cores):
+    """
+    pins the worker process to the next free core
+    :param nb: the benchmark options
+    :param cores: queue of free cores
+    """
+    global _worker_nb
+    core = cores.get()
+    os.sched_setaffinity(0, {core})
+    _worker_nb = nb.cpu(core)
+    # workers leave with `os._exit()`, which skips `weakref.finalize`, so
+    # the directories of the worker are removed by `multiprocessing`
+    for ws in (_worker_nb._workspace, default_workspace()):
+        multiprocessing.util.Finalize(None, ws.cleanup, exitpriority=0)
+
+
+def _run_snippet(asm: str) -> Union[BenchResult, None]:
+    """
+    :param asm: valid assembly string
+    :return the result of the benchmark
+    """
+    assert _worker_nb
+    return _worker_nb.run(asm)
+
+
+class Scheduler:
+    """
+    runs a batch of benchmarks in parallel on distinct physical cores. Each
+    core gets exactly one pinned worker process. On hybrid cpus all cores
+    are of the same type, see `run_dual()` to measure both.
+    NOTE: only for user, the kernel module can only measure one benchmark at
+    a time.
+    """
+
+    def __init__(self, nb: NanoBench,
+                 cores: Union[List[int], None] = None,
+                 avoid_shared_l2: bool = False,
+                 topo: Union[Topology, None] = None):
+        """
+        :param nb: the benchmark options which are used for all benchmarks
+        :param cores: the logical cpus to run on. Defaults to one cpu per
+            physical core of the core type `nb` is pinned to (see
+            `NanoBench.core_type()`), or of the P-cores if `nb` is not
+            pinned, see `physical_cores()`. Raises `ValueError` if they mix
+            core types.
+        :param avoid_shared_l2: see `physical_cores()`
+        :param topo: defaults to `system_topology()` on hybrid cpus
+        """
+        self._nb = nb
+        if topo is None and is_hybrid():
+            topo = system_topology()
+        hybrid = topo is not None and topo.is_hybrid()
+        if cores is None:
+            cores = physical_cores(avoid_shared_l2, topo=topo)
+            if hybrid:
+                # each worker selects the config of its core type, the
+                # results of different core types must not be mixed
+                core_type = topo[nb._cpu].core_type if nb._cpu != -1 \
+                    else "P"
+                cores = [c for c in cores if topo[c].core_type == core_type]
+        elif hybrid and len({topo[c].core_type for c in cores}) > 1:
+            raise ValueError("the cores mix core types, see `run_dual()`")
+        if not cores:
+            raise ValueError("no cores available")
+        self.cores = list(cores)
+
+    def run(self, snippets: Iterable[str]) -> List[Union[BenchResult, None]]:
+        """
+        :param snippets: iterable of valid assembly strings
+        :return the results of all snippets in the order of `snippets`
+        """
+        if self._nb.kernel_mode:
+            raise ValueError("the kernel mode does not support parallel runs")
+
+        ctx = multiprocessing.get_context()
+        cores = ctx.Queue()
+        for core in self.cores:
+            cores.put(core)
+
+        # the system is prepared once for all workers
+        with self._nb.session():
+            with ProcessPoolExecutor(max_workers=len(self.cores),
+                                     mp_context=ctx,
+                                     initializer=_init_worker,
+                                     initargs=(self._nb, cores)) as ex:
+                return list(ex.map(_run_snippet, snippets))
+
+
+class DualResult(NamedTuple):
+    """ the results of one snippet on both core types of a hybrid cpu """
+    p: Union[BenchResult, None]
+    e: Union[BenchResult, None]
+
+
+def dual_cores(topo: Union[Topology, None] = None,
+               allowed: Union[Set[int], None] = None) -> Tuple[int, int]:
+    """
+    :param topo: defaults to `system_topology()`
+    :param allowed: cpus which may be selected. Defaults to the affinity of
+        the current process.
+    :return (P-core, E-core), the first allowed logical cpu of each type
+    """
+    if allowed is None:
+        allowed = os.sched_getaffinity(0)
+    if topo is None:
+        topo = system_topology()
+    ret = []
+    for core_type in ("P", "E"):
+        cpus = [c for c in topo.of_type(core_type) if c in allowed]
+        if not cpus:
+            raise ValueError(f"no {core_type}-core available")
+        ret.append(cpus[0])
+    return ret[0], ret[1]
+
+
+def run_dual(nb: NanoBench, snippets: Iterable[str],
+             cores: Union[Tuple[int, int], None] = None
+             ) -> List[DualResult]:
+    """
+    measures every snippet on a P-core and on an E-core at the same time.
+    Each core type gets its own pinned worker process, which selects the
+    config of its core type (see `NanoBench.cpu()`).
+    NOTE: only for user, see `Scheduler`.
+    :param nb: the benchmark options which are used for all benchmarks
+    :param snippets: iterable of valid assembly strings
+    :param cores: (P-core, E-core), defaults to `dual_cores()`
+    :return the paired results in the order of `snippets`
+    """
+    if nb.kernel_mode:
+        raise ValueError("the kernel mode does not support parallel runs")
+    if cores is None:
+        cores = dual_cores()
+    snippets = list(snippets)
+
+    ctx = multiprocessing.get_context()
+    with nb.session():
+        executors = []
+        try:
+            for core in cores:
+                queue = ctx.Queue()
+                queue.put(core)
+                executors.append(ProcessPoolExecutor(
+                    max_workers=1, mp_context=ctx, initializer=_init_worker,
+                    initargs=(nb, queue)))
+            # all snippets are submitted to both workers before waiting
+            p, e = [ex.map(_run_snippet, snippets) for ex in executors]
+            return [DualResult(a, b) for a, b in zip(p, e)]
+        finally:
+            for ex in executors:
+                ex.shutdown()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+statistics over repeated measurements
+"""
+
+import math
+from array import array
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from .result import BenchResult, shared_names
+
+# two sided 95% quantiles of the student t distribution for 1 to 30 degrees
+# of freedom. Above the normal quantile is used.
+T_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+        2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101,
+        2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052,
+        2.048, 2.045, 2.042]
+Z_95 = 1.960
+
+
+def t_quantile(df: int) -> float:
+    """
+    :param df: degrees of freedom, must be >= 1
+    :return the two sided 95% quantile of the student t distribution
+    """
+    return T_95[df - 1] if df <= len(T_95) else Z_95
+
+
+def mean_ci(values: Sequence[float]) -> Tuple[float, float]:
+    """
+    :param values: independent samples
+    :return (mean, half width of the 95% confidence interval of the mean).
+        The half width is infinite for less than two samples.
+    """
+    n = len(values)
+    if n == 0:
+        return math.nan, math.inf
+    mean = math.fsum(values) / n
+    if n < 2:
+        return mean, math.inf
+    var = math.fsum((v - mean) ** 2 for v in values) / (n - 1)
+    return mean, t_quantile(n - 1) * math.sqrt(var / n)
+
+
+def converged(values: Sequence[float], rel_ci: float) -> bool:
+    """
+    :param values: independent samples
+    :param rel_ci: tolerated half width of the confidence interval relative
+        to the mean
+    :return true if the confidence interval of the mean is within `rel_ci`
+    """
+    mean, half = mean_ci(values)
+    return half <= rel_ci * abs(mean)
+
+
+@lru_cache(maxsize=None)
+def _numpy():
+    """
+    :return the numpy module or None if it is not installed. It is only
+        imported on first use, as importing it is slow.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    """
+    :param values: sorted samples
+    :param q: percentile in [0, 100]
+    :return the percentile with linear interpolation, as `numpy.percentile`
+    """
+    if not values:
+        return math.nan
+    pos = (len(values) - 1) * q / 100.0
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+class Samples:
+    """
+    every sample of every event of a benchmark. The samples are stored in a
+    2d numpy array (events x samples) if numpy is available, otherwise in
+    one `array('d')` per event. All statistics return a `BenchResult`.
+    """
+
+    def __init__(self, names: Iterable[str],
+                 values: Iterable[Iterable[float]]):
+        """
+        :param names: the event names
+        :param values: the samples of each event, all of the same length
+        """
+        self.names = shared_names(names)
+        # without events there is nothing to reshape into `events x samples`
+        np = self._np()
+        if np is not None:
+            self.data = np.array([list(v) for v in values], dtype=float)
+            self.data = self.data.reshape(len(self.names), -1)
+        else:
+            self.data = [array('d', v) for v in values]
+        assert len(self.data) == len(self.names)
+
+    @staticmethod
+    def parse(lines: Iterable[str], norm: float = 1.0,
+              remove_zeros: bool = False) -> 'Samples':
+        """
+        :param lines: nanoBench output lines of a run with `-verbose`. For
+            each counter group the raw counter values of every measurement
+            are printed as rows `run i: v0 v1 ...`, for the base and the
+            main run, followed by one `event: value` line per column.
+        :param norm: every sample is divided by it, nanoBench normalizes by
+            the number of executions of the code
+        :param remove_zeros: if true, events without a non-zero sample are
+            dropped.
+        :return the difference of the main and the base run of each
+            measurement. Without any rows there are no events.
+        """
+        names: List[str] = []
+        values: List[List[float]] = []
+        # row blocks of the current counter group
+        blocks: List[List[List[float]]] = []
+        rows = None
+        column = 0
+        for line in lines:
+            head, sep, rest = line.strip().partition(":")
+            if sep and head.startswith("run "):
+                if rows is None:
+                    if column:
+                        # the first block of the next group
+                        blocks, column = [], 0
+                    rows = []
+                    blocks.append(rows)
+                rows.append([float(v) for v in rest.split()])
+                continue
+            rows = None
+
+            name, sep, value = line.rpartition(":")
+            if not sep or not blocks or column >= len(blocks[-1][0]):
+                continue
+            try:
+                float(value)
+            except ValueError:
+                continue
+            main = [r[column] for r in blocks[-1]]
+            if len(blocks) > 1:
+                main = [m - r[column] for m, r in zip(main, blocks[-2])]
+            column += 1
+            if remove_zeros and not any(main):
+                continue
+            names.append(name)
+            values.append([m / norm for m in main])
+        return Samples(names, values)
+
+    def merge(self, other: 'Samples') -> 'Samples':
+        """
+        :param other: the samples of another pass over the same code
+        :return the events of both, see `BenchResult.merge()`
+        """
+        extra = [n for n in other.names if n not in self.names]
+        return Samples(self.names + tuple(extra),
+                       [list(v) for v in self.data] +
+                       [list(other[n]) for n in extra])
+
+    def __len__(self) -> int:
+        """ :return the number of samples per event """
+        return len(self.data[0]) if len(self.names) else 0
+
+    def __getitem__(self, name: str):
+        """ :return the samples of the event `name` """
+        return self.data[self.names.index(name)]
+
+    def _np(self):
+        """
+        :return the numpy module if the samples are stored in a numpy
+            array (numpy cannot reshape zero events), otherwise None
+        """
+        return _numpy() if self.names else None
+
+    def _reduce(self, fn: Callable[[List[float]], float]) -> BenchResult:
+        """
+        :param fn: applied to the sorted samples of each event
+        """
+        return BenchResult(self.names, (fn(sorted(v)) for v in self.data))
+
+    def min(self) -> BenchResult:
+        """ :return the minimum of each event """
+        np = self._np()
+        if np is not None:
+            return BenchResult(self.names, np.min(self.data, axis=1))
+        return BenchResult(self.names, (min(v) for v in self.data))
+
+    def max(self) -> BenchResult:
+        """ :return the maximum of each event """
+        np = self._np()
+        if np is not None:
+            return BenchResult(self.names, np.max(self.data, axis=1))
+        return BenchResult(self.names, (max(v) for v in self.data))
+
+    def mean(self) -> BenchResult:
+        """ :return the arithmetic mean of each event """
+        np = self._np()
+        if np is not None:
+            return BenchResult(self.names, np.mean(self.data, axis=1))
+        return BenchResult(self.names,
+                           (math.fsum(v) / len(v) for v in self.data))
+
+    def percentile(self, q: float) -> BenchResult:
+        """
+        :param q: percentile in [0, 100]
+        :return the `q`-th percentile of each event
+        """
+        np = self._np()
+        if np is not None:
+            return BenchResult(self.names,
+                               np.percentile(self.data, q, axis=1))
+        return self._reduce(lambda v: _percentile(v, q))
+
+    def median(self) -> BenchResult:
+        """ :return the median of each event """
+        return self.percentile(50)
+
+    def trimmed_mean(self, cut: float = 0.2) -> BenchResult:
+        """
+        :param cut: fraction of the samples dropped at both ends. The
+            default equals the `avg()` aggregate of nanoBench.
+        :return the trimmed mean of each event
+        """
+        k = int(len(self) * cut)
+        np = self._np()
+        if np is not None:
+            data = np.sort(self.data, axis=1)[:, k:len(self) - k]
+            return BenchResult(self.names, np.mean(data, axis=1))
+        return self._reduce(
+            lambda v: math.fsum(v[k:len(v) - k]) / (len(v) - 2 * k))
+
+    def mad(self) -> BenchResult:
+        """ :return the median absolute deviation of each event """
+        np = self._np()
+        if np is not None:
+            med = np.median(self.data, axis=1)
+            return BenchResult(self.names, np.median(
+                np.abs(self.data - med[:, None]), axis=1))
+
+        def mad(v: List[float]) -> float:
+            med = _percentile(v, 50)
+            return _percentile(sorted(abs(x - med) for x in v), 50)
+        return self._reduce(mad)
+
+    def histogram(self, bins: int = 10
+                  ) -> Dict[str, Tuple[List[int], List[float]]]:
+        """
+        :param bins: number of bins of equal width
+        :return event -> (count of each bin, the `bins + 1` bin edges)
+        """
+        ret = {}
+        np = self._np()
+        for name, v in zip(self.names, self.data):
+            if np is not None:
+                counts, edges = np.histogram(v, bins=bins)
+                ret[name] = (counts.tolist(), edges.tolist())
+                continue
+
+            lo, hi = min(v), max(v)
+            if lo == hi:
+                lo, hi = lo - 0.5, hi + 0.5
+            width = (hi - lo) / bins
+            counts = [0] * bins
+            for x in v:
+                counts[min(int((x - lo) / width), bins - 1)] += 1
+            ret[name] = (counts, [lo + i * width for i in range(bins + 1)])
+        return ret
+
+    def summary(self, percentiles: Iterable[float] = (5, 95)
+                ) -> Dict[str, BenchResult]:
+        """
+        :param percentiles: additional percentiles to compute
+        :return statistic name -> result, for all scalar statistics
+        """
+        ret = {"min": self.min(), "max": self.max(), "mean": self.mean(),
+               "median": self.median(), "trimmed_mean": self.trimmed_mean(),
+               "mad": self.mad()}
+        for q in percentiles:
+            ret[f"p{q:g}"] = self.percentile(q)
+        return ret
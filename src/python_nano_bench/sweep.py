@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+measures the latency and throughput of every instruction form of the
+`opcodes` instruction set, which is supported by the local cpu.
+"""
+
+import itertools
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Union
+
+from .cache import cache_dir, machine_fingerprint
+from .cpuid.features import Features, features
+from .nano_bench import NanoBench, get_instruction_set
+from .result import BenchResult
+from .scheduler import Scheduler
+
+# instructions which change the control flow, the stack or the state of
+# the system and therefore cannot be benchmarked in a loop
+SKIP = {"CALL", "RET", "JMP", "JCXZ", "JECXZ", "JRCXZ", "LOOP", "LOOPE",
+        "LOOPNE", "INT", "UD2", "SYSCALL", "HLT", "PUSH", "POP", "ENTER",
+        "LEAVE", "DIV", "IDIV", "MONITOR", "MONITORX", "MWAIT", "MWAITX",
+        "CLZERO", "XABORT", "XBEGIN", "XEND", "FEMMS", "EMMS",
+        # not available in 64 bit mode
+        "AAA", "AAD", "AAM", "AAS", "DAA", "DAS", "INTO"}
+
+# general purpose registers for the operands, see `Asm.latency()`
+_GPR = {"r8": ["bl", "sil", "dil", "r8b"],
+        "r16": ["bx", "si", "di", "r8w"],
+        "r32": ["ebx", "esi", "edi", "r8d"],
+        "r64": ["rbx", "rsi", "rdi", "r8"]}
+_MEM = {"m8": "byte ptr", "m16": "word ptr", "m32": "dword ptr",
+        "m64": "qword ptr", "m128": "xmmword ptr", "m256": "ymmword ptr",
+        "m512": "zmmword ptr"}
+_FIXED = {"1": "1", "3": "3", "al": "al", "ax": "ax", "eax": "eax",
+          "rax": "rax", "cl": "cl", "xmm0": "xmm0", "{er}": "{rn-sae}",
+          "{sae}": "{sae}"}
+
+
+def supported(form, cpu_features: Features) -> bool:
+    """
+    :param form: `opcodes.x86.InstructionForm`
+    :param cpu_features: see `features()`
+    :return true if the cpu supports every isa extension of `form`
+    """
+    return cpu_features.supports(e.name for e in form.isa_extensions)
+
+
+def form_key(form) -> str:
+    """
+    :param form: `opcodes.x86.InstructionForm`
+    :return unique name of the form, e.g. `ADD r64, m64`
+    """
+    return f"{form.name} {', '.join(o.type for o in form.operands)}".strip()
+
+
+def operand(type_: str, i: int) -> Union[str, None]:
+    """
+    :param type_: operand type of the `opcodes` package, e.g. `xmm{k}{z}`
+    :param i: position of the operand, distinct positions get distinct
+        registers
+    :return a concrete operand in intel syntax or None if the type is not
+        supported (e.g. branch targets and vector indices) or there are not
+        enough registers for position `i`
+    """
+    if type_ in _FIXED:
+        return _FIXED[type_]
+
+    base, _, rest = type_.partition("{")
+    mask = ""
+    if rest:
+        mask = " {k1}" + (" {z}" if "{z}" in type_ else "")
+
+    if base in _GPR:
+        return _GPR[base][i] if i < len(_GPR[base]) else None
+    if base in ("xmm", "ymm", "zmm", "mm"):
+        # mm0-7, the vector registers above 15 need avx-512
+        n = 8 if base == "mm" else 16
+        return f"{base}{i + 1}{mask}" if i + 1 < n else None
+    if base == "k":
+        # k0 cannot be a write mask, k1 is the mask of `{k}`
+        return f"k{i + 2}{mask}" if i + 2 < 8 else None
+    if base.startswith("imm"):
+        return "1"
+    if base == "m":
+        return "[r14]"
+    # e.g. `m128/m32bcst`, the full vector is used
+    base = base.split("/")[0]
+    if base in _MEM:
+        # zeroing is not allowed for memory destinations
+        return f"{_MEM[base]} [r14]{mask.replace(' {z}', '')}"
+    return None
+
+
+def instantiate(form) -> Union[str, None]:
+    """
+    :param form: `opcodes.x86.InstructionForm`
+    :return the form as instruction with concrete operands or None if it
+        cannot be instantiated
+    """
+    ops = []
+    for i, o in enumerate(form.operands):
+        op = operand(o.type, i)
+        if op is None:
+            return None
+        ops.append(op)
+    return f"{form.name.lower()} {', '.join(ops)}".strip()
+
+
+def forms(instruction_set: Union[Iterable, None] = None,
+          cpu_features: Union[Features, None] = None
+          ) -> Iterator[Tuple[str, str]]:
+    """
+    :param instruction_set: list of `opcodes.x86.Instruction`. Defaults to
+        the instruction set of `get_instruction_set()`.
+    :param cpu_features: defaults to the features of the local cpu, see
+        `features()`
+    :return generator over (form key, instruction) for every form which is
+        supported by the cpu and can be benchmarked.
+    """
+    if instruction_set is None:
+        instruction_set = get_instruction_set()
+    if cpu_features is None:
+        cpu_features = features()
+
+    seen = set()
+    for instruction in instruction_set:
+        if instruction.name in SKIP or instruction.name.startswith("J"):
+            continue
+        for form in instruction.forms:
+            key = form_key(form)
+            if key in seen or not supported(form, cpu_features):
+                continue
+            seen.add(key)
+            instr = instantiate(form)
+            if instr is not None:
+                yield key, instr
+
+
+class SweepStore:
+    """
+    sqlite store of the sweep results. Each form is stored once per
+    machine fingerprint, failed forms are stored without results.
+    """
+
+    def __init__(self, path: Union[str, None] = None,
+                 fingerprint: Union[str, None] = None):
+        """
+        :param path: the database file. Defaults to `sweep.sqlite` in the
+            user cache dir.
+        :param fingerprint: see `machine_fingerprint()`
+        """
+        if path is None:
+            path = os.path.join(cache_dir(), "sweep.sqlite")
+        self.path = path
+        self.fingerprint = fingerprint if fingerprint is not None \
+            else machine_fingerprint()
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute("CREATE TABLE IF NOT EXISTS sweep ("
+                        "fingerprint TEXT, form TEXT, instr TEXT, "
+                        "lat_names TEXT, lat BLOB, tp_names TEXT, tp BLOB, "
+                        "created REAL, PRIMARY KEY (fingerprint, form))")
+
+    def done(self, failed: bool = True) -> Set[str]:
+        """
+        :param failed: if true, failed forms are included
+        :return the keys of all forms measured on this machine
+        """
+        sql = "SELECT form FROM sweep WHERE fingerprint = ?"
+        if not failed:
+            sql += " AND lat IS NOT NULL AND tp IS NOT NULL"
+        return {row[0] for row in self.db.execute(sql, (self.fingerprint,))}
+
+    def put(self, rows: List[Tuple[str, str, Union[BenchResult, None],
+                                   Union[BenchResult, None]]]):
+        """
+        stores a batch of results in one transaction.
+        :param rows: list of (form key, instruction, latency, throughput)
+        """
+        def encode(r: Union[BenchResult, None]):
+            if r is None:
+                return None, None
+            return "\n".join(r.names), r.values.tobytes()
+
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO sweep VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(self.fingerprint, key, instr, *encode(lat), *encode(tp),
+                  now) for key, instr, lat, tp in rows])
+
+    def get(self, key: str) -> Union[Tuple[str, Union[BenchResult, None],
+                                           Union[BenchResult, None]], None]:
+        """
+        :param key: see `form_key()`
+        :return (instruction, latency, throughput) or None if the form was
+            not measured on this machine.
+        """
+        row = self.db.execute("SELECT instr, lat_names, lat, tp_names, tp "
+                              "FROM sweep WHERE fingerprint = ? AND form = ?",
+                              (self.fingerprint, key)).fetchone()
+        if row is None:
+            return None
+
+        def decode(names, values):
+            if values is None:
+                return None
+            return BenchResult(names.split("\n") if names else [],
+                               memoryview(values).cast('d'))
+        return row[0], decode(row[1], row[2]), decode(row[3], row[4])
+
+    def results(self) -> Dict[str, Tuple[str, Union[BenchResult, None],
+                                          Union[BenchResult, None]]]:
+        """ :return form key -> `get()` for all forms of this machine """
+        return {key: self.get(key) for key in sorted(self.done())}
+
+
+class Sweep:
+    """
+    measures every supported instruction form in batches. The results of
+    each batch are written to the store before the next batch starts, so
+    an interrupted sweep continues where it stopped.
+    """
+
+    def __init__(self, nb: NanoBench,
+                 store: Union[SweepStore, None] = None,
+                 parallel: bool = True, chains: int = 8,
+                 batch_size: int = 256):
+        """
+        :param nb: the benchmark options which are used for all forms
+        :param store: defaults to a store in the user cache dir
+        :param parallel: if true, the forms are measured on all physical
+            cores, see `Scheduler`. Not in kernel mode.
+        :param chains: see `Asm.throughput()`
+        :param batch_size: number of forms per batch
+        """
+        self.nb = nb
+        self.store = store if store is not None else SweepStore()
+        self.scheduler = Scheduler(nb) \
+            if parallel and not nb.kernel_mode else None
+        self.chains = chains
+        self.batch_size = batch_size
+
+    def pending(self, instruction_set: Union[Iterable, None] = None,
+                retry_failed: bool = False) -> List[Tuple[str, str]]:
+        """
+        :param instruction_set: see `forms()`
+        :param retry_failed: if true, failed forms are measured again
+        :return (form key, instruction) of all forms not measured yet
+        """
+        done = self.store.done(failed=not retry_failed)
+        return [f for f in forms(instruction_set) if f[0] not in done]
+
+    def _measure(self, batch: List[Tuple[str, str]]):
+        """
+        :param batch: list of (form key, instruction)
+        :return list of (form key, instruction, latency, throughput)
+        """
+        results = self.nb.latency_throughput(
+            [instr for _, instr in batch], self.chains,
+            scheduler=self.scheduler)
+        return [(key, instr, lat, tp)
+                for (key, instr), (_, lat, tp) in zip(batch, results)]
+
+    def run(self, instruction_set: Union[Iterable, None] = None,
+            limit: Union[int, None] = None,
+            retry_failed: bool = False) -> int:
+        """
+        :param instruction_set: see `forms()`
+        :param limit: if not None, at most this many forms are measured
+        :param retry_failed: see `pending()`
+        :return the number of measured forms
+        """
+        pending = iter(self.pending(instruction_set, retry_failed))
+        if limit is not None:
+            pending = itertools.islice(pending, limit)
+
+        n = 0
+        while True:
+            batch = list(itertools.islice(pending, self.batch_size))
+            if not batch:
+                return n
+            self.store.put(self._measure(batch))
+            n += len(batch)
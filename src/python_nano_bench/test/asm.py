@@ -14,6 +14,43 @@ def test_simple():
     assert s[0] == "vpandq  ymm0, ymm0, qword ptr [rax]{1to4}"
     assert i
 
+    # equal memory operands share a register
+    s, i = Asm.parse(["add rax, [rsi]", "add rbx, [rsi]", "add rcx, [rdi]"])
+    assert s == ["add rax, [rax]", "add rbx, [rax]", "add rcx, [rcx]"]
+
+
+def test_variants():
+    """ dependency chains for latency and throughput """
+    assert Asm.split_instruction("add rax, rbx;") == ("add", ["rax", "rbx"])
+    assert Asm.split_instruction("nop") == ("nop", [])
+    assert Asm.register("ymm3") == ("vec", 3, "ymm")
+    assert Asm.register("r9d") == ("gpr", 9, 1)
+    assert Asm.register("qword ptr [rax]") is None
+    assert Asm.rename("zmm1 {k1}", 4) == "zmm4 {k1}"
+
+    assert Asm.latency("add rax, rbx") == "add rbx, rbx"
+    assert Asm.latency("vpaddb ymm0, ymm1, ymm2") == \
+        "vpaddb ymm1, ymm1, ymm1"
+    assert Asm.latency("blendvps xmm1, xmm2, xmm0") == \
+        "blendvps xmm1, xmm1, xmm0"
+    assert Asm.latency("shl eax, cl") == "shl ebx, cl"
+    # zero idioms must not get equal sources
+    assert Asm.latency("xor rax, rbx") == "xor rbx, r13"
+    assert Asm.latency("vpxor xmm3, xmm1, xmm2") == \
+        "vpxor xmm1, xmm1, xmm15"
+
+    tp, n = Asm.throughput("add eax, dword ptr [rsi]", 3)
+    assert n == 3
+    assert tp == "add ebx, dword ptr [rsi]; add esi, dword ptr [rsi]; " \
+        "add edi, dword ptr [rsi]"
+    assert Asm.throughput("imul rax, rbx", 100)[1] == 8
+    # the default chains share the pointer register of the memory operand
+    tp, n = Asm.throughput("add rax, qword ptr [rsi]")
+    s, _ = Asm.parse(tp.split("; "))
+    assert n == 8 and all(line.endswith("[rax]") for line in s)
+    assert Asm.throughput("vpaddq xmm0, xmm0, xmm1", 100)[1] == 14
+
 
 if __name__ == "__main__":
     test_simple()
+    test_variants()
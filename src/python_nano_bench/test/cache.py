@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+tests the persistent result cache
+"""
+
+import os
+import sqlite3
+import time
+from array import array
+
+import pytest
+
+from python_nano_bench import cache
+from python_nano_bench.cache import BinaryCache, ResultCache, normalize_asm
+from python_nano_bench.nano_bench import NanoBench
+from python_nano_bench.result import BenchResult
+from python_nano_bench.workspace import Workspace
+
+
+def test_simple(tmp_path):
+    """ store, lookup and eviction """
+    c = ResultCache(str(tmp_path / "r.sqlite"), max_entries=2,
+                    fingerprint="test")
+    assert normalize_asm(" add  rax,rbx ;; nop ") == "add rax,rbx;nop"
+
+    ctx = c.context({"flags": ["-min"]})
+    assert ctx != c.context({"flags": ["-max"]})
+    k1 = ResultCache.key("add rax, rbx", "", ctx)
+    assert k1 == ResultCache.key("add  rax, rbx;", "", ctx)
+    assert c.get(k1) is None
+
+    r = BenchResult(["Core cycles", "UOPS"], [1.0, 2.0])
+    c.put(k1, r)
+    assert c.get(k1) == r and c.get(k1).rounds == 1
+    # e.g. the number of rounds of `adaptive()`
+    c.put(k1, BenchResult(r.names, r.values, 7))
+    assert c.get(k1).rounds == 7
+
+    c.put(ResultCache.key("nop", "", ctx), r)
+    c.put(ResultCache.key("nop; nop", "", ctx), r)
+    c.evict()
+    assert len(c) == 2
+
+    c.max_age = -1
+    c.evict()
+    assert len(c) == 0
+
+
+def test_old_table(tmp_path):
+    """ a table without the number of rounds is extended """
+    path = str(tmp_path / "r.sqlite")
+    with sqlite3.connect(path) as db:
+        db.execute("CREATE TABLE results (key TEXT PRIMARY KEY, names TEXT, "
+                   "vals BLOB, created REAL, accessed REAL)")
+        db.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?)",
+                   ("k", "a", array('d', [1.0]).tobytes(), time.time(),
+                    time.time()))
+    db.close()
+
+    c = ResultCache(path, fingerprint="test")
+    assert c.get("k").rounds == 1
+    c.put("k", BenchResult(["a"], [2.0], 3))
+    assert c.get("k").rounds == 3
+
+
+@pytest.mark.usefixtures("skylake")
+def test_run(tmp_path, monkeypatch):
+    """ cached results are not measured again, unless forced """
+    calls = []
+
+    def stream_command(cmds, root, cwd="", timeout=None, cancel=None):
+        calls.append(cmds)
+        yield "Core cycles: 1.00"
+    monkeypatch.setattr(NanoBench, "stream_command",
+                        staticmethod(stream_command))
+
+    c = ResultCache(str(tmp_path / "r.sqlite"), fingerprint="test")
+    n = NanoBench().result_cache(c)
+    assert n.run("add rax, rbx")["Core cycles"] == 1.0
+    assert n.run("add rax, rbx")["Core cycles"] == 1.0
+    assert len(calls) == 1
+
+    n.min().run("add rax, rbx")
+    assert len(calls) == 2
+
+    n.result_cache(c, force=True).run("add rax, rbx")
+    assert len(calls) == 3
+
+    # the pinned core is not part of the key
+    n.result_cache(c).cpu(3).run("add rax, rbx")
+    assert len(calls) == 3
+
+
+def test_binary_cache(tmp_path, monkeypatch):
+    """ assembled code is served from memory and disk """
+    b = BinaryCache(str(tmp_path), max_memory_entries=1)
+    assert b.get("nop") is None
+    b.put("nop", b"\x90")
+    b.put("ret", b"\xc3")
+    assert len(b._lru) == 1
+    assert b.get("nop") == b"\x90"
+    assert BinaryCache(str(tmp_path)).get("ret") == b"\xc3"
+
+    # the files on disk are bounded, the least recently used are evicted
+    old = time.time() - 100
+    os.utime(b._file(BinaryCache.key("ret")), (old, old))
+    b.max_entries = 1
+    b.evict()
+    assert BinaryCache(str(tmp_path)).get("ret") is None
+    assert BinaryCache(str(tmp_path)).get("nop") == b"\x90"
+    b.max_age = -1
+    b.evict()
+    assert BinaryCache(str(tmp_path)).get("nop") is None
+
+    monkeypatch.setattr(cache, "_binary_cache", b)
+    monkeypatch.setattr(NanoBench, "assemble",
+                        staticmethod(lambda *args: False))
+    b.put(NanoBench.expand_asm("add rax, rbx"), b"\x48\x01\xd8")
+    assert NanoBench.assemble_bytes("add rax, rbx") == b"\x48\x01\xd8"
+    assert NanoBench.assemble_bytes("add rax, rcx") is None
+
+
+def test_assemble_many(tmp_path, monkeypatch):
+    """ one `as` call for all snippets, broken snippets are isolated """
+    monkeypatch.setattr(cache, "_binary_cache",
+                        BinaryCache(str(tmp_path / "bin")))
+    snippets = ["add rax, rbx", "nop", "bogus rax", "ret", "|2", "nop"]
+    d = NanoBench.assemble_many(snippets, Workspace(str(tmp_path)))
+    assert d == [b"\x48\x01\xd8", b"\x90", None, b"\xc3", b"\x66\x90",
+                 b"\x90"]
+
+    monkeypatch.setattr(NanoBench, "_assemble_batch", None)
+    assert NanoBench.assemble_many(["ret", "nop"]) == [b"\xc3", b"\x90"]
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    with tempfile.TemporaryDirectory() as d:
+        test_simple(Path(d))
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+tests the event selection and counter group scheduling
+"""
+
+import pytest
+
+from python_nano_bench import nano_bench
+from python_nano_bench import config
+from python_nano_bench.config import load_config, parse_event, read_config, \
+    schedule, select_events
+from python_nano_bench.cpuid.cpuid import CpuidDump
+from python_nano_bench.nano_bench import NanoBench
+
+CONFIG = """# comment
+0E.01 UOPS_ISSUED.ANY
+A1.01 UOPS_DISPATCHED_PORT.PORT_0
+A1.02 UOPS_DISPATCHED_PORT.PORT_1
+A1.04 UOPS_DISPATCHED_PORT.PORT_2
+A1.08 UOPS_DISPATCHED_PORT.PORT_3
+48.01.CTR=2 L1D_PEND_MISS.PENDING
+B7.01.MSR_RSP0=0x1 OFFCORE_RESPONSE.A
+BB.01.MSR_RSP0=0x2 OFFCORE_RESPONSE.B
+
+C0.00 INST_RETIRED.ANY_P
+"""
+
+
+def test_parse():
+    """ options of the first column """
+    assert parse_event("# comment") is None
+    e = parse_event("48.01.CMSK=1.CTR=2,3 L1D_PEND_MISS.PENDING_CYCLES")
+    assert e.name == "L1D_PEND_MISS.PENDING_CYCLES"
+    assert e.counters == {2, 3}
+    assert not e.msrs and not e.alone
+    assert e.line() == "48.01.CMSK=1.CTR=2,3 L1D_PEND_MISS.PENDING_CYCLES"
+    assert parse_event("B7.01.MSR_RSP0=0x1 X").msrs == {"MSR_RSP0": "0x1"}
+
+
+def test_select(tmp_path):
+    """ names and patterns, unknown events """
+    path = tmp_path / "cfg.txt"
+    path.write_text(CONFIG)
+    events = read_config(str(path))
+    assert len(events) == 9
+
+    s = select_events(events, ["UOPS_ISSUED.ANY", "Core cycles",
+                               "UOPS_DISPATCHED_PORT.PORT_*",
+                               "UOPS_DISPATCHED_PORT.PORT_0"])
+    assert [e.name for e in s] == ["UOPS_ISSUED.ANY"] + \
+        [f"UOPS_DISPATCHED_PORT.PORT_{i}" for i in range(4)]
+
+    with pytest.raises(ValueError):
+        select_events(events, ["UOPS_ISSUED.ANYTHING"])
+
+
+def test_schedule(tmp_path):
+    """ counter constraints and conflicting MSRs """
+    path = tmp_path / "cfg.txt"
+    path.write_text(CONFIG)
+    events = read_config(str(path))
+
+    groups = schedule(events[:5], 4)
+    assert [len(g) for g in groups] == [4, 1]
+
+    # only counter 2 can measure this event
+    e = events[5]
+    groups = schedule([e, e._replace(name="X")] + events[:2], 4)
+    assert len(groups) == 2
+    assert all(len([x for x in g if x.counters]) == 1 for g in groups)
+    assert schedule([e], 2) == [[e]]
+
+    # both offcore events need a different value of the same MSR
+    assert len(schedule(events[6:8], 4)) == 2
+    assert len(schedule(events, 8)) == 2
+
+
+def test_index(tmp_path, monkeypatch):
+    """ queries and the pickled cache """
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(config, "_indexes", {})
+    path = tmp_path / "cfg.txt"
+    path.write_text(CONFIG)
+
+    index = load_config(str(path))
+    assert len(index) == 9 and "UOPS_ISSUED.ANY" in index
+    assert index["INST_RETIRED.ANY_P"].code == (0xC0, 0)
+    assert len(index.by_code[(0xA1, 0x02)]) == 1
+    assert index.by_counter[2] == index.constrained()
+    assert len(index.port_events()) == 4
+    assert [e.name for e in index.cache_events()] == \
+        ["L1D_PEND_MISS.PENDING", "OFFCORE_RESPONSE.A", "OFFCORE_RESPONSE.B"]
+    assert len(index.match(r"^UOPS_.*_[01]$")) == 2
+    assert index.unknown(["UOPS_*", "Core cycles", "FOO"]) == ["FOO"]
+    assert load_config(str(path)) is index
+
+    # served from the pickled cache in a new process
+    monkeypatch.setattr(config, "_indexes", {})
+    monkeypatch.setattr(config, "read_config", None)
+    assert len(load_config(str(path))) == 9
+
+    # a modified file is parsed again
+    monkeypatch.setattr(config, "read_config", read_config)
+    path.write_text(CONFIG + "D1.01 MEM_LOAD_RETIRED.L1_HIT\n")
+    assert len(load_config(str(path))) == 10
+    assert len(load_config(str(path), use_cache=False)) == 10
+
+
+@pytest.mark.usefixtures("skylake")
+def test_events(tmp_path, monkeypatch):
+    """ the generated config only contains the selected events """
+    (tmp_path / "configs").mkdir()
+    (tmp_path / "configs" / "cfg_Skylake_all.txt").write_text(CONFIG)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(nano_bench, "NANOBENCH_DIR", str(tmp_path))
+
+    n = NanoBench().events(["UOPS_*", "L1D_PEND_MISS.PENDING"],
+                           n_counters=2)
+    # no counter below 2 can measure L1D_PEND_MISS.PENDING
+    assert [len(g) for g in n._event_groups] == [1, 2, 2, 1]
+
+    # every group is measured in its own pass, which is not shifted by a
+    # smaller group before it
+    passes = []
+
+    def stream_command(cmd, **_kwargs):
+        with open(cmd[cmd.index("-config") + 1], encoding="utf-8") as f:
+            names = [line.split()[1] for line in f]
+        passes.append(names)
+        return iter(["Core cycles: 1.00"] +
+                    [f"{name}: {len(passes)}" for name in names])
+    monkeypatch.setattr(NanoBench, "stream_command",
+                        staticmethod(stream_command))
+    n._session = True
+    monkeypatch.setattr(NanoBench, "createBinaryFile",
+                        staticmethod(lambda *args, **kwargs: True))
+    ret = n.run("add rax, rbx")
+    assert passes == [[e.name for e in g] for g in n._event_groups]
+    assert passes[0] == ["L1D_PEND_MISS.PENDING"]
+    assert len(ret) == 7 and ret["Core cycles"] == 1.0
+    assert [ret[e.name] for g in n._event_groups for e in g] == \
+        [1, 2, 2, 3, 3, 4]
+
+    # the selection always starts from the full config
+    n.events(["INST_RETIRED.ANY_P"], n_counters=2)
+    assert len(n._event_groups) == 1 and len(n._configs) == 1
+
+
+def test_events_hybrid(tmp_path, monkeypatch):
+    """ switching the core type keeps the selected events """
+    (tmp_path / "configs").mkdir()
+    (tmp_path / "configs" / "cfg_AlderLakeP_all.txt").write_text(CONFIG)
+    (tmp_path / "configs" / "cfg_AlderLakeE_all.txt").write_text(
+        "0E.01 UOPS_ISSUED.ANY\nC0.00 INST_RETIRED.ANY_P\n")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(nano_bench, "NANOBENCH_DIR", str(tmp_path))
+    monkeypatch.setattr(nano_bench, "is_hybrid", lambda: True)
+    monkeypatch.setattr(NanoBench, "_get_current_cpu_generation",
+                        staticmethod(lambda: "ADL-P"))
+    monkeypatch.setattr(NanoBench, "_get_cpu_generation",
+                        staticmethod(lambda cpu: "ADL-P" if cpu < 2
+                                     else "ADL-E"))
+
+    n = NanoBench().cpu(0).events(["UOPS_ISSUED.ANY"], n_counters=2)
+    n.cpu(2)
+    assert "AlderLakeE" in n._full_config
+    assert [[e.name for e in g] for g in n._event_groups] == \
+        [["UOPS_ISSUED.ANY"]]
+    with open(n._config, encoding="utf-8") as f:
+        assert f.read().split() == ["0E.01", "UOPS_ISSUED.ANY"]
+
+    # the number of counters is read on the pinned core type
+    counters = {0: 8, 2: 1}
+    monkeypatch.setattr(nano_bench, "read_cpuid", lambda cpu: CpuidDump({
+        (0x0, 0): (0xA, 0x756E6547, 0x6C65746E, 0x49656E69),
+        (0xA, 0): (counters[cpu] << 8, 0, 0, 0)}))
+    n.cpu(0).events(["UOPS_ISSUED.ANY", "INST_RETIRED.ANY_P"])
+    assert len(n._event_groups) == 1
+    assert len(n.cpu(2)._event_groups) == 2
+
+    # an event only the P-cores have
+    n.cpu(0).events(["UOPS_DISPATCHED_PORT.PORT_0"], n_counters=2)
+    with pytest.raises(ValueError):
+        n.cpu(2)
+
+
+if __name__ == "__main__":
+    test_parse()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+fixtures shared by the tests
+"""
+
+from typing import List
+
+import pytest
+
+from python_nano_bench.nano_bench import NanoBench
+
+
+def _use_skylake(monkeypatch):
+    """ new `NanoBench` instances use the Skylake config on any cpu """
+    monkeypatch.setattr(NanoBench, "_get_current_cpu_generation",
+                        staticmethod(lambda: "SKL"))
+
+
+@pytest.fixture
+def skylake(monkeypatch):
+    """ see `_use_skylake()` """
+    _use_skylake(monkeypatch)
+
+
+@pytest.fixture
+def prepared(monkeypatch) -> List[str]:
+    """
+    uses the Skylake config, `prefix()` and `postfix()` do not touch the
+    system.
+    :return the list their calls are appended to
+    """
+    _use_skylake(monkeypatch)
+    calls: List[str] = []
+    monkeypatch.setattr(NanoBench, "prefix",
+                        lambda self: calls.append("prefix"))
+    monkeypatch.setattr(NanoBench, "postfix",
+                        lambda self: calls.append("postfix"))
+    return calls
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+tests the cpuid table and decoding from a recorded dump
+"""
+
+import pickle
+
+from python_nano_bench.cpuid.cpuid import CpuidDump, dump_all, \
+    get_cache_info, micro_arch, version_info
+
+# a Skylake client cpu, reduced to the leaves used below
+SKL = [
+    [0x0, 0, 0x16, 0x756E6547, 0x6C65746E, 0x49656E69],
+    [0x1, 0, 0x000506E3, 0, 0, 0],
+    # L1D: 64 B lines, 8 ways, 64 sets, followed by the null cache type
+    [0x4, 0, 0x21, 63 | 7 << 22, 63, 0],
+    [0x4, 1, 0, 0, 0, 0],
+    [0x7, 0, 0, 1 << 5, 0, 0],
+    [0x80000000, 0, 0x80000008, 0, 0, 0],
+]
+
+
+def recorded() -> CpuidDump:
+    """ :return the recorded Skylake dump """
+    return CpuidDump(((row[0], row[1]), row[2:]) for row in SKL)
+
+
+def test_decode():
+    """ the decoders run from a recorded table """
+    cpu = recorded()
+    assert micro_arch(cpu) == "SKL"
+    assert version_info(cpu).displ_model == 0x5E
+    assert get_cache_info(cpu) == {
+        "L1D": {"lineSize": 64, "nSets": 64, "assoc": 8, "complex": False}}
+    # leaves without subleaves ignore ecx, missing leaves are zero
+    assert cpu(0x1, 5) == cpu(0x1)
+    assert cpu(0x4, 7) == (0, 0, 0, 0)
+
+
+def test_serialize():
+    """ the table survives pickle and json """
+    cpu = recorded()
+    assert pickle.loads(pickle.dumps(cpu)) == cpu
+    assert CpuidDump.from_json(cpu.to_json()) == cpu
+    assert hash(CpuidDump.from_json(cpu.to_json())) == hash(cpu)
+    try:
+        cpu._regs = {}
+        assert False
+    except AttributeError:
+        pass
+
+
+def test_dump_all():
+    """ every valid leaf and subleaf is read exactly once """
+    calls = []
+    cpu = recorded()
+
+    def live(eax, ecx=0):
+        calls.append((eax, ecx))
+        return cpu(eax, ecx)
+
+    dump = dump_all(live)
+    assert all(dump(*key) == regs for key, regs in cpu)
+    assert len(dump) == 0x16 + 1 + 1 + 9
+    assert len(calls) == len(set(calls))
+    assert (0x16, 0) in calls and (0x80000008, 0) in calls
+    assert (0x4, 2) not in calls and (0x7, 1) not in calls
+
+
+if __name__ == "__main__":
+    test_decode()
+    test_serialize()
+    test_dump_all()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+tests the eviction set builder against a simulated cache
+"""
+
+import ctypes
+import random
+
+import pytest
+
+from python_nano_bench.cpuid.caches import CacheHierarchy, CacheLevel
+from python_nano_bench.eviction import PAGE_SIZE, NanoBenchOracle, \
+    access_pattern, candidates, conflict_sweep, eviction_set, reduce, \
+    traverse
+from python_nano_bench.nano_bench import NanoBench
+from python_nano_bench.result import BenchResult
+from python_nano_bench.test.native import needs_native, run_init
+
+L1D = CacheLevel("L1D", 1, "data", 32 * 1024, 64, 64, 8, 2, False, False)
+L3 = CacheLevel("L3", 3, "unified", 8 * 1024 * 1024, 64, 8192, 16, 16,
+                True, True)
+
+
+class SimulatedCache:
+    """
+    physically indexed cache, complex ones have 4 slices selected by a hash
+    of the physical address. The pages of the buffer are mapped randomly.
+    """
+
+    def __init__(self, cache: CacheLevel, seed: int = 0):
+        self.cache = cache
+        self.slices = 4 if cache.complex else 1
+        self.sets = cache.sets // self.slices
+        self.frames = random.Random(seed).sample(range(1 << 20), 1 << 14)
+        self.tests = 0
+
+    def key(self, offset: int):
+        """ :return (slice, set) of the line at `offset` """
+        p = self.frames[offset // PAGE_SIZE] * PAGE_SIZE + offset % PAGE_SIZE
+        line = p // self.cache.line_size
+        s = bin(p & 0x5A5A5A40).count("1") % 2 + \
+            2 * (bin(p & 0x3C3C3C80).count("1") % 2)
+        return s % self.slices, line % self.sets
+
+    def __call__(self, target, sets):
+        """ a set evicts the target if it fills the target's set """
+        self.tests += len(sets)
+        k = self.key(target)
+        return [sum(self.key(x) == k for x in s) >= self.cache.ways
+                for s in sets]
+
+
+def test_candidates():
+    """ the candidates agree in all index bits within a page """
+    pool = candidates(L1D, 5)
+    assert pool[:2] == [5 * 64, 5 * 64 + PAGE_SIZE] and len(pool) == 16
+    pool = candidates(L3, 70)
+    assert all(x % PAGE_SIZE == (70 * 64) % PAGE_SIZE for x in pool)
+    assert len(pool) == 2 * 16 * 128
+    with pytest.raises(ValueError):
+        candidates(L1D, 64)
+
+
+def test_reduce():
+    """ group testing finds a minimal eviction set of the L3 """
+    sim = SimulatedCache(L3)
+    pool = candidates(L3, 3)
+    target, pool = pool[0], pool[1:]
+    ret = reduce(target, pool, L3.ways, sim)
+    assert len(ret) == L3.ways
+    assert all(sim.key(x) == sim.key(target) for x in ret)
+    # far less than testing every candidate on its own
+    assert sim.tests < len(pool)
+    # a pool which cannot evict the target
+    assert reduce(target, pool[:L3.ways], L3.ways, sim) is None
+
+    h = CacheHierarchy([L1D, L3])
+    ret = eviction_set(None, "L3", 3, h, oracle=sim)
+    assert ret[0] == target and len(ret) == L3.ways + 1
+    with pytest.raises(ValueError):
+        eviction_set(None, "L3", 3, h)
+
+
+def test_reduce_noise():
+    """ a wrong round is undone by backtracking """
+    sim = SimulatedCache(L3)
+    pool = candidates(L3, 3)
+    target, pool = pool[0], pool[1:]
+    k = sim.key(target)
+    # only just enough lines to evict the target
+    pool = sorted([x for x in pool if sim.key(x) == k][:L3.ways] +
+                  [x for x in pool if sim.key(x) != k][:200])
+    calls = []
+
+    def noisy(t, sets):
+        """ the third round drops a congruent line """
+        calls.append(t)
+        ret = sim(t, sets)
+        return [not ok for ok in ret] if len(calls) == 4 else ret
+
+    assert reduce(target, pool, L3.ways, noisy, max_backtracks=0) is None
+    calls.clear()
+    ret = reduce(target, pool, L3.ways, noisy)
+    assert sorted(ret) == sorted(x for x in pool if sim.key(x) == k)
+
+
+@pytest.mark.usefixtures("skylake")
+def test_footprint():
+    """ the candidates must fit into the buffer r14 points to """
+    h = CacheHierarchy([L1D, L3])
+    sim = SimulatedCache(L1D)
+    assert len(eviction_set(NanoBench(), "L1D", 0, h, oracle=sim)) == 9
+    with pytest.raises(ValueError):
+        eviction_set(NanoBench(), "L3", 0, h, oracle=sim)
+
+
+@needs_native
+def test_traverse():
+    """ the chain visits the offsets in order """
+    offsets = [4096, 0, 8192 + 64, 64]
+    asm, init = traverse(offsets)
+    assert "mov rcx, 4" in asm
+    buf = run_init(init + "; mov [r14 + 16], rax", 3 * 4096)
+    base = ctypes.addressof(buf)
+    assert buf[2] == base + offsets[0]
+    for off, nxt in zip(offsets, offsets[1:] + offsets[:1]):
+        assert buf[off // 8] == base + nxt
+
+    asm, _ = access_pattern(offsets, [0, 1, 0])
+    assert asm.count("mov") == 3 and "[r14 + 4096]" in asm
+
+
+@pytest.mark.usefixtures("skylake")
+def test_oracle(monkeypatch):
+    """ the oracle compares the chains with and without the target """
+    sim = SimulatedCache(L1D)
+    pool = candidates(L1D, 0, 32)
+    target = pool[0]
+
+    def run_many(self, snippets, _kernel=False, _cancel=None):
+        for _, init in snippets:
+            chain = [int(x.split("+ ")[1].split("]")[0])
+                     for x in init.split("; ") if x.startswith("mov")]
+            # 4 cycles per hit, 20 if the target misses
+            cycles = 4 * len(chain)
+            rest = [x for x in chain if x != target]
+            if target in chain and sim(target, [rest])[0]:
+                cycles += 16
+            yield BenchResult(["Core cycles"], [float(cycles)])
+    monkeypatch.setattr(NanoBench, "run_many", run_many)
+
+    oracle = NanoBenchOracle(NanoBench())
+    assert oracle.calibrate(target, pool[1:]) == 12.0
+    assert oracle(target, [pool[1:4], pool[1:9]]) == [False, True]
+    # the target alone needs no second chain
+    assert oracle.runs == 7
+
+    ret = conflict_sweep(NanoBench(), pool[:3])
+    assert [k for k, _ in ret] == [1, 2, 3]
+
+
+if __name__ == "__main__":
+    test_candidates()
+    test_reduce()
+    test_reduce_noise()
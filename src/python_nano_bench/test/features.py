@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+tests the decoding of the cpuid feature flags
+"""
+
+import platform
+
+import pytest
+
+from python_nano_bench.cpuid.cpuid import cpuid_table, xgetbv
+from python_nano_bench.cpuid.features import XCR0_AVX, Features, features
+
+
+def fake_cpu(regs):
+    """ :return a `CPUID` like callable answering from `regs` """
+    def cpu(leaf, subleaf=0):
+        return regs.get((leaf, subleaf), (0, 0, 0, 0))
+    return cpu
+
+
+def test_features():
+    """ bits are decoded and leaves above the maximum are not read """
+    regs = {
+        (0x0, 0): (0xD, 0, 0, 0),
+        # SSE2, SSE4.1, OSXSAVE, AVX
+        (0x1, 0): (0, 0, 1 << 19 | 1 << 27 | 1 << 28, 1 << 26),
+        # AVX2, AVX512F, subleaf 1 is not supported
+        (0x7, 0): (0, 1 << 5 | 1 << 16, 0, 0),
+        (0x7, 1): (1 << 4, 0, 0, 0),
+        (0x80000000, 0): (0x80000000, 0, 0, 0),
+        # not read, above the maximum extended leaf
+        (0x80000001, 0): (0, 0, 1 << 5, 0),
+        # x87, sse, avx and avx-512 state
+        (0xD, 0): (0xE7, 0, 0, 0),
+    }
+    f = features(fake_cpu(regs))
+    assert set(f) == {"CPUID", "SSE2", "SSE4.1", "AVX", "AVX2", "AVX512F"}
+    assert "AVXVNNI" not in f and "LZCNT" not in f
+    assert f.supports(["AVX", "AVX2"]) and not f.supports(["AVX512BW"])
+    assert f == Features.from_names(set(f) | {"NOT_A_FEATURE"})
+
+    # the os did not enable the avx-512 state
+    assert set(features(fake_cpu(regs), xcr0=0x1 | XCR0_AVX)) == \
+        {"CPUID", "SSE2", "SSE4.1", "AVX", "AVX2"}
+    # without OSXSAVE no extended state is available
+    regs[(0x1, 0)] = (0, 0, 1 << 19 | 1 << 28, 1 << 26)
+    assert set(features(fake_cpu(regs), xcr0=0xE7)) == \
+        {"CPUID", "SSE2", "SSE4.1"}
+
+
+@pytest.mark.skipif(platform.machine() not in ("AMD64", "x86_64"),
+                    reason="needs a x86-64 cpu")
+def test_xgetbv():
+    """ the sse state is always enabled if the os supports xsave """
+    if not cpuid_table()(0x1)[2] >> 27 & 1:
+        pytest.skip("OSXSAVE is not set")
+    assert xgetbv(0) & 0x3 == 0x3
+
+
+if __name__ == "__main__":
+    test_features()
+    test_xgetbv()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+tests that importing the package stays cheap
+"""
+
+import json
+import subprocess
+import sys
+
+SCRIPT = """
+import json, sys, time
+t = time.perf_counter()
+import python_nano_bench
+from python_nano_bench import nano_bench
+t_import = time.perf_counter() - t
+modules = [m for m in ("opcodes", "lark", "numpy",
+                      "python_nano_bench.constraints")
+           if m in sys.modules]
+t = time.perf_counter()
+nano_bench.get_instruction_set()
+t_load = time.perf_counter() - t
+print(json.dumps([t_import, t_load, modules]))
+"""
+
+
+def test_import_time():
+    """ the instruction set, lark and numpy are only loaded on first use """
+    out = subprocess.check_output([sys.executable, "-c", SCRIPT],
+                                  env={"PYTHONPATH": ":".join(sys.path)})
+    t_import, t_load, modules = json.loads(out)
+    print(f"import: {t_import * 1000:.1f}ms, "
+          f"instruction set: {t_load * 1000:.1f}ms")
+    assert modules == []
+    assert t_import < t_load
+
+
+def test_lazy_names():
+    """ the names of the submodules are still available """
+    import python_nano_bench
+    from python_nano_bench import nano_bench
+    assert python_nano_bench.Asm.parse
+    assert python_nano_bench.parse_constrains
+    assert callable(python_nano_bench.elevate)
+    assert "Asm" in dir(python_nano_bench)
+    assert nano_bench.instruction_set
+
+
+if __name__ == "__main__":
+    test_import_time()
+    test_lazy_names()
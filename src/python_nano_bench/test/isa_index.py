@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+tests the memory mapped instruction form index
+"""
+
+import pickle
+
+from python_nano_bench import isa_index, nano_bench
+from python_nano_bench.isa_index import FormIndex, build, form_index
+from python_nano_bench.nano_bench import get_instruction_set
+
+
+def test_build(tmp_path):
+    """ the index contains exactly the forms of the instruction set """
+    path = str(tmp_path / "forms.idx")
+    build(get_instruction_set(), path)
+    index = FormIndex(path)
+    assert len(index) == sum(len(i.forms) for i in get_instruction_set())
+
+    vpaddb = [f for i in get_instruction_set() if i.name == "VPADDB"
+              for f in i.forms]
+    forms = index.forms("vpaddb")
+    assert [f.operands for f in forms] == \
+        [tuple(o.type for o in f.operands) for f in vpaddb]
+    assert index.forms("NOT_AN_INSTRUCTION") == []
+
+    add = {f.key(): f for f in index.forms("ADD")}
+    assert add["ADD r64, r64"].length == 3
+    assert add["ADD r32, imm32"].length == 6
+    assert {f.key(): f.length for f in forms}["VPADDB xmm, xmm, xmm"] == 4
+    assert {f.key(): f.isa_extensions for f in forms}[
+        "VPADDB zmm{k}{z}, zmm, zmm"] == ("AVX512BW",)
+
+    avx512 = index.with_isa("AVX512")
+    assert avx512 and all(any(e.startswith("AVX512")
+                              for e in f.isa_extensions) for f in avx512)
+    assert "VPADDB" in index.mnemonics()
+
+    # only the path is pickled
+    assert len(pickle.dumps(index)) < 1000
+    assert pickle.loads(pickle.dumps(index)).forms("VPADDB") == forms
+
+
+def test_form_index(tmp_path, monkeypatch):
+    """ the index is built once and reused """
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(isa_index, "_form_index", None)
+    calls = []
+
+    def instruction_set():
+        calls.append(1)
+        return get_instruction_set()
+    monkeypatch.setattr(nano_bench, "get_instruction_set", instruction_set)
+
+    index = form_index()
+    assert form_index() is index
+    monkeypatch.setattr(isa_index, "_form_index", None)
+    assert len(form_index()) == len(index)
+    assert calls == [1]
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    with tempfile.TemporaryDirectory() as d:
+        test_build(Path(d))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+tests the direct kernel module backend against a fake sysfs tree
+"""
+
+import pytest
+
+from python_nano_bench.kernel import CODE_FILES, KernelBackend
+from python_nano_bench.workspace import Workspace
+
+
+def fake_module(tmp_path):
+    """ creates a fake `/sys/nb` directory and `/proc/nanoBench` file """
+    sys_dir = tmp_path / "nb"
+    sys_dir.mkdir()
+    proc_file = tmp_path / "nanoBench"
+    proc_file.write_text("Core cycles: 1.00\nUOPS_ISSUED.ANY: 2.00\n")
+    config = tmp_path / "cfg.txt"
+    config.write_text("0E.01 UOPS_ISSUED.ANY\n")
+    return sys_dir, proc_file, config
+
+
+class ReadingBackend(KernelBackend):
+    """ reads the code files while their paths are written, like the module """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read = {}
+
+    def write(self, name, content, force=False):
+        if name in CODE_FILES:
+            with open(content, 'rb') as f:
+                self.read[name] = f.read()
+        return super().write(name, content, force)
+
+
+def test_run(tmp_path):
+    """ the paths of the code and config files end up in the sysfs files """
+    sys_dir, proc_file, config = fake_module(tmp_path)
+    k = ReadingBackend(str(sys_dir), str(proc_file), root=False,
+                       workspace=Workspace(str(tmp_path)))
+    assert k.available()
+
+    s = k.run(b"\x90\x90", b"\xc3", str(config), {"n_measurements": "10"})
+    assert s == ["Core cycles: 1.00", "UOPS_ISSUED.ANY: 2.00"]
+    assert k.read == {"code": b"\x90\x90", "init": b"\xc3"}
+    assert (sys_dir / "code").read_text().startswith(str(tmp_path))
+    assert (sys_dir / "config").read_text() == str(config)
+    assert (sys_dir / "n_measurements").read_text() == "10"
+
+
+def test_not_loaded(tmp_path):
+    """ a missing module is reported before sysfs is touched """
+    k = KernelBackend(str(tmp_path / "nb"), str(tmp_path / "nanoBench"),
+                      root=False)
+    assert not k.available()
+    with pytest.raises(OSError, match="not loaded"):
+        k.measure()
+    with pytest.raises(OSError, match="not loaded"):
+        k.configure({"verbose": "1"})
+    with pytest.raises(OSError, match="not loaded"):
+        k.run(b"\x90", b"", str(tmp_path / "cfg.txt"), {})
+
+
+def test_no_redundant_writes(tmp_path):
+    """ unchanged files are not written again """
+    sys_dir, proc_file, config = fake_module(tmp_path)
+    k = KernelBackend(str(sys_dir), str(proc_file), root=False,
+                      workspace=Workspace(str(tmp_path)))
+    k.run(b"\x90", b"", str(config), {"loop_count": "100"})
+
+    (sys_dir / "config").unlink()
+    (sys_dir / "loop_count").unlink()
+    k.run(b"\x91", b"", str(config), {"loop_count": "100"})
+    assert not (sys_dir / "config").exists()
+    assert not (sys_dir / "loop_count").exists()
+    assert (sys_dir / "code").exists()
+
+    # removing an option resets the module and restores the code
+    (sys_dir / "code").unlink()
+    k.run(b"\x91", b"", str(config), {})
+    assert (sys_dir / "reset").exists()
+    assert (sys_dir / "code").exists()
+    assert (sys_dir / "config").read_text() == str(config)
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    with tempfile.TemporaryDirectory() as d:
+        test_run(Path(d))
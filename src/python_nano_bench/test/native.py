@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+executes generated init code natively, shared by the tests of the code
+generators for the buffer r14 points to
+"""
+
+import ctypes
+import mmap
+import platform
+import shutil
+
+import pytest
+
+from python_nano_bench.nano_bench import NanoBench
+
+# skips tests which execute code natively
+needs_native = pytest.mark.skipif(
+    platform.machine() != "x86_64" or not shutil.which("as"),
+    reason="needs x86-64 and `as`")
+
+
+def run_init(init: str, size: int) -> ctypes.Array:
+    """
+    executes `init` natively with r14 pointing to a fresh buffer
+    :return the buffer
+    """
+    code = NanoBench.assemble_bytes(f"push r14; mov r14, rdi; {init}; "
+                                    f"pop r14; ret")
+    assert code is not None
+    page = mmap.mmap(-1, mmap.PAGESIZE * (len(code) // mmap.PAGESIZE + 1),
+                     prot=mmap.PROT_READ | mmap.PROT_WRITE | mmap.PROT_EXEC)
+    page.write(code)
+    func = ctypes.CFUNCTYPE(None, ctypes.c_void_p)(
+        ctypes.addressof(ctypes.c_char.from_buffer(page)))
+    buf = (ctypes.c_uint64 * (size // 8))()
+    func(ctypes.addressof(buf))
+    return buf
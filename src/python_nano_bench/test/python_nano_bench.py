@@ -3,7 +3,15 @@
 tests chcking the main pythn interface
 """
 
+import subprocess
+import sys
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
 from python_nano_bench.nano_bench import NanoBench
+from python_nano_bench.result import BenchResult
 
 
 def test_simple():
@@ -93,6 +101,189 @@ def test_flags():
         assert d
 
 
+def test_session(prepared):
+    """ the system is prepared once per session and restored afterwards """
+    calls = prepared
+
+    n = NanoBench()
+    with n.session():
+        with n.session():
+            assert n._session
+        assert n._session
+    assert not n._session
+    assert calls == ["prefix", "postfix"]
+
+    try:
+        with n.session():
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert not n._session
+    assert calls == ["prefix", "postfix", "prefix", "postfix"]
+
+
+def test_run_many(prepared, monkeypatch):
+    """ results are streamed in order within a single session """
+    calls = prepared
+    monkeypatch.setattr(NanoBench, "createBinaryFile",
+                        staticmethod(lambda *args, **kwargs: True))
+    monkeypatch.setattr(NanoBench, "assemble_many",
+                        staticmethod(lambda *args, **kwargs: []))
+
+    def stream_command(cmds, root, cwd="", timeout=None, cancel=None):
+        calls.append(cmds[0])
+        yield "Core cycles: 1.00"
+    monkeypatch.setattr(NanoBench, "stream_command",
+                        staticmethod(stream_command))
+
+    n = NanoBench()
+    it = n.run_many(["ADD RAX, RBX", "ADD RBX, RAX", "NOP"])
+    assert calls == []
+    assert next(it)
+    assert calls == ["prefix", "./user/nanoBench"]
+    assert all(it)
+    assert calls == ["prefix"] + 3 * ["./user/nanoBench"] + ["postfix"]
+
+
+@pytest.mark.usefixtures("skylake")
+def test_adaptive(monkeypatch):
+    """ rounds are added until the selected events are stable """
+    values = iter([10.0, 10.001, 9.999, 10.0] + 100 * [1.0, 100.0])
+
+    def measure(self, sasm, init_asm, flags, kernel=False, cancel=None):
+        v = next(values)
+        names = ["Core cycles", "noise"] if v != 10.0 else ["Core cycles"]
+        return BenchResult(names, [v, 1.0 / v][:len(names)])
+    monkeypatch.setattr(NanoBench, "_measure", measure)
+
+    n = NanoBench().adaptive(rel_ci=0.005, events=["Core *"])
+    d = n.run("ADD RAX, RBX")
+    assert d.rounds == 3
+    assert abs(d["Core cycles"] - 10.0) < 1e-9
+    assert abs(d["noise"] - (1 / 10.001 + 1 / 9.999) / 3) < 1e-9
+
+    d = n.adaptive(max_rounds=20).run("ADD RAX, RBX")
+    assert d.rounds == 20
+    d = n.adaptive(max_time=0.0).run("ADD RAX, RBX")
+    assert d.rounds == 1
+
+
+VERBOSE = """
+Base
+                   Ctr0        Ctr1
+              _______     _______
+\trun 0:        1000        2000
+\trun 1:        1000        2000
+\trun 2:        1000        2000
+
+Main
+\trun 0:        1500        4000
+\trun 1:        1600        4000
+\trun 2:        3000        4000
+
+Instructions retired: 1.00
+Core cycles: 2.00
+"""
+
+
+@pytest.mark.usefixtures("skylake")
+def test_sample(monkeypatch):
+    """ the samples are the verbose output of a single run """
+    runs = []
+
+    def stream_command(cmd, **_kwargs):
+        runs.append(cmd)
+        assert "-n_measurements=3" in cmd and "-verbose" in cmd
+        return iter(VERBOSE.splitlines())
+    monkeypatch.setattr(NanoBench, "stream_command",
+                        staticmethod(stream_command))
+
+    n = NanoBench().n_measurements(10).unroll_count(100)
+    s = n.sample("ADD RAX, RBX", repetitions=3)
+    assert len(runs) == 1
+    assert list(s["Instructions retired"]) == [5.0, 6.0, 20.0]
+    assert list(s["Core cycles"]) == [20.0] * 3
+    assert s.median()["Instructions retired"] == 6.0
+    assert n._n_measurements == 10 and not n._verbose
+
+
+@pytest.mark.usefixtures("skylake")
+def test_latency_throughput(monkeypatch):
+    """ both variants are measured in one batch """
+    batches = []
+
+    def run_many(self, snippets, kernel=False, cancel=None):
+        batches.append(snippets)
+        for s in snippets:
+            yield BenchResult(["Core cycles"], [s.count(";") + 1.0])
+    monkeypatch.setattr(NanoBench, "run_many", run_many)
+
+    r = list(NanoBench().latency_throughput(["add rax, rbx", "nop"], 4))
+    assert batches == [["add rbx, rbx",
+                        "add rbx, rbx; add rsi, rsi; add rdi, rdi; "
+                        "add r8, r8", "nop", "nop; nop; nop; nop"]]
+    assert [x[0] for x in r] == ["add rax, rbx", "nop"]
+    assert r[0][1]["Core cycles"] == 1.0
+    assert r[0][2]["Core cycles"] == 1.0
+
+
+def test_hybrid(monkeypatch):
+    """ measurements can be pinned to a core type and use its config """
+    from python_nano_bench import nano_bench
+    from python_nano_bench.topology import LogicalCpu, Topology
+    topo = Topology(LogicalCpu(cpu, cpu, cpu, 0, 0, (cpu,), {},
+                               "P" if cpu < 2 else "E", cpu)
+                    for cpu in range(4))
+    monkeypatch.setattr(nano_bench, "is_hybrid", lambda: True)
+    monkeypatch.setattr(nano_bench, "system_topology", lambda: topo)
+    monkeypatch.setattr(nano_bench.os, "sched_getaffinity",
+                        lambda pid: {1, 2, 3})
+    monkeypatch.setattr(NanoBench, "_get_current_cpu_generation",
+                        staticmethod(lambda: "ADL-E"))
+    monkeypatch.setattr(NanoBench, "_get_cpu_generation",
+                        staticmethod(lambda cpu: "ADL-P" if cpu < 2
+                                     else "ADL-E"))
+
+    # pinning is opt-in, the config is the one of the current core
+    n = NanoBench()
+    assert n._cpu == -1 and "AlderLakeE" in n._config
+    assert n.core_type("P")._cpu == 1 and "AlderLakeP" in n._config
+    assert n.core_type("E")._cpu == 2 and "AlderLakeE" in n._config
+    assert "AlderLakeP" in n.cpu(0)._config
+    try:
+        n.core_type("X")
+        assert False
+    except ValueError:
+        pass
+
+
+def test_stream_command():
+    """ large outputs do not dead lock, timeouts and cancellation work """
+    n = 200000
+    cmd = [sys.executable, "-c",
+           f"for i in range({n}): print(f'event{{i}}: {{i}}')"]
+    lines = NanoBench.stream_command(cmd, root=False)
+    assert sum(1 for _ in lines) == n
+
+    b, s = NanoBench.run_command([sys.executable, "-c", "exit(1)"], False)
+    assert not b and s == []
+
+    sleep = [sys.executable, "-c", "import time; time.sleep(10)"]
+    try:
+        list(NanoBench.stream_command(sleep, root=False, timeout=0.2))
+        assert False
+    except subprocess.TimeoutExpired:
+        pass
+
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    try:
+        list(NanoBench.stream_command(sleep, root=False, cancel=cancel))
+        assert False
+    except CancelledError:
+        pass
+
+
 if __name__ == "__main__":
     test_simple()
     test_flags()
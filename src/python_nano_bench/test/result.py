@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+tests the compact benchmark result
+"""
+
+import pytest
+
+from python_nano_bench.result import BenchResult
+
+
+def test_simple():
+    """ parsing, accessors and arithmetic """
+    lines = ["Core cycles: 2.00", "Instructions retired: 4.00",
+             "UOPS_ISSUED.ANY: 0.00"]
+    r = BenchResult.parse(lines)
+    assert len(r) == 3
+    assert r["Core cycles"] == 2.0
+    assert r.get("unknown") is None
+    assert r.to_dict() == {"Core cycles": 2.0, "Instructions retired": 4.0,
+                           "UOPS_ISSUED.ANY": 0.0}
+
+    r2 = BenchResult.parse(lines)
+    assert r2.names is r.names
+    assert (r + r2)["Instructions retired"] == 8.0
+    assert (r / 2)["Core cycles"] == 1.0
+    assert (r - r2).to_dict()["Core cycles"] == 0.0
+
+    r3 = BenchResult.parse(lines, remove_zeros=True)
+    assert "UOPS_ISSUED.ANY" not in r3
+    try:
+        r + r3
+        assert False
+    except ValueError:
+        pass
+
+
+def test_parse():
+    """ ranges, verbose rows and unexpected lines """
+    r = BenchResult.parse(["Base", "\trun 0:        1000        2000",
+                           "Core cycles: 2.00 [1.50;3.00]"])
+    assert r.to_dict() == {"Core cycles": 2.0, "Core cycles [min]": 1.5,
+                           "Core cycles [max]": 3.0}
+    for line in ["Error: cannot open file", "Core cycles: 2.00 [1.50]"]:
+        with pytest.raises(ValueError):
+            BenchResult.parse([line])
+
+    r = BenchResult(["Core cycles"], [2.0], rounds=5)
+    assert (r * 2).rounds == 5
+    assert (r + BenchResult(["Core cycles"], [1.0], rounds=3)).rounds == 3
+
+
+if __name__ == "__main__":
+    test_simple()
+    test_parse()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+tests the parallel scheduler
+"""
+
+import os
+
+import pytest
+
+from python_nano_bench.nano_bench import NanoBench
+from python_nano_bench.result import BenchResult
+from python_nano_bench.scheduler import DualResult, Scheduler, dual_cores, \
+    physical_cores, run_dual
+from python_nano_bench.topology import LogicalCpu, Topology, parse_cpu_list
+from python_nano_bench.workspace import Workspace
+
+
+def fake_sysfs(tmp_path):
+    """ 2 cores with 2 threads each, both cores share one L2 """
+    (tmp_path / "online").write_text("0-3\n")
+    for cpu in range(4):
+        topology = tmp_path / f"cpu{cpu}" / "topology"
+        topology.mkdir(parents=True)
+        topology.joinpath("thread_siblings_list").write_text(
+            f"{cpu % 2},{cpu % 2 + 2}\n")
+        l2 = tmp_path / f"cpu{cpu}" / "cache" / "index2"
+        l2.mkdir(parents=True)
+        l2.joinpath("level").write_text("2\n")
+        l2.joinpath("shared_cpu_list").write_text("0-3\n")
+    return str(tmp_path)
+
+
+def test_physical_cores(tmp_path):
+    """ SMT siblings and shared L2 neighbours are skipped """
+    assert parse_cpu_list("0-3,8,10-11") == [0, 1, 2, 3, 8, 10, 11]
+
+    sys_dir = fake_sysfs(tmp_path)
+    allowed = {0, 1, 2, 3}
+    assert physical_cores(sys_dir=sys_dir, allowed=allowed) == [0, 1]
+    assert physical_cores(True, sys_dir, allowed) == [0]
+    assert physical_cores(sys_dir=sys_dir, allowed={1, 2, 3}) == [1, 2]
+
+
+@pytest.mark.usefixtures("prepared")
+def test_run(monkeypatch):
+    """ results are returned in order """
+
+    def run(self, asm, kernel=False, cancel=None):
+        assert os.sched_getaffinity(0) == {self._cpu}
+        return BenchResult(["len"], [len(asm)])
+    monkeypatch.setattr(NanoBench, "run", run)
+
+    core = min(os.sched_getaffinity(0))
+    s = Scheduler(NanoBench(), cores=[core])
+    snippets = ["nop", "add rax, rbx", "nop; nop"]
+    assert [r["len"] for r in s.run(snippets)] == [3, 12, 8]
+
+
+@pytest.mark.usefixtures("prepared")
+def test_worker_cleanup(tmp_path, monkeypatch):
+    """ the workspaces of the workers are removed when they exit """
+    monkeypatch.setattr(Workspace, "BASES", [str(tmp_path)])
+
+    def run(self, asm, kernel=False, cancel=None):
+        assert os.path.dirname(self._workspace.path) == str(tmp_path)
+        return BenchResult(["len"], [len(asm)])
+    monkeypatch.setattr(NanoBench, "run", run)
+
+    core = min(os.sched_getaffinity(0))
+    s = Scheduler(NanoBench(), cores=[core, core])
+    assert len(s.run(["nop"] * 4)) == 4
+    assert os.listdir(tmp_path) == []
+
+
+def hybrid_topology() -> Topology:
+    """ 2 P-cores followed by 2 E-cores """
+    return Topology(LogicalCpu(cpu, cpu, cpu, 0, 0, (cpu,), {},
+                               "P" if cpu < 2 else "E", cpu)
+                    for cpu in range(4))
+
+
+@pytest.mark.usefixtures("prepared")
+def test_run_dual(monkeypatch):
+    """ each snippet is measured on both workers, results are paired """
+
+    def run(self, asm, kernel=False, cancel=None):
+        assert os.sched_getaffinity(0) == {self._cpu}
+        return BenchResult(["len"], [len(asm)])
+    monkeypatch.setattr(NanoBench, "run", run)
+
+    assert dual_cores(hybrid_topology(), {1, 2, 3}) == (1, 2)
+    try:
+        dual_cores(hybrid_topology(), {0, 1})
+        assert False
+    except ValueError:
+        pass
+
+    core = min(os.sched_getaffinity(0))
+    ret = run_dual(NanoBench(), ["nop", "add rax, rbx"], cores=(core, core))
+    assert [(r.p["len"], r.e["len"]) for r in ret] == [(3, 3), (12, 12)]
+    assert isinstance(ret[0], DualResult)
+
+
+@pytest.mark.usefixtures("skylake")
+def test_hybrid_cores(monkeypatch):
+    """ the default cores are of the core type of the instance """
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: {0, 1, 2, 3})
+    nb = NanoBench()
+    assert Scheduler(nb, topo=hybrid_topology()).cores == [0, 1]
+    nb._cpu = 2
+    assert Scheduler(nb, topo=hybrid_topology()).cores == [2, 3]
+    try:
+        Scheduler(nb, cores=[1, 2], topo=hybrid_topology())
+        assert False
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    with tempfile.TemporaryDirectory() as d:
+        test_physical_cores(Path(d))
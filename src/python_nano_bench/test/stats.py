@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+tests the statistics over repeated measurements
+"""
+
+import math
+
+from python_nano_bench import stats
+from python_nano_bench.stats import Samples, converged, mean_ci, t_quantile
+
+
+def test_mean_ci():
+    """ known values and degenerate inputs """
+    assert t_quantile(1) == 12.706 and t_quantile(100) == 1.96
+    mean, half = mean_ci([1.0, 2.0, 3.0])
+    assert mean == 2.0
+    assert math.isclose(half, 4.303 / math.sqrt(3))
+    assert mean_ci([5.0]) == (5.0, math.inf)
+    assert math.isnan(mean_ci([])[0])
+
+    assert converged([10.0, 10.0, 10.0], 0.0)
+    assert converged([10.0, 10.001, 9.999], 0.005)
+    assert not converged([10.0, 12.0, 8.0], 0.005)
+    assert not converged([10.0], 0.5)
+
+
+def check_samples():
+    """ all statistics of a small sample """
+    s = Samples(["a", "b"], [[5.0, 1.0, 2.0, 3.0, 4.0], [7.0] * 5])
+    assert len(s) == 5 and list(s["b"]) == [7.0] * 5
+    assert s.min().to_dict() == {"a": 1.0, "b": 7.0}
+    assert s.max()["a"] == 5.0
+    assert s.mean()["a"] == 3.0
+    assert s.median()["a"] == 3.0
+    assert s.percentile(25)["a"] == 2.0
+    assert s.percentile(90)["a"] == 4.6
+    assert s.trimmed_mean()["a"] == 3.0
+    assert s.trimmed_mean(0.4)["a"] == 3.0
+    assert s.mad().to_dict() == {"a": 1.0, "b": 0.0}
+
+    counts, edges = s.histogram(bins=4)["a"]
+    assert list(counts) == [1, 1, 1, 2]
+    assert list(edges) == [1.0, 2.0, 3.0, 4.0, 5.0]
+    counts, edges = s.histogram(bins=2)["b"]
+    assert list(counts) == [0, 5] and list(edges) == [6.5, 7.0, 7.5]
+
+    summary = s.summary()
+    assert set(summary) == {"min", "max", "mean", "median", "trimmed_mean",
+                            "mad", "p5", "p95"}
+
+
+def check_empty():
+    """ a result without events """
+    s = Samples([], [])
+    assert len(s) == 0
+    assert len(s.min()) == 0 and len(s.trimmed_mean()) == 0
+    assert s.histogram() == {}
+    assert len(s.summary()["median"]) == 0
+
+
+def test_samples(monkeypatch):
+    """ with and without numpy """
+    check_samples()
+    check_empty()
+    monkeypatch.setattr(stats, "_numpy", lambda: None)
+    check_samples()
+    check_empty()
+
+
+def test_parse():
+    """ each counter group is the difference of its main and base rows """
+    lines = ["\trun 0:   10   20", "\trun 1:   10   20", "",
+             "\trun 0:   30   20", "\trun 1:   50   20",
+             "A: 3.00", "B: 0.00",
+             "\trun 0:    4", "\trun 1:    8", "C: 6.00"]
+    s = Samples.parse(lines, norm=2.0)
+    assert s.names == ("A", "B", "C")
+    assert list(s["A"]) == [10.0, 20.0] and list(s["B"]) == [0.0, 0.0]
+    assert list(s["C"]) == [2.0, 4.0]
+    assert Samples.parse(lines, remove_zeros=True).names == ("A", "C")
+    # without `-verbose` there are no samples
+    assert len(Samples.parse(["A: 3.00"]).names) == 0
+
+
+if __name__ == "__main__":
+    test_mean_ci()
+    check_samples()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+tests the instruction sweep engine
+"""
+
+import pytest
+
+from python_nano_bench.cpuid.features import Features
+from python_nano_bench.nano_bench import NanoBench, get_instruction_set
+from python_nano_bench.result import BenchResult
+from python_nano_bench.sweep import Sweep, SweepStore, form_key, forms, \
+    instantiate, operand
+
+
+def test_forms():
+    """ isa filtering and operand instantiation """
+    add = [i for i in get_instruction_set() if i.name == "ADD"][0]
+    keys = [form_key(f) for f in add.forms]
+    assert "ADD r64, m64" in keys
+    assert instantiate(add.forms[keys.index("ADD r64, m64")]) == \
+        "add rbx, qword ptr [r14]"
+
+    assert operand("zmm{k}{z}", 0) == "zmm1 {k1} {z}"
+    assert operand("m128{k}{z}", 0) == "xmmword ptr [r14] {k1}"
+    assert operand("rel32", 0) is None
+    assert operand("r64", 3) == "r8" and operand("r64", 4) is None
+    assert operand("k", 5) == "k7" and operand("k", 6) is None
+    assert operand("mm", 7) is None and operand("xmm", 7) == "xmm8"
+
+    sse = dict(forms(cpu_features=Features.from_names(["SSE", "SSE2"])))
+    assert "ADDPS xmm, xmm" in sse and "PADDB xmm, xmm" in sse
+    assert not any(k.startswith("V") for k in sse)
+    assert not any(k.startswith(("JMP", "CALL", "PUSH")) for k in sse)
+
+
+@pytest.mark.usefixtures("skylake")
+def test_resume(tmp_path, monkeypatch):
+    """ an interrupted sweep continues with the missing forms """
+    measured = []
+
+    def latency_throughput(self, instrs, chains=8, kernel=False,
+                           cancel=None, scheduler=None):
+        for instr in instrs:
+            if instr.startswith("crash"):
+                raise KeyboardInterrupt()
+            measured.append(instr)
+            r = BenchResult(["Core cycles"], [1.0])
+            yield instr, r, None if instr.startswith("bad") else r
+    monkeypatch.setattr(NanoBench, "latency_throughput", latency_throughput)
+    monkeypatch.setattr("python_nano_bench.sweep.forms",
+                        lambda *args: iter(todo))
+
+    store = SweepStore(str(tmp_path / "s.sqlite"), fingerprint="test")
+    sweep = Sweep(NanoBench(), store, parallel=False, batch_size=2)
+    todo = [("A", "a"), ("B", "bad"), ("C", "crash"), ("D", "d")]
+    with pytest.raises(KeyboardInterrupt):
+        sweep.run()
+    assert measured == ["a", "bad"]
+    assert store.done() == {"A", "B"}
+    assert store.done(failed=False) == {"A"}
+
+    todo[2] = ("C", "c")
+    assert sweep.run() == 2
+    assert measured == ["a", "bad", "c", "d"]
+    assert sweep.run(retry_failed=True) == 1
+
+    instr, lat, tp = store.get("A")
+    assert instr == "a" and lat["Core cycles"] == 1.0 and tp == lat
+    assert store.get("B")[2] is None
+    assert len(store.results()) == 4
+    assert SweepStore(store.path, fingerprint="other").done() == set()
+
+
+@pytest.mark.usefixtures("skylake")
+def test_parallel():
+    """ the scheduler measures the variants of latency_throughput() """
+
+    class Scheduler:
+        def run(self, snippets):
+            return [BenchResult(["n"], [s.count(";") + 1.0])
+                    for s in snippets]
+
+    ret = list(NanoBench().latency_throughput(["add rax, rbx"], 4,
+                                              scheduler=Scheduler()))
+    assert [(i, lat["n"], tp["n"]) for i, lat, tp in ret] == \
+        [("add rax, rbx", 1.0, 1.0)]
+
+
+if __name__ == "__main__":
+    test_forms()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+tests the topology discovery from cpuid and sysfs
+"""
+
+from python_nano_bench import topology as topology_module
+from python_nano_bench.cpuid.cpuid import CpuidDump
+from python_nano_bench.topology import decode_topology, topology
+
+INTEL = (0x756E6547, 0x6C65746E, 0x49656E69)
+
+
+def hybrid_cpu(apic_id: int, core_type: int, l2_sharing: int) -> CpuidDump:
+    """
+    :return the topology leaves of a logical cpu of a hybrid cpu with 2
+        threads per core and 128 ids per package
+    """
+    def cache(kind, level, sharing):
+        return kind | level << 5 | (sharing - 1) << 14, 0, 0, 0
+    return CpuidDump({
+        (0x0, 0): (0x20, *INTEL),
+        (0x7, 0): (0, 0, 0, 1 << 15),
+        (0x4, 0): cache(1, 1, 2),
+        (0x4, 1): cache(3, 2, l2_sharing),
+        (0x4, 2): cache(3, 3, 128),
+        (0x4, 3): cache(0, 0, 1),
+        (0x1A, 0): (core_type << 24, 0, 0, 0),
+        (0x1F, 0): (1, 2, 0 | 1 << 8, apic_id),
+        (0x1F, 1): (7, 16, 1 | 2 << 8, apic_id),
+        (0x1F, 2): (0, 0, 2, apic_id),
+    })
+
+
+# 2 SMT threads of a P core and 2 E cores sharing an L2
+CPUS = {0: hybrid_cpu(0x0, 0x40, 2), 1: hybrid_cpu(0x1, 0x40, 2),
+        2: hybrid_cpu(0x10, 0x20, 8), 3: hybrid_cpu(0x12, 0x20, 8)}
+
+
+def test_decode():
+    """ the apic id is split by the level shifts """
+    t = decode_topology(CPUS[1])
+    assert t.apic_id == 1
+    assert t.levels["core"] == 0 and t.levels["package"] == 0
+    assert t.caches == {"L1D": 0, "L2": 0, "L3": 0}
+    assert t.core_type == "P"
+    assert decode_topology(CPUS[3]).core_type == "E"
+
+
+def test_topology(tmp_path, monkeypatch):
+    """ without sysfs details everything is derived from cpuid """
+    monkeypatch.setattr(topology_module, "read_cpuid", CPUS.get)
+    (tmp_path / "online").write_text("0-3\n")
+    topo = topology(str(tmp_path))
+
+    assert topo.siblings(1) == (0, 1)
+    assert topo.cores() == [(0, 1), (2,), (3,)]
+    assert topo[3].core == 3 and topo[3].package == 0
+    assert topo.sharing(2, "L2") == (2, 3)
+    assert topo.sharing(0, "L3") == (0, 1, 2, 3)
+    assert topo.of_type("E") == [2, 3] and topo.is_hybrid()
+    assert topo.one_per_core() == [0, 2, 3]
+    assert topo.one_per_core(caches=["L2"]) == [0, 2]
+    assert topo.neighbours(0, ["L2"]) == {0, 1}
+
+    # sysfs is preferred
+    (tmp_path / "cpu2" / "topology").mkdir(parents=True)
+    (tmp_path / "cpu2" / "topology" / "thread_siblings_list").write_text(
+        "2-3\n")
+    assert topology(str(tmp_path)).siblings(2) == (2, 3)
+
+
+if __name__ == "__main__":
+    test_decode()
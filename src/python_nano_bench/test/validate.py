@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+tests the pre-flight validation of snippets
+"""
+
+import pytest
+
+from python_nano_bench.cpuid.features import Features
+from python_nano_bench.nano_bench import NanoBench
+from python_nano_bench.validate import Validator, split_asm
+
+AVX2 = Features.from_names(["CMOV", "SSE", "SSE2", "SSE3", "SSSE3",
+                            "SSE4.1", "SSE4.2", "AVX", "AVX2", "FMA3"])
+
+
+def test_split():
+    """ labels, directives and prefixes are removed """
+    assert list(split_asm("loop: dec rcx; .align 4\n lock add [rax], rbx")) \
+        == ["dec rcx", "add [rax], rbx"]
+
+
+def test_validator():
+    """ the matching forms decide, not only the mnemonic """
+    v = Validator(AVX2)
+    assert v.supported("vpaddb ymm0, ymm1, ymm2; add rax, rbx")
+    assert not v.supported("vpaddb zmm0, zmm1, zmm2")
+    # same width as AVX2, but masking needs AVX-512
+    assert v.check("vpaddb xmm0{k1}, xmm1, xmm2") == \
+        ["vpaddb xmm0{k1}, xmm1, xmm2 (needs AVX512BW, AVX512VL)"]
+    assert v.supported("vpgatherdd xmm0, [rax+xmm1*4], xmm2")
+    assert v.supported("blendvps xmm1, xmm2, xmm0")
+    # unknown instructions are left to the assembler
+    assert v.supported("not_an_instruction rax")
+    assert v.filter(["shl rax, cl", "vaddps zmm0, zmm1, zmm2",
+                     "loop: dec rcx; jnz loop"]) == [True, False, True]
+    assert not Validator(Features()).supported("vpaddb ymm0, ymm1, ymm2")
+
+
+@pytest.mark.usefixtures("prepared")
+def test_run_many(monkeypatch):
+    """ unsupported snippets are neither assembled nor run """
+    assembled = []
+    monkeypatch.setattr(NanoBench, "assemble_many",
+                        staticmethod(lambda codes, *args, **kwargs:
+                                     assembled.extend(codes)))
+    monkeypatch.setattr(NanoBench, "_run",
+                        lambda self, asm, *args: asm)
+
+    n = NanoBench().validate(AVX2)
+    snippets = ["vpaddb ymm0, ymm1, ymm2", "vpaddb zmm0, zmm1, zmm2", "NOP"]
+    assert list(n.run_many(snippets)) == \
+        ["vpaddb ymm0, ymm1, ymm2", None, "NOP"]
+    assert assembled == ["vpaddb ymm0, ymm1, ymm2", "NOP"]
+    assert n.run("vpaddb zmm0, zmm1, zmm2") is None
+
+
+if __name__ == "__main__":
+    test_split()
+    test_validator()
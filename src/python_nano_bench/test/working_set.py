@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+tests the cache hierarchy model and the working set sweep
+"""
+
+import ctypes
+import pickle
+
+import pytest
+
+from python_nano_bench.cpuid.caches import CacheHierarchy, decode_caches
+from python_nano_bench.cpuid.cpuid import CpuidDump
+from python_nano_bench.nano_bench import NanoBench
+from python_nano_bench.result import BenchResult
+from python_nano_bench.test.native import needs_native, run_init
+from python_nano_bench.working_set import chase_order, latency_sweep, \
+    pointer_chase, strided_walk, working_set_sizes, working_set_sweep
+
+INTEL = (0x756E6547, 0x6C65746E, 0x49656E69)
+
+
+def leaf4(kind, level, sharing, line, ways, sets, inclusive=False):
+    """ :return the registers of a single cache of cpuid leaf 4 """
+    return (kind | level << 5 | (sharing - 1) << 14,
+            (line - 1) | (ways - 1) << 22, sets - 1, int(inclusive) << 1)
+
+
+def skylake() -> CacheHierarchy:
+    """ :return the caches of a Skylake client cpu """
+    return decode_caches(CpuidDump({
+        (0x0, 0): (0x16, *INTEL),
+        (0x4, 0): leaf4(1, 1, 2, 64, 8, 64),
+        (0x4, 1): leaf4(2, 1, 2, 64, 8, 64),
+        (0x4, 2): leaf4(3, 2, 2, 64, 4, 1024),
+        (0x4, 3): leaf4(3, 3, 16, 64, 16, 8192, True),
+        (0x4, 4): (0, 0, 0, 0),
+    }))
+
+
+def test_hierarchy():
+    """ all parameters are decoded from leaf 4 """
+    h = skylake()
+    assert [c.name for c in h] == ["L1D", "L1I", "L2", "L3"]
+    assert h["L1D"].size == 32 * 1024 and h["L1D"].ways == 8
+    assert h["L2"].size == 256 * 1024 and h["L2"].sharing == 2
+    assert h["L3"].size == 8 * 1024 * 1024 and h["L3"].inclusive
+    assert [c.name for c in h.data()] == ["L1D", "L2", "L3"]
+    assert "L4" not in h and h.line_size() == 64
+    assert pickle.loads(pickle.dumps(h)) == h
+
+
+def test_sizes():
+    """ sizes surround every data cache boundary """
+    sizes = working_set_sizes(skylake(), points=(0.5, 2.0),
+                              max_size=1024 * 1024)
+    assert sizes == [16 * 1024, 64 * 1024, 128 * 1024, 512 * 1024]
+    sizes = working_set_sizes(skylake())
+    assert all(s % 64 == 0 for s in sizes) and sizes == sorted(set(sizes))
+    assert any(s < 32 * 1024 < t for s, t in zip(sizes, sizes[1:]))
+
+
+@pytest.mark.usefixtures("skylake")
+def test_sweep(monkeypatch):
+    """ all sizes are measured as one batch with their own init code """
+    batches = []
+
+    def run_many(self, snippets, _kernel=False, _cancel=None):
+        batches.append(list(snippets))
+        return iter(BenchResult(["i"], [i])
+                    for i, _ in enumerate(batches[-1]))
+    monkeypatch.setattr(NanoBench, "run_many", run_many)
+
+    ret = working_set_sweep(NanoBench(), [4096, 8192])
+    assert [(size, r["i"]) for size, r in ret] == [(4096, 0), (8192, 1)]
+    assert batches == [[strided_walk(4096), strided_walk(8192)]]
+    # the default sizes fit into the buffer of the user version
+    monkeypatch.setattr(NanoBench, "USER_R14_SIZE", 256 * 1024)
+    batches.clear()
+    ret = working_set_sweep(NanoBench())
+    assert ret and max(size for size, _ in ret) <= 256 * 1024
+    with pytest.raises(ValueError):
+        working_set_sweep(NanoBench(), [512 * 1024])
+
+    asm, init = strided_walk(4096)
+    assert "[r14 + rbx]" in asm and "cmp rbx, 4096" in asm and "ebx" in init
+
+
+@needs_native
+@pytest.mark.parametrize("size,stride,randomize", [
+    (4096, 64, False), (4096, 64, True), (64 * 1000, 64, True),
+    (3 * 128, 128, True), (64, 64, True)])
+def test_pointer_chase(size, stride, randomize):
+    """ the init code builds a single cycle over all nodes """
+    asm, init = pointer_chase(size, stride, randomize, seed=3)
+    assert asm == "mov rax, qword ptr [rax]"
+    buf = run_init(init, size)
+    base = ctypes.addressof(buf)
+
+    order, p = [0], buf[0]
+    while p != base:
+        order.append((p - base) // stride)
+        p = buf[(p - base) // 8]
+    n = size // stride
+    assert order == chase_order(n, randomize, 3)
+    assert sorted(order) == list(range(n))
+    if randomize and n > 8:
+        assert order != list(range(n))
+
+
+@pytest.mark.usefixtures("skylake")
+def test_latency_sweep(monkeypatch):
+    """ the core cycles of each footprint are reported """
+
+    def run_many(self, snippets, _kernel=False, _cancel=None):
+        for _, init in snippets:
+            yield BenchResult(["Core cycles"], [float(len(init))]) \
+                if "mov r9" in init else None
+    monkeypatch.setattr(NanoBench, "run_many", run_many)
+
+    ret = latency_sweep(NanoBench(), [64, 4096], stride=64)
+    assert ret[0] == (64, None)
+    assert ret[1] == (4096, float(len(pointer_chase(4096)[1])))
+    with pytest.raises(ValueError):
+        pointer_chase(32, 64)
+    # r14 points to the middle of the 1 MB buffer of the user version
+    with pytest.raises(ValueError):
+        latency_sweep(NanoBench(), [768 * 1024])
+
+
+if __name__ == "__main__":
+    test_hierarchy()
+    test_sizes()
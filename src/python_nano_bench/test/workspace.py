@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+tests the scratch directories for temporary files
+"""
+
+import os
+import pickle
+
+from python_nano_bench.workspace import Workspace
+
+
+def test_simple(tmp_path):
+    """ unique names, files are removed, directory is removed on cleanup """
+    w = Workspace(str(tmp_path))
+    assert w.file(".s") != w.file(".s")
+    assert os.path.dirname(w.file()) == w.path
+
+    with w.files(".s", ".o") as (a, b):
+        assert a.endswith(".s") and b.endswith(".o")
+        with open(a, "w", encoding="utf-8") as f:
+            f.write("nop")
+    assert not os.path.exists(a)
+
+    path = w.path
+    w.cleanup()
+    assert not os.path.exists(path)
+    assert w.path != path
+
+
+def test_pickle(tmp_path):
+    """ a pickled workspace uses its own directory """
+    w = Workspace(str(tmp_path))
+    path = w.path
+    w2 = pickle.loads(pickle.dumps(w))
+    assert w2.path != path
+    w2.cleanup()
+    assert os.path.exists(path)
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    with tempfile.TemporaryDirectory() as d:
+        test_simple(Path(d))
+        test_pickle(Path(d))
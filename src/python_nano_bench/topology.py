@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+maps every logical cpu to its core, module, die and package, its SMT
+siblings, the logical cpus sharing each of its caches and its hybrid core
+type. The sysfs topology is preferred, cpuid (leaves 0xB/0x1F, 4 and 0x1A)
+fills in what sysfs does not report.
+"""
+
+import os
+from typing import Dict, Hashable, Iterable, Iterator, List, NamedTuple, \
+    Set, Tuple, Union
+
+from .cpuid.cpuid import _SUBLEAF_LEAVES, CpuidDump, _subleaves, \
+    cpu_vendor, cpuid_table, executor, get_bit, get_bits
+
+SYS_CPU_DIR = "/sys/devices/system/cpu"
+
+# level type of cpuid leaf 0xB/0x1F -> level name
+_LEVEL_TYPES = {1: "thread", 2: "core", 3: "module", 4: "tile", 5: "die"}
+
+# core type of cpuid leaf 0x1A
+_CORE_TYPES = {0x20: "E", 0x40: "P"}
+
+# leaves read on every logical cpu, the subleaves are enumerated. The
+# performance monitoring leaves (0xA, 0x80000001) are included, as the
+# number of counters differs between the core types.
+_TOPOLOGY_LEAVES = (0x1, 0x4, 0x7, 0xA, 0xB, 0x1A, 0x1F, 0x80000001,
+                    0x8000001D)
+
+
+def parse_cpu_list(s: str) -> List[int]:
+    """
+    :param s: cpu list in the sysfs format, e.g. `0-3,8,10-11`
+    :return the sorted list of cpus
+    """
+    ret = []
+    for part in s.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-")
+            ret += range(int(a), int(b) + 1)
+        else:
+            ret.append(int(part))
+    return sorted(ret)
+
+
+def _read(path: str) -> Union[str, None]:
+    """
+    :return the stripped content of `path`, None if it cannot be read
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _read_cpu_list(path: str) -> List[int]:
+    """
+    :param path: sysfs file containing a cpu list
+    :return the cpu list or an empty list if the file does not exist
+    """
+    s = _read(path)
+    return parse_cpu_list(s) if s is not None else []
+
+
+def _read_int(path: str) -> Union[int, None]:
+    """
+    :return the integer in `path`, None if it cannot be read
+    """
+    s = _read(path)
+    try:
+        return int(s) if s is not None else None
+    except ValueError:
+        return None
+
+
+def _shift(n: int) -> int:
+    """ :return the number of bits needed for `n` ids """
+    return max(n - 1, 0).bit_length()
+
+
+class CpuidTopology(NamedTuple):
+    """ the topology of a single logical cpu as reported by cpuid """
+    apic_id: int
+    # level name -> key, equal for all logical cpus in the same group
+    levels: Dict[str, int]
+    # cache name, e.g. `L2`, -> key, equal for all logical cpus sharing it
+    caches: Dict[str, int]
+    # `P` or `E` on hybrid cpus, else empty
+    core_type: str
+
+
+def decode_topology(cpu) -> CpuidTopology:
+    """
+    :param cpu: `CPUID` instance or table of the logical cpu to decode
+    :return the apic id decoded into the ids of all topology levels
+    """
+    max_leaf = cpu(0)[0]
+    leaf = None
+    for candidate in (0x1F, 0xB):
+        if max_leaf >= candidate and cpu(candidate, 0)[1] != 0:
+            leaf = candidate
+            break
+
+    # level name -> number of apic id bits of this and all lower levels
+    shifts: Dict[str, int] = {}
+    if leaf is not None:
+        apic_id = cpu(leaf, 0)[3]
+        for subleaf in range(64):
+            a, _, c, _ = cpu(leaf, subleaf)
+            level_type = get_bits(c, 8, 15)
+            if level_type == 0:
+                break
+            if level_type in _LEVEL_TYPES:
+                shifts[_LEVEL_TYPES[level_type]] = get_bits(a, 0, 4)
+    else:
+        # legacy: 8 bit apic id and the number of ids per package
+        _, b, _, d = cpu(0x1)
+        apic_id = get_bits(b, 24, 31)
+        shifts["die"] = _shift(get_bits(b, 16, 23)) if get_bit(d, 28) else 0
+
+    # a level which is not enumerated is equal to the level below
+    levels = {"thread": apic_id}
+    shift, below = 0, "thread"
+    for name in ("core", "module", "tile", "die", "package"):
+        shift = max(shift, shifts.get(below, 0))
+        levels[name] = apic_id >> shift
+        below = name
+
+    caches: Dict[str, int] = {}
+    cache_leaf = 0x8000001D if cpu_vendor(cpu) == "AuthenticAMD" else 0x4
+    if cache_leaf == 0x4 and max_leaf < 0x4:
+        cache_leaf = None
+    for subleaf in range(64 if cache_leaf is not None else 0):
+        a = cpu(cache_leaf, subleaf)[0]
+        cache_type = get_bits(a, 0, 4)
+        if cache_type == 0:
+            break
+        name = f"L{get_bits(a, 5, 7)}" + {1: "D", 2: "I"}.get(cache_type, "")
+        caches[name] = apic_id >> _shift(get_bits(a, 14, 25) + 1)
+
+    core_type = ""
+    if max_leaf >= 0x1A and get_bit(cpu(0x7)[3], 15):
+        core_type = _CORE_TYPES.get(get_bits(cpu(0x1A)[0], 24, 31), "")
+    return CpuidTopology(apic_id, levels, caches, core_type)
+
+
+def read_cpuid(cpu: int) -> Union[CpuidDump, None]:
+    """
+    reads the topology and performance monitoring leaves on the logical cpu
+    `cpu`. The calling thread is pinned to `cpu` for the time of the reads.
+    :param cpu: logical cpu
+    :return the table or None if the thread cannot run on `cpu`
+    """
+    try:
+        prev = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, {cpu})
+    except (OSError, AttributeError):
+        return None
+    try:
+        x = executor()
+        regs = {(0x0, 0): x(0x0), (0x80000000, 0): x(0x80000000)}
+        for leaf in _TOPOLOGY_LEAVES:
+            highest = regs[(leaf & 0x80000000, 0)][0]
+            if leaf > highest:
+                continue
+            if leaf in _SUBLEAF_LEAVES:
+                for subleaf, values in _subleaves(x, leaf):
+                    regs[(leaf, subleaf)] = values
+            else:
+                regs[(leaf, 0)] = x(leaf)
+        return CpuidDump(regs)
+    finally:
+        os.sched_setaffinity(0, prev)
+
+
+class LogicalCpu(NamedTuple):
+    """
+    the topology of a single logical cpu. Each group (core, module, die,
+    package) is identified by its lowest logical cpu.
+    """
+    cpu: int
+    core: int
+    module: int
+    die: int
+    package: int
+    # logical cpus on the same core, including `cpu`
+    siblings: Tuple[int, ...]
+    # cache name, e.g. `L2`, -> logical cpus sharing it, including `cpu`
+    caches: Dict[str, Tuple[int, ...]]
+    # `P` or `E` on hybrid cpus, else empty
+    core_type: str
+    # None if cpuid was not read
+    apic_id: Union[int, None]
+
+
+class Topology:
+    """
+    the topology of all online logical cpus, see `topology()`.
+    """
+
+    def __init__(self, cpus: Iterable[LogicalCpu]):
+        """
+        :param cpus: all logical cpus
+        """
+        self.cpus: Dict[int, LogicalCpu] = {c.cpu: c for c in cpus}
+
+    def __getitem__(self, cpu: int) -> LogicalCpu:
+        return self.cpus[cpu]
+
+    def __iter__(self) -> Iterator[LogicalCpu]:
+        return iter(self.cpus[cpu] for cpu in sorted(self.cpus))
+
+    def __len__(self) -> int:
+        return len(self.cpus)
+
+    def siblings(self, cpu: int) -> Tuple[int, ...]:
+        """ :return the logical cpus on the same core as `cpu` """
+        return self.cpus[cpu].siblings
+
+    def sharing(self, cpu: int, cache: str) -> Tuple[int, ...]:
+        """
+        :param cpu: logical cpu
+        :param cache: e.g. `L1D` or `L2`
+        :return the logical cpus sharing `cache` with `cpu`
+        """
+        return self.cpus[cpu].caches.get(cache, (cpu,))
+
+    def neighbours(self, cpu: int, caches: Iterable[str] = ()) -> Set[int]:
+        """
+        :param cpu: logical cpu
+        :param caches: names of the caches, which must not be shared
+        :return all logical cpus sharing the core or one of `caches` with
+            `cpu`, including `cpu`
+        """
+        ret = set(self.siblings(cpu))
+        for cache in caches:
+            ret.update(self.sharing(cpu, cache))
+        return ret
+
+    def cores(self) -> List[Tuple[int, ...]]:
+        """ :return the SMT siblings of every core """
+        return sorted({c.siblings for c in self})
+
+    def packages(self) -> List[int]:
+        """ :return the id of every package """
+        return sorted({c.package for c in self})
+
+    def of_type(self, core_type: str) -> List[int]:
+        """
+        :param core_type: `P` or `E`
+        :return all logical cpus of that core type
+        """
+        return [c.cpu for c in self if c.core_type == core_type]
+
+    def is_hybrid(self) -> bool:
+        """ :return true if the cpu has different core types """
+        return len({c.core_type for c in self}) > 1
+
+    def one_per_core(self, allowed: Union[Set[int], None] = None,
+                     caches: Iterable[str] = ()) -> List[int]:
+        """
+        selects one logical cpu per physical core, hence no two selected cpus
+        are SMT siblings.
+        :param allowed: cpus which may be selected, defaults to all
+        :param caches: names of caches, which no two selected cpus share
+        :return sorted list of logical cpus
+        """
+        caches = list(caches)
+        ret = []
+        taken: Set[int] = set()
+        for c in self:
+            if (allowed is not None and c.cpu not in allowed) or \
+                    c.cpu in taken:
+                continue
+            ret.append(c.cpu)
+            taken.update(self.neighbours(c.cpu, caches))
+        return ret
+
+
+def _sysfs_caches(cpu: int, sys_dir: str) -> Dict[str, Tuple[int, ...]]:
+    """
+    :return cache name -> logical cpus sharing it, from sysfs
+    """
+    ret: Dict[str, Tuple[int, ...]] = {}
+    cache_dir = os.path.join(sys_dir, f"cpu{cpu}", "cache")
+    if not os.path.isdir(cache_dir):
+        return ret
+    for index in sorted(os.listdir(cache_dir)):
+        path = os.path.join(cache_dir, index)
+        level = _read_int(os.path.join(path, "level"))
+        shared = _read_cpu_list(os.path.join(path, "shared_cpu_list"))
+        if level is None or not shared:
+            continue
+        kind = {"Data": "D", "Instruction": "I"}.get(
+            _read(os.path.join(path, "type")) or "", "")
+        ret[f"L{level}{kind}"] = tuple(shared)
+    return ret
+
+
+def _sysfs_core_types(sys_dir: str) -> Dict[int, str]:
+    """
+    :return logical cpu -> core type from the hybrid pmu devices
+    """
+    devices = os.path.dirname(os.path.dirname(os.path.abspath(sys_dir)))
+    ret = {}
+    for pmu, core_type in (("cpu_core", "P"), ("cpu_atom", "E")):
+        for cpu in _read_cpu_list(os.path.join(devices, pmu, "cpus")):
+            ret[cpu] = core_type
+    return ret
+
+
+def _group(keys: Dict[int, Hashable]) -> Dict[int, Tuple[int, ...]]:
+    """
+    :param keys: logical cpu -> key
+    :return logical cpu -> all logical cpus with the same key
+    """
+    groups: Dict[Hashable, List[int]] = {}
+    for cpu in sorted(keys):
+        groups.setdefault(keys[cpu], []).append(cpu)
+    return {cpu: tuple(groups[key]) for cpu, key in keys.items()}
+
+
+def topology(sys_dir: str = SYS_CPU_DIR, use_cpuid: bool = True,
+             cpus: Union[Iterable[int], None] = None) -> Topology:
+    """
+    :param sys_dir: the sysfs cpu directory
+    :param use_cpuid: if true, cpuid is read on every logical cpu, which
+        pins the calling thread to each of them in turn.
+    :param cpus: the logical cpus to map. Defaults to all online cpus or
+        the affinity of the current process if sysfs is not available.
+    :return the topology of `cpus`
+    """
+    if cpus is None:
+        cpus = _read_cpu_list(os.path.join(sys_dir, "online")) or \
+            sorted(os.sched_getaffinity(0))
+    cpus = sorted(cpus)
+
+    decoded: Dict[int, CpuidTopology] = {}
+    if use_cpuid:
+        for cpu in cpus:
+            table = read_cpuid(cpu)
+            if table is not None:
+                decoded[cpu] = decode_topology(table)
+
+    def keys(level: str, sysfs: List[str]) -> Dict[int, Hashable]:
+        """ the sysfs ids are preferred, cpuid fills in missing cpus """
+        ret: Dict[int, Hashable] = {}
+        for cpu in cpus:
+            ids = [_read_int(os.path.join(sys_dir, f"cpu{cpu}", "topology",
+                                          name)) for name in sysfs]
+            if None not in ids:
+                ret[cpu] = ("sysfs", *ids)
+            elif cpu in decoded:
+                ret[cpu] = ("cpuid", decoded[cpu].levels[level])
+            else:
+                ret[cpu] = ("cpu", cpu)
+        return ret
+
+    package = _group(keys("package", ["physical_package_id"]))
+    die = _group(keys("die", ["physical_package_id", "die_id"]))
+    module = _group(keys("module", ["physical_package_id", "die_id",
+                                    "cluster_id"]))
+
+    siblings = {}
+    for cpu, group in _group(keys("core", ["physical_package_id", "die_id",
+                                           "core_id"])).items():
+        siblings[cpu] = tuple(_read_cpu_list(os.path.join(
+            sys_dir, f"cpu{cpu}", "topology", "thread_siblings_list"))) or \
+            group
+
+    # caches reported by cpuid are grouped over all cpus with the same key
+    cpuid_caches: Dict[str, Dict[int, Tuple[int, ...]]] = {}
+    for name in {n for t in decoded.values() for n in t.caches}:
+        cpuid_caches[name] = _group({cpu: t.caches[name]
+                                     for cpu, t in decoded.items()
+                                     if name in t.caches})
+
+    core_types = _sysfs_core_types(sys_dir)
+    ret = []
+    for cpu in cpus:
+        caches = _sysfs_caches(cpu, sys_dir)
+        if not caches:
+            caches = {name: groups[cpu] for name, groups in
+                      cpuid_caches.items() if cpu in groups}
+        core_type = core_types.get(cpu)
+        if core_type is None:
+            core_type = decoded[cpu].core_type if cpu in decoded else ""
+        ret.append(LogicalCpu(
+            cpu, min(siblings[cpu]), module[cpu][0], die[cpu][0],
+            package[cpu][0], siblings[cpu], caches, core_type,
+            decoded[cpu].apic_id if cpu in decoded else None))
+    return Topology(ret)
+
+
+def is_hybrid(cpu=None) -> bool:
+    """
+    :param cpu: `CPUID` instance or table, defaults to `cpuid_table()`
+    :return true if the cpu has performance and efficiency cores. Unlike
+        `Topology.is_hybrid()` this does not read every logical cpu.
+    """
+    if cpu is None:
+        cpu = cpuid_table()
+    return cpu(0)[0] >= 0x7 and bool(get_bit(cpu(0x7)[3], 15))
+
+
+# the topology of the current process, discovered on first use
+_system_topology: Union[Topology, None] = None
+
+
+def system_topology() -> Topology:
+    """
+    :return the process wide `topology()` of all online cpus
+    """
+    global _system_topology
+    if _system_topology is None:
+        _system_topology = topology()
+    return _system_topology
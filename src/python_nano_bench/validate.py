@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+checks before assembling if every instruction of a snippet is supported by
+the cpu, so unsupported snippets (e.g. AVX-512 on a client core) are
+skipped instead of crashing the measurement.
+"""
+
+import re
+from typing import Dict, Iterable, List, Tuple, Union
+
+from .asm import Asm
+from .cpuid.features import Features, features
+from .isa_index import FormIndex, form_index
+
+# prefixes, which are not part of the mnemonic
+PREFIXES = {"lock", "rep", "repe", "repz", "repne", "repnz", "{vex}",
+            "{vex3}", "{evex}", "data16", "addr32"}
+
+_MASK = re.compile(r"\s*\{[^}]*\}")
+_VEC_INDEX = re.compile(r"[xyz]mm\d+")
+
+
+def operand_kind(operand: str) -> Tuple[str, bool]:
+    """
+    :param operand: a concrete operand in intel syntax
+    :return (kind, masked). The kind is one of `r`, `xmm`, `ymm`, `zmm`,
+        `k`, `mm`, `m`, `vm`, `imm` and `er`. Masked is true if the operand
+        uses an AVX-512 write mask.
+    """
+    op = operand.strip().lower()
+    if op.startswith("{"):
+        return "er", False
+    masked = "{k" in op
+    base = _MASK.sub("", op).strip()
+
+    if "[" in base:
+        index = base[base.index("["):]
+        return ("vm" if _VEC_INDEX.search(index) else "m"), masked
+
+    reg = Asm.register(base)
+    if reg is not None:
+        return ("r" if reg[0] == "gpr" else reg[2]), masked
+    if base in ("ah", "bh", "ch", "dh"):
+        return "r", masked
+    if re.fullmatch(r"k[0-7]", base):
+        return "k", masked
+    if re.fullmatch(r"mm[0-7]", base):
+        return "mm", masked
+    return "imm", masked
+
+
+def form_kind(type_: str) -> Tuple[str, bool]:
+    """
+    :param type_: operand type of the `opcodes` package, e.g. `xmm{k}{z}`
+    :return (kind, maskable), see `operand_kind()`
+    """
+    if type_ in ("{er}", "{sae}"):
+        return "er", False
+    maskable = "{k}" in type_
+    base = type_.split("{")[0].split("/")[0]
+    if base in ("r8", "r16", "r32", "r64", "al", "ax", "eax", "rax", "cl"):
+        return "r", maskable
+    if base in ("xmm", "xmm0", "ymm", "zmm", "k", "mm"):
+        return ("xmm" if base == "xmm0" else base), maskable
+    if base.startswith("vm"):
+        return "vm", maskable
+    if base.startswith("m"):
+        return "m", maskable
+    return "imm", maskable
+
+
+def split_asm(asm: str) -> Iterable[str]:
+    """
+    :param asm: assembly string, instructions separated by `;` or newlines
+    :return all instructions without labels, directives and prefixes
+    """
+    for line in re.split(r"[;\n]", asm):
+        line = line.strip()
+        # labels, e.g. `loop:` or `1:`
+        if re.match(r"^[\w.]+:", line):
+            line = line[line.index(":") + 1:].strip()
+        if not line or line.startswith(".") or line.startswith("#"):
+            continue
+        words = line.split(None, 1)
+        while words and words[0].lower() in PREFIXES:
+            words = words[1].split(None, 1) if len(words) > 1 else []
+        if words:
+            yield " ".join(words)
+
+
+class Validator:
+    """
+    maps every instruction of a snippet to the isa extensions of its
+    matching forms (see `FormIndex`) and checks them against the cpu
+    features (see `Features`). Results are cached per mnemonic and operand
+    kinds, so large batches are checked quickly.
+    """
+
+    def __init__(self, cpu_features: Union[Features, None] = None,
+                 index: Union[FormIndex, None] = None):
+        """
+        :param cpu_features: defaults to the features of the local cpu
+        :param index: defaults to `form_index()`
+        """
+        self.features = cpu_features if cpu_features is not None \
+            else features()
+        self.index = index if index is not None else form_index()
+        # (mnemonic, operand kinds) -> missing extensions, None if unknown
+        self._cache: Dict[Tuple, Union[Tuple[str, ...], None]] = {}
+
+    def missing(self, instr: str) -> Union[Tuple[str, ...], None]:
+        """
+        :param instr: a single instruction, e.g. `vpaddb zmm0, zmm1, zmm2`
+        :return the isa extensions missing for the cheapest matching form,
+            an empty tuple if the instruction is supported and None if no
+            form matches (e.g. an unknown mnemonic).
+        """
+        mnemonic, ops = Asm.split_instruction(instr)
+        kinds = tuple(operand_kind(o) for o in ops)
+        key = (mnemonic.upper(), kinds)
+        if key in self._cache:
+            return self._cache[key]
+
+        ret = None
+        for form in self.index.forms(mnemonic):
+            fkinds = [form_kind(t) for t in form.operands]
+            # the rounding control is optional, e.g. `vaddps zmm, zmm, zmm`
+            # only exists as `vaddps zmm, zmm, zmm, {er}`
+            if fkinds and fkinds[-1][0] == "er" and \
+                    len(fkinds) == len(kinds) + 1:
+                fkinds.pop()
+            if len(fkinds) != len(kinds):
+                continue
+            if any(k != fk or (masked and not maskable)
+                   for (k, masked), (fk, maskable) in zip(kinds, fkinds)):
+                continue
+            missing = tuple(e for e in form.isa_extensions
+                            if e not in self.features)
+            if ret is None or len(missing) < len(ret):
+                ret = missing
+            if not ret:
+                break
+        self._cache[key] = ret
+        return ret
+
+    def check(self, asm: str) -> List[str]:
+        """
+        :param asm: assembly string
+        :return a message for each unsupported instruction, empty if the
+            snippet is supported.
+        """
+        ret = []
+        for instr in split_asm(asm):
+            missing = self.missing(instr)
+            if missing:
+                ret.append(f"{instr} (needs {', '.join(missing)})")
+        return ret
+
+    def supported(self, asm: str) -> bool:
+        """
+        :param asm: assembly string
+        :return true if no instruction of `asm` needs a missing extension
+        """
+        return all(not self.missing(instr) for instr in split_asm(asm))
+
+    def filter(self, snippets: Iterable[str]) -> List[bool]:
+        """
+        :param snippets: iterable of assembly strings
+        :return for each snippet if it is supported
+        """
+        return [self.supported(asm) for asm in snippets]
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+memory working set sweeps. The buffer sizes are chosen around the capacity
+of every data cache (see `CacheHierarchy`), so the runs are spent where the
+measured values change instead of on hand picked sizes. `latency_sweep()`
+measures the load to use latency of a pointer chase over all sizes.
+"""
+
+import random
+import threading
+from typing import Callable, Iterable, List, Tuple, Union
+
+from .cpuid.caches import CacheHierarchy, cache_hierarchy
+from .nano_bench import NanoBench
+from .result import BenchResult
+
+# fractions of each cache capacity which are measured
+POINTS = (0.5, 0.75, 0.9, 1.1, 1.25, 1.5, 2.0)
+
+
+def working_set_sizes(hierarchy: Union[CacheHierarchy, None] = None,
+                      points: Iterable[float] = POINTS,
+                      min_size: int = 0,
+                      max_size: Union[int, None] = None) -> List[int]:
+    """
+    :param hierarchy: defaults to `cache_hierarchy()`
+    :param points: fractions of each data cache capacity
+    :param min_size: smaller sizes are dropped
+    :param max_size: larger sizes are dropped, e.g. the size of the buffer
+        r14 points to
+    :return sorted buffer sizes in bytes, multiples of the line size
+    """
+    if hierarchy is None:
+        hierarchy = cache_hierarchy()
+    line = hierarchy.line_size()
+    sizes = set()
+    for cache in hierarchy.data():
+        for p in points:
+            size = max(round(cache.size * p / line), 1) * line
+            if size >= min_size and (max_size is None or size <= max_size):
+                sizes.add(size)
+    return sorted(sizes)
+
+
+def strided_walk(size: int, stride: int = 64) -> Tuple[str, str]:
+    """
+    :param size: size of the walked buffer in bytes, starting at r14
+    :param stride: distance of two loads in bytes, usually the line size
+    :return (assembly string, init code). Each repetition loads the next
+        line and wraps around at the end of the buffer.
+    """
+    asm = (f"mov rax, qword ptr [r14 + rbx]; add rbx, {stride}; "
+           f"cmp rbx, {size}; cmovae rbx, rcx")
+    return asm, "xor ebx, ebx; xor ecx, ecx"
+
+
+def working_set_sweep(nb: NanoBench,
+                      sizes: Union[Iterable[int], None] = None,
+                      snippet: Callable[[int], Tuple[str, str]] =
+                      strided_walk,
+                      kernel: bool = False,
+                      cancel: Union[threading.Event, None] = None
+                      ) -> List[Tuple[int, Union[BenchResult, None]]]:
+    """
+    measures one snippet per buffer size as a single batch, see
+    `NanoBench.run_many()`.
+    :param nb: the benchmark options
+    :param sizes: buffer sizes in bytes, defaults to `working_set_sizes()`
+        up to the size of the buffer r14 points to (see
+        `NanoBench.r14_size()`). Raises `ValueError` if a size does not
+        fit into it.
+    :param snippet: returns (assembly string, init code) for a size
+    :param kernel: see `NanoBench.run()`
+    :param cancel: see `NanoBench.run()`
+    :return (size, result) for every size
+    """
+    max_size = nb.r14_size(kernel)
+    if sizes is None:
+        sizes = working_set_sizes(max_size=max_size)
+    sizes = list(sizes)
+    for size in sizes:
+        if size > max_size:
+            raise ValueError(f"{size} bytes do not fit into the "
+                             f"{max_size} bytes r14 points to")
+    results = nb.run_many([snippet(size) for size in sizes], kernel, cancel)
+    return list(zip(sizes, results))
+
+
+def _lcg(n: int, seed: int) -> Tuple[int, int, int]:
+    """
+    :param n: number of nodes
+    :param seed: selects the permutation
+    :return (modulus, multiplier, increment) of a full period linear
+        congruential generator, which visits every node below `n` once
+        when values >= `n` are skipped.
+    """
+    m = max(1 << (n - 1).bit_length(), 4)
+    rng = random.Random(seed)
+    return m, 4 * rng.randrange(m // 4) + 1, 2 * rng.randrange(m // 2) + 1
+
+
+def chase_order(n: int, randomize: bool = True, seed: int = 0) -> List[int]:
+    """
+    :param n: number of nodes
+    :param randomize: see `pointer_chase()`
+    :param seed: see `pointer_chase()`
+    :return the nodes in the order the chain of `pointer_chase()` visits
+        them, starting with node 0
+    """
+    if not randomize or n < 2:
+        return list(range(n))
+    m, a, c = _lcg(n, seed)
+    ret, x = [0], 0
+    while len(ret) < n:
+        x = (a * x + c) % m
+        if x < n:
+            ret.append(x)
+    return ret
+
+
+def pointer_chase(size: int, stride: int = 64, randomize: bool = True,
+                  seed: int = 0) -> Tuple[str, str]:
+    """
+    builds a cyclic chain of pointers, one per `stride` bytes of the first
+    `size` bytes of the buffer r14 points to. The chain is written by the
+    init code, so the snippet stays small for any footprint.
+    :param size: footprint of the chain in bytes
+    :param stride: distance of two nodes in bytes, at least 8
+    :param randomize: if true, the nodes are visited in a pseudo random
+        order (see `chase_order()`), which defeats the prefetchers.
+        Otherwise they are visited in address order.
+    :param seed: selects the random order
+    :return (assembly string, init code). Each repetition is one dependent
+        load (`mov rax, [rax]`), so the cycles per repetition are the load
+        to use latency.
+    """
+    if stride < 8 or stride % 8:
+        raise ValueError("the stride must be a multiple of 8")
+    n = size // stride
+    if n < 1:
+        raise ValueError("the footprint is smaller than the stride")
+
+    if not randomize or n < 2:
+        init = (f"mov rcx, r14; lea rdx, [r14 + {n * stride}]; "
+                f"2: lea rax, [rcx + {stride}]; cmp rax, rdx; "
+                f"cmovae rax, r14; mov [rcx], rax; mov rcx, rax; "
+                f"cmp rcx, r14; jne 2b; ")
+    else:
+        m, a, c = _lcg(n, seed)
+        # rdi: generator state, rsi: previous node, r9: nodes left
+        init = (f"xor edi, edi; xor esi, esi; mov r9, {n - 1}; "
+                f"2: imul rdi, rdi, {a}; add rdi, {c}; "
+                f"and rdi, {m - 1}; cmp rdi, {n}; jae 2b; "
+                f"mov rax, rdi; imul rax, rax, {stride}; add rax, r14; "
+                f"mov rcx, rsi; imul rcx, rcx, {stride}; "
+                f"mov [r14 + rcx], rax; mov rsi, rdi; dec r9; jnz 2b; "
+                f"imul rsi, rsi, {stride}; mov [r14 + rsi], r14; ")
+    return "mov rax, qword ptr [rax]", init + "mov rax, r14"
+
+
+def latency_sweep(nb: NanoBench,
+                  sizes: Union[Iterable[int], None] = None,
+                  stride: Union[int, None] = None,
+                  randomize: bool = True, seed: int = 0,
+                  kernel: bool = False,
+                  cancel: Union[threading.Event, None] = None
+                  ) -> List[Tuple[int, Union[float, None]]]:
+    """
+    measures the load to use latency of a pointer chase (see
+    `pointer_chase()`) for every footprint as one batch.
+    :param nb: the benchmark options
+    :param sizes: footprints in bytes, see `working_set_sweep()`
+    :param stride: defaults to the line size
+    :param randomize: see `pointer_chase()`
+    :param seed: see `pointer_chase()`
+    :param kernel: see `NanoBench.run()`
+    :param cancel: see `NanoBench.run()`
+    :return (size, core cycles per load) for every size, None on error
+    """
+    if stride is None:
+        stride = cache_hierarchy().line_size()
+
+    ret = working_set_sweep(
+        nb, sizes, lambda size: pointer_chase(size, stride, randomize, seed),
+        kernel, cancel)
+    return [(size, r.get("Core cycles") if r is not None else None)
+            for size, r in ret]
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+private scratch directories for temporary files, e.g. assembly and object
+files.
+"""
+
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+
+def _cleanup(path: str, pid: int):
+    """
+    removes `path`, but only from the process which created it. Forked
+    children inherit the finalizer, but must not remove the directory of
+    their parent.
+    """
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class Workspace:
+    """
+    unique scratch directory, which is preferably placed on a tmpfs. Every
+    process gets its own directory and every file name handed out is unique,
+    so a workspace can be used from many threads and (forked or pickled)
+    worker processes at once. The directory is removed on `cleanup()`, when
+    the workspace is garbage collected or at exit.
+
+    NOTE: `memfd_create` is not used, because `as` and `objcopy` need real
+    paths.
+    """
+
+    # tried in this order, the first existing and writable one is used
+    BASES = ["/tmp/ramdisk", "/dev/shm"]
+
+    def __init__(self, base: Union[str, None] = None):
+        """
+        :param base: directory in which the workspace is created. Defaults
+            to the first usable entry of `BASES` or the system temp dir.
+        """
+        self._base = base
+        self._path: Union[str, None] = None
+        self._pid = -1
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._finalizer = None
+
+    def __getstate__(self):
+        # a pickled workspace creates its own directory on first use
+        state = self.__dict__.copy()
+        state["_path"] = None
+        state["_finalizer"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_base() -> str:
+        """
+        :return the directory in which workspaces are created by default
+        """
+        for base in Workspace.BASES:
+            if os.path.isdir(base) and os.access(base, os.W_OK | os.X_OK):
+                return base
+        return tempfile.gettempdir()
+
+    @property
+    def path(self) -> str:
+        """ :return the directory of the current process """
+        with self._lock:
+            if self._path is None or self._pid != os.getpid():
+                base = self._base if self._base else Workspace.default_base()
+                self._path = tempfile.mkdtemp(prefix="nano_bench_", dir=base)
+                self._pid = os.getpid()
+                self._finalizer = weakref.finalize(self, _cleanup,
+                                                   self._path, self._pid)
+            return self._path
+
+    def file(self, suffix: str = "") -> str:
+        """
+        :param suffix: appended to the file name, e.g. `.s`
+        :return a unique path within the workspace. The file is not created.
+        """
+        return os.path.join(self.path, f"{next(self._counter)}{suffix}")
+
+    @contextmanager
+    def files(self, *suffixes: str) -> Iterator[list]:
+        """
+        yields one unique path per suffix and removes the files afterwards.
+        :param suffixes: see `file()`
+        """
+        paths = [self.file(suffix) for suffix in suffixes]
+        try:
+            yield paths
+        finally:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def cleanup(self):
+        """ removes the directory of the current process """
+        with self._lock:
+            if self._finalizer is not None:
+                self._finalizer()
+            self._path = None
+            self._finalizer = None
+
+
+# process wide workspace used by the static helpers of `NanoBench`
+_default_workspace: Union[Workspace, None] = None
+
+
+def default_workspace() -> Workspace:
+    """
+    :return the process wide workspace
+    """
+    global _default_workspace
+    if _default_workspace is None:
+        _default_workspace = Workspace()
+    return _default_workspace